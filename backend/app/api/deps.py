@@ -1,4 +1,5 @@
 """API dependencies for authentication, database, etc."""
+import ipaddress
 from typing import Optional
 from uuid import UUID
 
@@ -9,7 +10,7 @@ from sqlalchemy import select
 
 from app.database import get_db
 from app.models.user import User
-from app.models.audit import AuditLog
+from app.models.audit_log import AuditLog
 from app.core.security import verify_token
 
 
@@ -73,6 +74,46 @@ async def get_current_user(
     return user
 
 
+async def get_token_claims(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+) -> dict:
+    """Validated access-token claims, without a database lookup."""
+    payload = verify_token(credentials.credentials, token_type="access") if credentials else None
+    if not payload or not payload.get("sub"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return payload
+
+
+async def get_token_user_id(claims: dict = Depends(get_token_claims)) -> UUID:
+    """Authenticate from the access token alone, without a database lookup.
+
+    For hot, non-sensitive read paths such as typeahead where a user row is
+    not needed; account status is not re-checked until the token expires.
+    """
+    return UUID(claims["sub"])
+
+
+def require_scope(scope: str):
+    """Dependency requiring ``scope`` among the access token's space-separated ``scope`` claim.
+
+    Staff tooling is granted scopes such as ``audit:read`` or ``ops:read``
+    when its tokens are issued; patient tokens carry none.
+    """
+    async def check(claims: dict = Depends(get_token_claims)) -> dict:
+        if scope not in str(claims.get("scope", "")).split():
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Insufficient scope"
+            )
+        return claims
+
+    return check
+
+
 async def get_current_active_user(
     current_user: User = Depends(get_current_user)
 ) -> User:
@@ -99,6 +140,22 @@ async def get_optional_user(
         return None
 
 
+def client_ip(request: Request) -> Optional[str]:
+    """The caller's address for ``audit_logs.ip_address``, or None if it is not a valid IP."""
+    ip_address = request.client.host if request.client else None
+
+    # Get forwarded IP if behind proxy
+    forwarded_for = request.headers.get("X-Forwarded-For")
+    if forwarded_for:
+        ip_address = forwarded_for.split(",")[0].strip()
+
+    # The column is inet, and the forwarded header is whatever the client sent
+    try:
+        return str(ipaddress.ip_address(ip_address)) if ip_address else None
+    except ValueError:
+        return None
+
+
 class AuditLogger:
     """Dependency for audit logging."""
 
@@ -120,23 +177,13 @@ class AuditLogger:
         details: Optional[dict] = None
     ) -> None:
         """Log an audit event."""
-        # Get client IP
-        ip_address = self.request.client.host if self.request.client else None
-
-        # Get forwarded IP if behind proxy
-        forwarded_for = self.request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            ip_address = forwarded_for.split(",")[0].strip()
-
-        user_agent = self.request.headers.get("User-Agent")
-
         audit_log = AuditLog(
             user_id=self.user.id if self.user else None,
             action=action,
             resource_type=resource_type,
             resource_id=resource_id,
-            ip_address=ip_address,
-            user_agent=user_agent,
+            ip_address=client_ip(self.request),
+            user_agent=self.request.headers.get("User-Agent"),
             details=details
         )
 
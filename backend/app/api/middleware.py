@@ -0,0 +1,59 @@
+"""ASGI middleware."""
+from http.cookies import SimpleCookie
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import get_settings
+from app.database import ReplicaSet, replicas
+
+settings = get_settings()
+
+_READ_ONLY_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# Sent when the primary's position cannot be read: every replica falls short
+# of it, so the client reads from the primary until the cookie expires
+_UNKNOWN_LSN = (1 << 64) - 1
+
+
+class ReadYourWritesMiddleware:
+    """Give the client the primary's WAL position after each successful write.
+
+    ``get_read_db`` only uses replicas that have replayed that far, so a
+    client always reads its own writes. Read-only requests pass straight
+    through, and nothing is done without replicas configured.
+    """
+
+    def __init__(self, app: ASGIApp, replica_set: Optional[ReplicaSet] = None):
+        self.app = app
+        self.replicas = replica_set or replicas
+
+    async def _cookie(self) -> str:
+        try:
+            lsn = await self.replicas.primary_lsn()
+        except Exception:
+            lsn = _UNKNOWN_LSN
+        cookie: SimpleCookie = SimpleCookie()
+        name = settings.replica_lsn_cookie
+        cookie[name] = f"{lsn:x}"
+        cookie[name]["max-age"] = self.replicas.read_after_seconds
+        cookie[name]["path"] = "/"
+        cookie[name]["httponly"] = True
+        cookie[name]["samesite"] = "lax"
+        if not settings.debug:
+            cookie[name]["secure"] = True
+        return cookie.output(header="").strip()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in _READ_ONLY_METHODS or not self.replicas.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_position(message: Message) -> None:
+            # The handler has committed by the time its response starts
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                MutableHeaders(scope=message).append("set-cookie", await self._cookie())
+            await send(message)
+
+        await self.app(scope, receive, send_with_position)
@@ -0,0 +1,155 @@
+"""HTTP Range / conditional responses for encrypted blobs."""
+import hashlib
+import logging
+import re
+from typing import AsyncIterator, Callable, Optional, Tuple
+from urllib.parse import quote
+
+from botocore.exceptions import ClientError
+from fastapi import HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse
+
+from app.services.object_storage import ObjectStorage
+
+logger = logging.getLogger(__name__)
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def blob_etag(resource_id: object, storage_key: str) -> str:
+    """Strong ETag for an immutable blob; computed without touching storage."""
+    digest = hashlib.sha256(f"{resource_id}:{storage_key}".encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into inclusive bounds.
+
+    Returns None to serve the whole body (no header, or multiple ranges)
+    and raises ValueError when the range cannot be satisfied.
+    """
+    if not header or "," in header:
+        return None
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Weak comparison against If-None-Match, as RFC 9110 specifies for it."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+
+async def _started(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Pull the first chunk now, so storage and key errors surface before any header is sent.
+
+    Returns an iterator over the whole body. A missing object raises a 404;
+    any other failure to read or decrypt raises a 500.
+    """
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except ClientError as exc:
+        if exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 404:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stored file not found")
+        logger.exception("stored file unreadable")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Stored file could not be read")
+    except Exception:
+        logger.exception("stored file unreadable")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Stored file could not be read")
+
+    async def body() -> AsyncIterator[bytes]:
+        if first is None:
+            return
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return body()
+
+
+async def ranged_response(
+    request: Request,
+    size: int,
+    etag: str,
+    media_type: str,
+    read: Callable[[int, int], AsyncIterator[bytes]],
+    filename: Optional[str] = None,
+    disposition: str = "inline"
+) -> Response:
+    """Serve ``size`` bytes from ``read(start, end)`` honouring If-None-Match, Range and If-Range."""
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=0, must-revalidate",
+    }
+    if filename:
+        headers["Content-Disposition"] = f"{disposition}; filename*=UTF-8''{quote(filename)}"
+
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range.strip() != etag:
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers=headers)
+
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, status.HTTP_200_OK
+    else:
+        (start, end), status_code = byte_range, status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(max(end - start + 1, 0))
+
+    return StreamingResponse(
+        await _started(read(start, end)),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers,
+    )
+
+
+async def encrypted_blob_response(
+    request: Request,
+    storage: ObjectStorage,
+    storage_key: str,
+    size: int,
+    etag: str,
+    media_type: str,
+    filename: Optional[str] = None,
+    owner_key: Optional[bytes] = None
+) -> Response:
+    """Serve an encrypted blob honouring If-None-Match, Range and If-Range."""
+    return await ranged_response(
+        request,
+        size,
+        etag,
+        media_type,
+        lambda start, end: storage.read_decrypted(storage_key, size, start, end, owner_key=owner_key),
+        filename=filename,
+    )
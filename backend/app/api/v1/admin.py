@@ -0,0 +1,105 @@
+from datetime import datetime, timezone
+from typing import Literal, Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import client_ip, require_scope
+from app.config import get_settings
+from app.core.serialization import from_rows, render
+from app.database import get_db, get_read_db, read_after, replicas
+from app.schemas.admin import AuditLogEntry, AuditLogPage
+from app.services.audit_search import AuditQuery, audit_table, parse_ip_filter, search, stream
+from app.services.data_requests import utcnow
+from app.services.inbox import InvalidCursor
+
+router = APIRouter()
+
+settings = get_settings()
+
+
+def _utc(value: datetime) -> datetime:
+    # audit_logs.created_at is naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+@router.get("/audit-log", response_model=AuditLogPage)
+async def search_audit_log(
+    request: Request,
+    since: datetime,
+    until: Optional[datetime] = None,
+    user_id: Optional[UUID] = None,
+    ip_address: Optional[str] = Query(default=None, description="An address, or a network in CIDR notation"),
+    action: Optional[str] = None,
+    resource_type: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=settings.audit_page_max),
+    cursor: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json",
+    claims: dict = Depends(require_scope("audit:read")),
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db),
+):
+    """Search the audit log, oldest first. ``format=ndjson`` streams every match instead of one page."""
+    if format == "ndjson" and cursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="'cursor' pages JSON results; an NDJSON export always streams every match",
+        )
+    try:
+        ip_filter = parse_ip_filter(ip_address) if ip_address else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid IP address or network")
+    query = AuditQuery(
+        starts_at=_utc(since),
+        ends_before=_utc(until) if until else utcnow(),
+        user_id=user_id,
+        ip_address=ip_filter,
+        action=action,
+        resource_type=resource_type,
+    )
+    if query.starts_at >= query.ends_before:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'since' must be before 'until'")
+
+    # Reading the audit log is itself audited
+    await db.execute(audit_table.insert().values(
+        action="audit_log_searched",
+        resource_type="audit_log",
+        ip_address=client_ip(request),
+        user_agent=request.headers.get("User-Agent"),
+        details={
+            "staff": claims["sub"],
+            "format": format,
+            "since": query.starts_at.isoformat(),
+            "until": query.ends_before.isoformat(),
+            "user_id": str(user_id) if user_id else None,
+            "ip_address": ip_address,
+            "action": action,
+            "resource_type": resource_type,
+        },
+        created_at=utcnow(),
+    ))
+    await db.commit()
+
+    if format == "ndjson":
+        return StreamingResponse(
+            stream(replicas.session_maker(read_after(request)), query),
+            media_type="application/x-ndjson",
+        )
+
+    try:
+        rows, next_cursor = await search(read_db, query, limit, cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    return render(AuditLogPage(
+        entries=from_rows(
+            AuditLogEntry,
+            rows,
+            overrides=lambda row: {"ip_address": str(row.ip_address) if row.ip_address is not None else None},
+        ),
+        next_cursor=next_cursor,
+    ))
@@ -1,25 +1,83 @@
-from fastapi import APIRouter, Query
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import Response
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
 from uuid import UUID
-from datetime import datetime, date
+from datetime import datetime, date, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from app.api.deps import get_current_active_user
+from app.api.streaming import etag_matches
+from app.config import get_settings
+from app.core.encryption import field_encryption
+from app.core.serialization import from_row, render
+from app.database import get_db
+from app.models.appointment import BLOCKING_STATUSES, Appointment
+from app.models.user import User
+from app.schemas.appointment import (
+    AppointmentCreate,
+    AppointmentResponse,
+    AppointmentUpdate,
+    AvailableSlot,
+    AvailableSlotList,
+    CalendarFeedResponse,
+    SlotConflict,
+)
+from app.services.availability import Slot, duration_for, get_availability
+from app.services.booking import SlotUnavailable, book_slot, reschedule
+from app.services.calendar_feed import (
+    current_generation,
+    feed_appointments,
+    feed_etag,
+    feed_token,
+    parse_feed_token,
+    render_calendar,
+    rotate_feed,
+)
+from app.services.versions import APPOINTMENTS, bump_version, get_versions
+from app.services.owned import OwnedRepository
 
 router = APIRouter()
 
+settings = get_settings()
+
+appointment_repo = OwnedRepository(Appointment, not_found_detail="Appointment not found")
+
+
+def _local_midnight_utc(day: date) -> datetime:
+    local = datetime.combine(day, time(), tzinfo=ZoneInfo(settings.clinic_timezone))
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _available_slots(slots: List[Slot]) -> List[AvailableSlot]:
+    return [
+        AvailableSlot(
+            date=slot.starts_at,
+            duration_minutes=slot.duration_minutes,
+            slot_type=slot.slot_type,
+            clinician_id=slot.clinician_id,
+        )
+        for slot in slots
+    ]
+
+
+def _decrypted_fields(appointment) -> dict:
+    def decrypt(value):
+        return field_encryption.decrypt(value) if value is not None else None
 
-class AppointmentCreate(BaseModel):
-    appointment_type: str  # routine, follow_up, urgent, phone, video
-    reason: str | None = None
-    preferred_date: date | None = None
-    preferred_time: str | None = None  # morning, afternoon, evening
+    return {
+        "reason": decrypt(appointment.reason_encrypted),
+        "notes": decrypt(appointment.notes_encrypted),
+        "video_link": decrypt(appointment.video_link_encrypted),
+    }
 
 
-class AppointmentResponse(BaseModel):
-    id: UUID
-    appointment_type: str
-    status: str
-    scheduled_at: datetime | None
-    duration_minutes: int
-    created_at: datetime
+def _conflict(exc: SlotUnavailable):
+    return render(
+        SlotConflict(detail="Slot is no longer available", alternatives=_available_slots(exc.alternatives)),
+        status_code=status.HTTP_409_CONFLICT,
+    )
 
 
 @router.get("/")
@@ -31,27 +89,138 @@ async def list_appointments(
     return {"appointments": [], "total": 0}
 
 
-@router.post("/", response_model=AppointmentResponse)
-async def request_appointment(request: AppointmentCreate):
-    """Request a new appointment"""
-    return AppointmentResponse(
-        id=UUID("00000000-0000-0000-0000-000000000000"),
-        appointment_type=request.appointment_type,
-        status="requested",
-        scheduled_at=None,
-        duration_minutes=15,
-        created_at=datetime.utcnow(),
+@router.post(
+    "/",
+    response_model=AppointmentResponse,
+    status_code=status.HTTP_201_CREATED,
+    responses={409: {"model": SlotConflict}},
+)
+async def request_appointment(
+    request: AppointmentCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Book an offered slot, or request an appointment without one"""
+    values = {
+        "reason_encrypted": field_encryption.encrypt(request.reason),
+        "notes_encrypted": field_encryption.encrypt(request.notes) if request.notes else None,
+    }
+    if request.scheduled_at is None:
+        appointment = await appointment_repo.create(db, current_user.id, {
+            "appointment_type": request.appointment_type,
+            "status": "requested",
+            "duration_minutes": duration_for(request.appointment_type),
+            **values,
+        })
+        await db.commit()
+    else:
+        try:
+            appointment = await book_slot(
+                db,
+                current_user.id,
+                request.appointment_type,
+                request.scheduled_at,
+                clinician_id=request.clinician_id,
+                values=values,
+            )
+        except SlotUnavailable as exc:
+            return _conflict(exc)
+    await bump_version(current_user.id, APPOINTMENTS)
+
+    return render(
+        from_row(AppointmentResponse, appointment, **_decrypted_fields(appointment)),
+        status_code=status.HTTP_201_CREATED,
     )
 
 
-@router.get("/available-slots")
+@router.get("/available-slots", response_model=AvailableSlotList)
 async def get_available_slots(
     start_date: date,
     end_date: date | None = None,
     appointment_type: str = "routine",
+    clinician_id: UUID | None = None,
+    limit: int = Query(default=200, ge=1, le=1000),
+):
+    """Get available appointment slots between two clinic-local dates (inclusive)"""
+    if appointment_type not in settings.appointment_durations:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid appointment type")
+    end_date = end_date or start_date + timedelta(days=6)
+    if end_date < start_date or (end_date - start_date).days >= settings.availability_max_days:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Date range must be between 1 and {settings.availability_max_days} days",
+        )
+
+    earliest = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(minutes=settings.booking_min_lead_minutes)
+    starts_after = max(_local_midnight_utc(start_date), earliest)
+    ends_before = _local_midnight_utc(end_date + timedelta(days=1))
+    if starts_after >= ends_before:
+        return render(AvailableSlotList(slots=[]))
+
+    slots = await get_availability().slots(
+        starts_after,
+        ends_before,
+        appointment_type,
+        clinician_ids=[clinician_id] if clinician_id else None,
+        limit=limit,
+    )
+    return render(AvailableSlotList(slots=_available_slots(slots)))
+
+
+def _feed_url(request: Request, user_id: UUID, generation: int) -> CalendarFeedResponse:
+    token = feed_token(user_id, generation)
+    return CalendarFeedResponse(url=str(request.url_for("get_calendar_feed", token=token)))
+
+
+@router.get("/calendar-feed", response_model=CalendarFeedResponse)
+async def get_calendar_feed_url(
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+):
+    """Get the calendar subscription URL for this account"""
+    return render(_feed_url(request, current_user.id, current_user.calendar_feed_generation))
+
+
+@router.post("/calendar-feed", response_model=CalendarFeedResponse)
+async def rotate_calendar_feed_url(
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Issue a new calendar subscription URL and revoke the old ones"""
+    generation = await rotate_feed(db, current_user.id)
+    await db.commit()
+    return render(_feed_url(request, current_user.id, generation))
+
+
+@router.get("/calendar/{token}.ics", name="get_calendar_feed", response_class=Response)
+async def get_calendar_feed(
+    token: str,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
 ):
-    """Get available appointment slots"""
-    return {"slots": []}
+    """iCalendar feed for calendar apps; the token in the URL is the credential"""
+    parsed = parse_feed_token(token)
+    if parsed is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calendar feed not found")
+    user_id, generation = parsed
+    # A rotated URL stops working at once, conditional request or not
+    if await current_generation(db, user_id) != generation:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calendar feed not found")
+
+    # Shared caches key on the secret URL; revalidation is a Redis lookup
+    headers = {"Cache-Control": f"public, max-age={settings.calendar_feed_max_age}"}
+    try:
+        version = (await get_versions(user_id, [APPOINTMENTS]))[0]
+    except RedisError:
+        version = None
+    if version is not None:
+        headers["ETag"] = feed_etag(generation, version)
+        if etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    body = render_calendar(await feed_appointments(db, user_id))
+    return Response(content=body, media_type="text/calendar; charset=utf-8", headers=headers)
 
 
 @router.get("/{appointment_id}")
@@ -60,13 +229,57 @@ async def get_appointment(appointment_id: UUID):
     return {"id": appointment_id}
 
 
-@router.put("/{appointment_id}")
-async def update_appointment(appointment_id: UUID, scheduled_at: datetime | None = None):
+@router.put(
+    "/{appointment_id}",
+    response_model=AppointmentResponse,
+    responses={409: {"model": SlotConflict}},
+)
+async def update_appointment(
+    appointment_id: UUID,
+    request: AppointmentUpdate,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
     """Update/reschedule appointment"""
-    return {"id": appointment_id, "message": "Appointment updated"}
+    values = {}
+    if request.notes is not None:
+        values["notes_encrypted"] = field_encryption.encrypt(request.notes)
+
+    if request.scheduled_at is None:
+        appointment = await appointment_repo.update(db, current_user.id, appointment_id, values)
+        await db.commit()
+    else:
+        current = await appointment_repo.get(db, current_user.id, appointment_id)
+        if current.status not in BLOCKING_STATUSES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"A {current.status} appointment cannot be rescheduled",
+            )
+        try:
+            appointment = await reschedule(db, current_user.id, current, request.scheduled_at, values=values)
+        except SlotUnavailable as exc:
+            return _conflict(exc)
+    await bump_version(current_user.id, APPOINTMENTS)
+
+    return render(from_row(AppointmentResponse, appointment, **_decrypted_fields(appointment)))
 
 
 @router.delete("/{appointment_id}")
-async def cancel_appointment(appointment_id: UUID):
+async def cancel_appointment(
+    appointment_id: UUID,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
     """Cancel appointment"""
+    appointment = await appointment_repo.update(
+        db,
+        current_user.id,
+        appointment_id,
+        {"status": "cancelled"},
+        where=[Appointment.status.in_(BLOCKING_STATUSES)],
+    )
+    await db.commit()
+    # Free the slot in this worker now; others pick it up on their next refresh
+    get_availability().booking_changed(appointment)
+    await bump_version(current_user.id, APPOINTMENTS)
     return {"message": "Appointment cancelled"}
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, Header
+from fastapi.responses import StreamingResponse
+from uuid import UUID
+
+from app.api.deps import get_token_claims
+from app.services.realtime import event_stream
+
+router = APIRouter()
+
+
+@router.get("/stream")
+async def stream_events(
+    claims: dict = Depends(get_token_claims),
+    last_event_id: str | None = Header(default=None),
+):
+    """Server-Sent Events: message, notification and record updates for the user"""
+    # Token-only auth: a long-lived stream must not hold a database session
+    return StreamingResponse(
+        event_stream(
+            UUID(claims["sub"]),
+            last_event_id=last_event_id,
+            expires_at=claims.get("exp"),
+        ),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
@@ -1,10 +1,68 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 from datetime import datetime
 
+from app.api.deps import client_ip, get_current_active_user
+from app.api.streaming import blob_etag, ranged_response
+from app.config import get_settings
+from app.core.serialization import from_row, render
+from app.database import get_db, get_read_db
+from app.models.consent import DataRequest
+from app.models.user import User
+from app.schemas.gdpr import (
+    DataDeletionRequest,
+    DataDeletionResponse,
+    DataExportRequest,
+    DataExportResponse,
+)
+from app.services.consent import (
+    CONSENT_TYPES,
+    consent_history,
+    current_consents,
+    record_consents,
+)
+from app.services.data_export import ARCHIVE_MEDIA_TYPE, REQUEST_TYPE, export_pieces, read_export
+from app.services.erasure import request_erasure
+from app.services.object_storage import ObjectStorage
+from app.services.owned import OwnedRepository
+from app.services.user_keys import get_owner_key
+
 router = APIRouter()
 
+settings = get_settings()
+
+export_repo = OwnedRepository(DataRequest, not_found_detail="Export not found")
+
+
+def _downloadable(export: DataRequest) -> bool:
+    return (
+        export.status == "completed"
+        and export.download_expires_at is not None
+        and export.download_expires_at > datetime.utcnow()
+    )
+
+
+def _export_response(request: Request, export: DataRequest) -> DataExportResponse:
+    download_url = None
+    if _downloadable(export):
+        download_url = str(request.url_for("download_data_export", request_id=export.id))
+    return from_row(
+        DataExportResponse,
+        export,
+        download_url=download_url,
+        size=export.result_size if download_url else None,
+    )
+
+
+async def _get_export(db: AsyncSession, user_id: UUID, request_id: UUID) -> DataRequest:
+    export = await export_repo.get(db, user_id, request_id)
+    if export.request_type != REQUEST_TYPE:
+        raise export_repo.not_found()
+    return export
+
 
 class ConsentUpdate(BaseModel):
     consent_type: str
@@ -18,49 +76,151 @@ class ConsentStatus(BaseModel):
     granted_at: datetime | None
 
 
-@router.get("/consents")
-async def get_consents():
+class ConsentStatusList(BaseModel):
+    consents: list[ConsentStatus]
+
+
+async def _consent_status(db: AsyncSession, user_id: UUID) -> ConsentStatusList:
+    current = current_consents(await consent_history(db, user_id))
+    consents = []
+    for consent_type in CONSENT_TYPES:
+        version = settings.consent_versions[consent_type]
+        record = current.get(consent_type)
+        # Consent to an earlier version does not carry over to the one in force
+        granted = record is not None and record.granted and record.version == version
+        consents.append(ConsentStatus(
+            consent_type=consent_type,
+            version=version,
+            granted=granted,
+            granted_at=record.granted_at if granted else None,
+        ))
+    return ConsentStatusList(consents=consents)
+
+
+@router.get("/consents", response_model=ConsentStatusList)
+async def get_consents(
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db),
+):
     """Get current consent status"""
-    return {
-        "consents": [
-            {"consent_type": "terms_of_service", "version": "1.0", "granted": True},
-            {"consent_type": "privacy_policy", "version": "1.0", "granted": True},
-            {"consent_type": "data_processing", "version": "1.0", "granted": True},
-            {"consent_type": "marketing", "version": "1.0", "granted": False},
-        ]
-    }
-
-
-@router.post("/consents")
-async def update_consents(consents: list[ConsentUpdate]):
-    """Update consent preferences"""
-    return {"message": "Consents updated"}
-
-
-@router.post("/data-export")
-async def request_data_export():
-    """Request data export (GDPR right to access)"""
-    return {
-        "request_id": UUID("00000000-0000-0000-0000-000000000000"),
-        "status": "pending",
-        "message": "Your data export request has been submitted. You will be notified when it's ready.",
-    }
+    return render(await _consent_status(db, current_user.id))
 
 
-@router.get("/data-export/{request_id}")
-async def get_data_export(request_id: UUID):
-    """Download exported data"""
-    return {"request_id": request_id, "status": "processing", "download_url": None}
-
-
-@router.post("/data-delete")
-async def request_data_deletion():
-    """Request account deletion (GDPR right to erasure)"""
-    return {
-        "request_id": UUID("00000000-0000-0000-0000-000000000000"),
-        "status": "pending",
-        "message": "Your deletion request has been submitted. This will be processed within 30 days.",
-    }
+@router.post("/consents", response_model=ConsentStatusList)
+async def update_consents(
+    consents: list[ConsentUpdate],
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Update consent preferences"""
+    unknown = sorted({consent.consent_type for consent in consents} - set(CONSENT_TYPES))
+    if unknown or not consents:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown consent type: {', '.join(unknown)}" if unknown else "No consents given",
+        )
+    await record_consents(
+        db,
+        current_user.id,
+        [(consent.consent_type, consent.granted) for consent in consents],
+        ip_address=client_ip(request),
+        user_agent=request.headers.get("User-Agent"),
+    )
+    await db.commit()
+    return render(await _consent_status(db, current_user.id))
+
+
+@router.post("/data-export", response_model=DataExportResponse, status_code=status.HTTP_202_ACCEPTED)
+async def request_data_export(
+    request: Request,
+    options: DataExportRequest | None = None,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Request data export (GDPR right to access); built in the background"""
+    options = options or DataExportRequest()
+    if options.format != "json":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only json exports are supported")
+
+    # One export in flight per user; asking again returns it
+    result = await db.execute(
+        select(DataRequest)
+        .where(
+            DataRequest.user_id == current_user.id,
+            DataRequest.request_type == REQUEST_TYPE,
+            DataRequest.status.in_(("pending", "processing")),
+        )
+        .limit(1)
+    )
+    export = result.scalar_one_or_none()
+    if export is None:
+        export = await export_repo.create(db, current_user.id, {
+            "request_type": REQUEST_TYPE,
+            "status": "pending",
+            "options": options.model_dump(),
+        })
+        await db.commit()
+    return render(_export_response(request, export), status_code=status.HTTP_202_ACCEPTED)
+
+
+@router.get("/data-export/{request_id}", response_model=DataExportResponse)
+async def get_data_export(
+    request_id: UUID,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Export status and progress; ``download_url`` once the archive is ready"""
+    export = await _get_export(db, current_user.id, request_id)
+    return render(_export_response(request, export))
+
+
+@router.get("/data-export/{request_id}/download", name="download_data_export")
+async def download_data_export(
+    request_id: UUID,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Download the export archive (supports Range for resumed downloads)"""
+    export = await _get_export(db, current_user.id, request_id)
+    if not _downloadable(export):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Export not available")
+
+    pieces = export_pieces(export)
+    owner_key = await get_owner_key(db, current_user.id)
+    storage = ObjectStorage()
+    return await ranged_response(
+        request,
+        export.result_size,
+        blob_etag(export.id, pieces[0]["key"]),
+        ARCHIVE_MEDIA_TYPE,
+        lambda start, end: read_export(storage, pieces, start, end, owner_key),
+        filename=f"data-export-{export.requested_at:%Y-%m-%d}.zip",
+        disposition="attachment",
+    )
+
+
+@router.post("/data-delete", response_model=DataDeletionResponse, status_code=status.HTTP_202_ACCEPTED)
+async def request_data_deletion(
+    request: DataDeletionRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Request account deletion (GDPR right to erasure)
+
+    The account is closed and its stored files made unreadable at once;
+    the remaining data is deleted in the background.
+    """
+    if not request.confirms(current_user.email):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Confirm the deletion and your email address",
+        )
+    erasure = await request_erasure(db, current_user.id, request.reason)
+    await db.commit()
+    return render(from_row(DataDeletionResponse, erasure), status_code=status.HTTP_202_ACCEPTED)
 
 
 @router.get("/audit-log")
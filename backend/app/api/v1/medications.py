@@ -7,29 +7,46 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models.user import User
 from app.models.medication import PatientMedication, MedicationAdherence
 from app.core.encryption import field_encryption
+from app.core.serialization import from_row, from_rows, render
 from app.schemas.medication import (
     MedicationCreate,
     MedicationUpdate,
     MedicationResponse,
     MedicationAdherenceCreate,
     MedicationAdherenceResponse,
-    MedicationAdherenceSummary
+    MedicationAdherenceSummary,
+    MedicationSearchResult
 )
 from app.schemas.common import PaginatedResponse, SuccessResponse
-from app.api.deps import get_current_active_user
+from app.api.conditional import versioned
+from app.api.deps import get_current_active_user, get_token_user_id
+from app.services.drug_dictionary import load_drug_dictionary, match_medication
+from app.services.interactions import rescreen_patient, screen_added
+from app.services.owned import OwnedRepository
+from app.services.versions import MEDICATIONS, bump_version
 
 router = APIRouter()
 
+medication_repo = OwnedRepository(PatientMedication, not_found_detail="Medication not found")
+
+
+def _decrypted_fields(medication: PatientMedication) -> dict:
+    """Response fields that are stored encrypted on the row."""
+    return {
+        "instructions": field_encryption.decrypt_if_present(medication.instructions_encrypted)
+    }
+
 
 @router.get("", response_model=List[MedicationResponse])
+@versioned(MEDICATIONS)
 async def list_medications(
     active_only: bool = True,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """List patient medications."""
     query = select(PatientMedication).where(
@@ -44,24 +61,30 @@ async def list_medications(
     result = await db.execute(query)
     medications = result.scalars().all()
 
-    return [
-        MedicationResponse(
-            id=m.id,
-            medication_name=m.medication_name,
-            dosage=m.dosage,
-            frequency=m.frequency,
-            instructions=field_encryption.decrypt_if_present(m.instructions_encrypted),
-            started_at=m.started_at,
-            ended_at=m.ended_at,
-            is_active=m.is_active,
-            reminder_enabled=m.reminder_enabled,
-            reminder_times=m.reminder_times,
-            synced_from_clinic=m.synced_from_clinic,
-            created_at=m.created_at,
-            updated_at=m.updated_at
+    return render(
+        from_rows(MedicationResponse, medications, _decrypted_fields),
+        List[MedicationResponse]
+    )
+
+
+@router.get("/search", response_model=List[MedicationSearchResult])
+async def search_medications(
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    user_id: UUID = Depends(get_token_user_id)
+):
+    """Typeahead search over the medication dictionary."""
+    dictionary = await load_drug_dictionary()
+    if dictionary is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Medication dictionary is not available"
         )
-        for m in medications
-    ]
+
+    return render(
+        from_rows(MedicationSearchResult, dictionary.search(q, limit)),
+        List[MedicationSearchResult]
+    )
 
 
 @router.post("", response_model=MedicationResponse, status_code=status.HTTP_201_CREATED)
@@ -71,75 +94,47 @@ async def add_medication(
     db: AsyncSession = Depends(get_db)
 ):
     """Add a new medication (self-managed)."""
-    medication = PatientMedication(
-        user_id=current_user.id,
-        medication_name=data.medication_name,
-        dosage=data.dosage,
-        frequency=data.frequency,
-        instructions_encrypted=field_encryption.encrypt_if_present(data.instructions),
-        started_at=data.started_at,
-        reminder_enabled=data.reminder_enabled,
-        reminder_times=data.reminder_times,
-        synced_from_clinic=False
+    entry = await match_medication(data.medication_name, data.medication_code)
+
+    medication = await medication_repo.create(db, current_user.id, {
+        "medication_name": entry.name if entry else data.medication_name,
+        "medication_code": entry.code if entry else None,
+        "dosage": data.dosage,
+        "frequency": data.frequency,
+        "instructions_encrypted": field_encryption.encrypt_if_present(data.instructions),
+        "started_at": data.started_at,
+        "reminder_enabled": data.reminder_enabled,
+        "reminder_times": data.reminder_times,
+        "synced_from_clinic": False
+    })
+    warnings = await screen_added(
+        db, current_user.id, medication.id, medication.medication_code, medication.medication_name
     )
-
-    db.add(medication)
     await db.commit()
-    await db.refresh(medication)
-
-    return MedicationResponse(
-        id=medication.id,
-        medication_name=medication.medication_name,
-        dosage=medication.dosage,
-        frequency=medication.frequency,
-        instructions=data.instructions,
-        started_at=medication.started_at,
-        ended_at=medication.ended_at,
-        is_active=medication.is_active,
-        reminder_enabled=medication.reminder_enabled,
-        reminder_times=medication.reminder_times,
-        synced_from_clinic=medication.synced_from_clinic,
-        created_at=medication.created_at,
-        updated_at=medication.updated_at
+    await bump_version(current_user.id, MEDICATIONS)
+
+    return render(
+        from_row(
+            MedicationResponse,
+            medication,
+            instructions=data.instructions,
+            interaction_warnings=warnings
+        ),
+        status_code=status.HTTP_201_CREATED
     )
 
 
 @router.get("/{medication_id}", response_model=MedicationResponse)
+@versioned(MEDICATIONS)
 async def get_medication(
     medication_id: UUID,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get a specific medication."""
-    result = await db.execute(
-        select(PatientMedication).where(
-            PatientMedication.id == medication_id,
-            PatientMedication.user_id == current_user.id
-        )
-    )
-    medication = result.scalar_one_or_none()
+    medication = await medication_repo.get(db, current_user.id, medication_id)
 
-    if not medication:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Medication not found"
-        )
-
-    return MedicationResponse(
-        id=medication.id,
-        medication_name=medication.medication_name,
-        dosage=medication.dosage,
-        frequency=medication.frequency,
-        instructions=field_encryption.decrypt_if_present(medication.instructions_encrypted),
-        started_at=medication.started_at,
-        ended_at=medication.ended_at,
-        is_active=medication.is_active,
-        reminder_enabled=medication.reminder_enabled,
-        reminder_times=medication.reminder_times,
-        synced_from_clinic=medication.synced_from_clinic,
-        created_at=medication.created_at,
-        updated_at=medication.updated_at
-    )
+    return render(from_row(MedicationResponse, medication, **_decrypted_fields(medication)))
 
 
 @router.put("/{medication_id}", response_model=MedicationResponse)
@@ -150,55 +145,21 @@ async def update_medication(
     db: AsyncSession = Depends(get_db)
 ):
     """Update a medication."""
-    result = await db.execute(
-        select(PatientMedication).where(
-            PatientMedication.id == medication_id,
-            PatientMedication.user_id == current_user.id
-        )
-    )
-    medication = result.scalar_one_or_none()
-
-    if not medication:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Medication not found"
-        )
-
-    if data.dosage is not None:
-        medication.dosage = data.dosage
-    if data.frequency is not None:
-        medication.frequency = data.frequency
+    values = data.model_dump(exclude_none=True, exclude={"instructions"})
     if data.instructions is not None:
-        medication.instructions_encrypted = field_encryption.encrypt(data.instructions)
-    if data.ended_at is not None:
-        medication.ended_at = data.ended_at
-    if data.is_active is not None:
-        medication.is_active = data.is_active
-    if data.reminder_enabled is not None:
-        medication.reminder_enabled = data.reminder_enabled
-    if data.reminder_times is not None:
-        medication.reminder_times = data.reminder_times
-
-    medication.updated_at = datetime.now(timezone.utc)
-
+        values["instructions_encrypted"] = field_encryption.encrypt(data.instructions)
+    values["updated_at"] = datetime.now(timezone.utc)
+
+    medication = await medication_repo.update(db, current_user.id, medication_id, values)
+    fields = _decrypted_fields(medication)
+    if "is_active" in values:
+        # Activating or stopping a medication changes every co-medication's warnings
+        warnings = await rescreen_patient(db, current_user.id)
+        fields["interaction_warnings"] = warnings.get(medication.id, [])
     await db.commit()
-    await db.refresh(medication)
+    await bump_version(current_user.id, MEDICATIONS)
 
-    return MedicationResponse(
-        id=medication.id,
-        medication_name=medication.medication_name,
-        dosage=medication.dosage,
-        frequency=medication.frequency,
-        instructions=field_encryption.decrypt_if_present(medication.instructions_encrypted),
-        started_at=medication.started_at,
-        ended_at=medication.ended_at,
-        is_active=medication.is_active,
-        reminder_enabled=medication.reminder_enabled,
-        reminder_times=medication.reminder_times,
-        synced_from_clinic=medication.synced_from_clinic,
-        created_at=medication.created_at,
-        updated_at=medication.updated_at
-    )
+    return render(from_row(MedicationResponse, medication, **fields))
 
 
 @router.delete("/{medication_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -208,28 +169,25 @@ async def delete_medication(
     db: AsyncSession = Depends(get_db)
 ):
     """Delete a self-managed medication."""
-    result = await db.execute(
-        select(PatientMedication).where(
-            PatientMedication.id == medication_id,
-            PatientMedication.user_id == current_user.id
-        )
+    deleted_id = await medication_repo.delete(
+        db,
+        current_user.id,
+        medication_id,
+        where=[PatientMedication.synced_from_clinic == False]
     )
-    medication = result.scalar_one_or_none()
 
-    if not medication:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Medication not found"
-        )
-
-    if medication.synced_from_clinic:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Cannot delete clinic-prescribed medications"
-        )
+    if deleted_id is None:
+        # Only the failure path pays for a second query to pick the right error
+        if await medication_repo.exists(db, current_user.id, medication_id):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cannot delete clinic-prescribed medications"
+            )
+        raise medication_repo.not_found()
 
-    await db.delete(medication)
+    await rescreen_patient(db, current_user.id)
     await db.commit()
+    await bump_version(current_user.id, MEDICATIONS)
 
 
 @router.post("/{medication_id}/taken", response_model=MedicationAdherenceResponse)
@@ -240,40 +198,19 @@ async def log_medication_taken(
     db: AsyncSession = Depends(get_db)
 ):
     """Log that a medication was taken."""
-    result = await db.execute(
-        select(PatientMedication).where(
-            PatientMedication.id == medication_id,
-            PatientMedication.user_id == current_user.id
-        )
+    taken_at = data.taken_at or datetime.now(timezone.utc)
+    adherence = await medication_repo.create_child(
+        db,
+        MedicationAdherence,
+        "medication_id",
+        current_user.id,
+        medication_id,
+        {"scheduled_at": taken_at, "taken_at": taken_at, "skipped": False}
     )
-    medication = result.scalar_one_or_none()
-
-    if not medication:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Medication not found"
-        )
-
-    adherence = MedicationAdherence(
-        medication_id=medication_id,
-        scheduled_at=data.taken_at or datetime.now(timezone.utc),
-        taken_at=data.taken_at or datetime.now(timezone.utc),
-        skipped=False
-    )
-
-    db.add(adherence)
     await db.commit()
-    await db.refresh(adherence)
-
-    return MedicationAdherenceResponse(
-        id=adherence.id,
-        medication_id=adherence.medication_id,
-        scheduled_at=adherence.scheduled_at,
-        taken_at=adherence.taken_at,
-        skipped=adherence.skipped,
-        skip_reason=adherence.skip_reason,
-        created_at=adherence.created_at
-    )
+    await bump_version(current_user.id, MEDICATIONS)
+
+    return render(from_row(MedicationAdherenceResponse, adherence))
 
 
 @router.post("/{medication_id}/skipped", response_model=MedicationAdherenceResponse)
@@ -284,40 +221,22 @@ async def log_medication_skipped(
     db: AsyncSession = Depends(get_db)
 ):
     """Log that a medication was skipped."""
-    result = await db.execute(
-        select(PatientMedication).where(
-            PatientMedication.id == medication_id,
-            PatientMedication.user_id == current_user.id
-        )
+    adherence = await medication_repo.create_child(
+        db,
+        MedicationAdherence,
+        "medication_id",
+        current_user.id,
+        medication_id,
+        {
+            "scheduled_at": datetime.now(timezone.utc),
+            "skipped": True,
+            "skip_reason": data.skip_reason
+        }
     )
-    medication = result.scalar_one_or_none()
-
-    if not medication:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Medication not found"
-        )
-
-    adherence = MedicationAdherence(
-        medication_id=medication_id,
-        scheduled_at=datetime.now(timezone.utc),
-        skipped=True,
-        skip_reason=data.skip_reason
-    )
-
-    db.add(adherence)
     await db.commit()
-    await db.refresh(adherence)
-
-    return MedicationAdherenceResponse(
-        id=adherence.id,
-        medication_id=adherence.medication_id,
-        scheduled_at=adherence.scheduled_at,
-        taken_at=adherence.taken_at,
-        skipped=adherence.skipped,
-        skip_reason=adherence.skip_reason,
-        created_at=adherence.created_at
-    )
+    await bump_version(current_user.id, MEDICATIONS)
+
+    return render(from_row(MedicationAdherenceResponse, adherence))
 
 
 @router.get("/{medication_id}/adherence", response_model=MedicationAdherenceSummary)
@@ -325,22 +244,10 @@ async def get_medication_adherence(
     medication_id: UUID,
     days: int = Query(30, ge=7, le=365),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get medication adherence summary."""
-    result = await db.execute(
-        select(PatientMedication).where(
-            PatientMedication.id == medication_id,
-            PatientMedication.user_id == current_user.id
-        )
-    )
-    medication = result.scalar_one_or_none()
-
-    if not medication:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Medication not found"
-        )
+    medication = await medication_repo.get(db, current_user.id, medication_id)
 
     # Get adherence logs
     from datetime import timedelta
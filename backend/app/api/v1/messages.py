@@ -1,69 +1,301 @@
-from fastapi import APIRouter, Query, UploadFile, File
-from pydantic import BaseModel
-from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File, status
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
+from typing import List
+from uuid import UUID, uuid4
+
+from app.api.deps import get_current_active_user
+from app.api.streaming import blob_etag, encrypted_blob_response
+from app.config import get_settings
+from app.core.encryption import field_encryption
+from app.core.serialization import from_row, from_rows, render
+from app.database import get_db, get_read_db
+from app.models.message import Message, MessageAttachment
+from app.models.user import User
+from app.schemas.message import (
+    MessageAttachmentResponse,
+    MessageCreate,
+    MessageReply,
+    MessageResponse,
+    MessageThreadPage,
+    MessageThreadResponse,
+)
+from app.services.blob_store import BlobStore
+from app.services.inbox import InvalidCursor, list_threads
+from app.services.message_search import index_message, search_messages as find_messages
+from app.services.object_storage import ObjectStorage, UploadTooLarge
+from app.services.outbox import enqueue_message
+from app.services.owned import OwnedRepository
+from app.services.user_keys import get_owner_key
 
 router = APIRouter()
 
+settings = get_settings()
+
+message_repo = OwnedRepository(Message, not_found_detail="Message not found")
 
-class MessageCreate(BaseModel):
-    subject: str
-    body: str
+blob_store = BlobStore()
 
 
-class MessageResponse(BaseModel):
-    id: UUID
-    direction: str
-    subject: str
-    body: str
-    status: str
-    created_at: datetime
+def _decrypted_fields(message) -> dict:
+    return {
+        "subject": field_encryption.decrypt(message.subject_encrypted),
+        "body": field_encryption.decrypt(message.body_encrypted),
+    }
 
 
-@router.get("/")
-async def list_messages(limit: int = Query(default=20, le=100)):
-    """List message threads"""
-    return {"messages": [], "total": 0}
+@router.get("/", response_model=MessageThreadPage)
+async def list_messages(
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: str | None = None,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """List message threads, most recent activity first"""
+    try:
+        threads, next_cursor = await list_threads(db, current_user.id, limit, cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
 
+    return render(MessageThreadPage(
+        threads=from_rows(MessageThreadResponse, threads),
+        next_cursor=next_cursor,
+    ))
 
-@router.post("/", response_model=MessageResponse)
-async def send_message(request: MessageCreate):
+
+@router.post("/", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
+async def send_message(
+    request: MessageCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
     """Send a new message to clinic"""
-    return MessageResponse(
-        id=UUID("00000000-0000-0000-0000-000000000000"),
-        direction="inbound",
-        subject=request.subject,
-        body=request.body,
-        status="sent",
-        created_at=datetime.utcnow(),
+    if request.parent_message_id:
+        return await reply_to_message(
+            request.parent_message_id, MessageReply(body=request.body), current_user, db
+        )
+
+    message_id = uuid4()
+    message = await message_repo.create(db, current_user.id, {
+        "id": message_id,
+        "thread_id": message_id,
+        "direction": "inbound",
+        "status": "queued",
+        "subject_encrypted": field_encryption.encrypt(request.subject),
+        "body_encrypted": field_encryption.encrypt(request.body),
+    })
+    await index_message(db, current_user.id, message_id, request.subject, request.body)
+    await enqueue_message(db, current_user.id, message_id, message_id, current_user.clinic_patient_id, {
+        "id": message_id,
+        "thread_id": message_id,
+        "subject": request.subject,
+        "body": request.body,
+        "sent_at": message.created_at,
+    })
+    await db.commit()
+
+    return render(
+        from_row(MessageResponse, message, subject=request.subject, body=request.body),
+        status_code=status.HTTP_201_CREATED,
     )
 
 
+@router.get("/search", response_model=List[MessageResponse])
+async def search_messages(
+    q: str = Query(..., min_length=2, max_length=200),
+    limit: int = Query(default=20, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Search message subjects and bodies (whole words, all must match)"""
+    hits = await find_messages(db, current_user.id, q, limit)
+    return render(from_rows(MessageResponse, hits, _decrypted_fields), List[MessageResponse])
+
+
 @router.get("/{message_id}")
 async def get_message(message_id: UUID):
     """Get message thread"""
     return {"id": message_id}
 
 
-@router.post("/{message_id}/reply")
-async def reply_to_message(message_id: UUID, body: str):
+@router.post(
+    "/{message_id}/reply",
+    response_model=MessageResponse,
+    status_code=status.HTTP_201_CREATED,
+)
+async def reply_to_message(
+    message_id: UUID,
+    request: MessageReply,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
     """Reply to a message"""
-    return {"message": "Reply sent", "parent_id": message_id}
+    parent = await message_repo.get(db, current_user.id, message_id)
 
+    reply_id = uuid4()
+    thread_id = parent.thread_id or parent.id
+    message = await message_repo.create(db, current_user.id, {
+        "id": reply_id,
+        "thread_id": thread_id,
+        "parent_message_id": parent.id,
+        "direction": "inbound",
+        "status": "queued",
+        "subject_encrypted": parent.subject_encrypted,
+        "body_encrypted": field_encryption.encrypt(request.body),
+    })
+    subject = field_encryption.decrypt(parent.subject_encrypted)
+    await index_message(db, current_user.id, reply_id, subject, request.body)
+    await enqueue_message(db, current_user.id, reply_id, thread_id, current_user.clinic_patient_id, {
+        "id": reply_id,
+        "thread_id": thread_id,
+        "parent_message_id": parent.id,
+        "subject": subject,
+        "body": request.body,
+        "sent_at": message.created_at,
+    })
+    await db.commit()
 
-@router.put("/{message_id}/read")
-async def mark_as_read(message_id: UUID):
-    """Mark message as read"""
-    return {"message": "Marked as read"}
+    return render(
+        from_row(MessageResponse, message, subject=subject, body=request.body),
+        status_code=status.HTTP_201_CREATED,
+    )
+
+
+@router.put("/{message_id}/read", response_model=MessageResponse)
+async def mark_as_read(
+    message_id: UUID,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Mark a message from the clinic as read; repeating it keeps the first read time"""
+    message = await message_repo.update(
+        db,
+        current_user.id,
+        message_id,
+        {"status": "read", "read_at": func.coalesce(Message.read_at, datetime.utcnow())},
+        # The patient's own messages keep their delivery status
+        where=[Message.direction == "outbound"],
+    )
+    await db.commit()
 
+    return render(from_row(MessageResponse, message, **_decrypted_fields(message)))
 
-@router.post("/{message_id}/attachments")
-async def upload_attachment(message_id: UUID, file: UploadFile = File(...)):
+
+@router.post(
+    "/{message_id}/attachments",
+    response_model=MessageAttachmentResponse,
+    status_code=status.HTTP_201_CREATED,
+)
+async def upload_attachment(
+    message_id: UUID,
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
     """Upload attachment to message"""
-    return {"message": "Attachment uploaded", "filename": file.filename}
+    if not await message_repo.exists(db, current_user.id, message_id):
+        raise message_repo.not_found()
+
+    # Identical content the patient already uploaded is reused without re-encrypting;
+    # new content streams upload -> encrypted segments -> multipart parts
+    try:
+        blob = await blob_store.store(
+            db,
+            current_user.id,
+            file,
+            max_size=settings.attachment_max_bytes,
+            content_type="application/octet-stream",
+        )
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Attachments are limited to {settings.attachment_max_bytes} bytes",
+        )
+
+    attachment = MessageAttachment(
+        message_id=message_id,
+        file_name=file.filename or "attachment",
+        file_type=file.content_type or "application/octet-stream",
+        file_size=blob.size,
+        s3_key_encrypted=field_encryption.encrypt(blob.storage_key),
+        blob_id=blob.id,
+    )
+    db.add(attachment)
+    await db.execute(
+        update(Message).where(Message.id == message_id).values(has_attachments=True)
+    )
+    await db.commit()
+
+    return render(
+        from_row(MessageAttachmentResponse, attachment),
+        status_code=status.HTTP_201_CREATED,
+    )
 
 
 @router.get("/{message_id}/attachments/{attachment_id}")
-async def download_attachment(message_id: UUID, attachment_id: UUID):
-    """Download attachment"""
-    return {"message": "Download URL", "url": ""}
+async def download_attachment(
+    message_id: UUID,
+    attachment_id: UUID,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Download attachment (supports Range and If-None-Match)"""
+    result = await db.execute(
+        select(MessageAttachment)
+        .join(Message, Message.id == MessageAttachment.message_id)
+        .where(
+            MessageAttachment.id == attachment_id,
+            MessageAttachment.message_id == message_id,
+            Message.user_id == current_user.id,
+        )
+    )
+    attachment = result.scalar_one_or_none()
+    if not attachment:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Attachment not found")
+
+    storage_key = field_encryption.decrypt(attachment.s3_key_encrypted)
+    return await encrypted_blob_response(
+        request,
+        ObjectStorage(),
+        storage_key,
+        size=attachment.file_size,
+        etag=blob_etag(attachment.id, storage_key),
+        media_type=attachment.file_type,
+        filename=attachment.file_name,
+        owner_key=await get_owner_key(db, current_user.id),
+    )
+
+
+@router.delete(
+    "/{message_id}/attachments/{attachment_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def delete_attachment(
+    message_id: UUID,
+    attachment_id: UUID,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Remove an attachment, releasing its shared blob"""
+    if not await message_repo.exists(db, current_user.id, message_id):
+        raise message_repo.not_found()
+
+    result = await db.execute(
+        delete(MessageAttachment)
+        .where(
+            MessageAttachment.id == attachment_id,
+            MessageAttachment.message_id == message_id,
+        )
+        .returning(MessageAttachment.blob_id)
+    )
+    deleted = result.first()
+    if deleted is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Attachment not found")
+
+    unreferenced = bool(deleted.blob_id) and await blob_store.release(db, deleted.blob_id)
+    await db.commit()
+
+    if unreferenced:
+        await blob_store.collect_garbage(db, blob_ids=[deleted.blob_id])
@@ -1,13 +1,57 @@
-from fastapi import APIRouter, Query
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
+from app.api.conditional import versioned
+from app.api.deps import get_current_active_user
+from app.api.streaming import blob_etag, encrypted_blob_response
+from app.config import get_settings
+from app.core.encryption import field_encryption
+from app.core.serialization import from_rows
+from app.database import get_read_db
+from app.models.document import Document, DocumentPreview
+from app.models.medication import PatientMedication
+from app.models.user import User
+from app.schemas.document import ClinicSyncResult, DocumentResponse
+from app.schemas.medication import MedicationResponse
+from app.services.clinic_sync import ClinicClient, ClinicSyncEngine
+from app.services.object_storage import ObjectStorage
+from app.services.previews import preview_for_document
+from app.services.owned import OwnedRepository
+from app.services.user_keys import get_owner_key
+from app.services.versions import DOCUMENTS, MEDICATIONS
+
 router = APIRouter()
 
+settings = get_settings()
+
+document_repo = OwnedRepository(Document, not_found_detail="Document not found")
+
 
 @router.get("/medications")
-async def get_medications():
+@versioned(MEDICATIONS)
+async def get_medications(
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db),
+):
     """Get patient medications list"""
-    return {"medications": []}
+    result = await db.execute(
+        select(PatientMedication)
+        .where(
+            PatientMedication.user_id == current_user.id,
+            PatientMedication.synced_from_clinic == True,
+        )
+        .order_by(PatientMedication.medication_name)
+    )
+    medications = from_rows(
+        MedicationResponse,
+        result.scalars().all(),
+        lambda m: {"instructions": field_encryption.decrypt_if_present(m.instructions_encrypted)},
+    )
+    return {"medications": medications}
 
 
 @router.get("/conditions")
@@ -17,18 +61,108 @@ async def get_conditions():
 
 
 @router.get("/documents")
+@versioned(DOCUMENTS)
 async def list_documents(
     document_type: str | None = None,
     limit: int = Query(default=20, le=100),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """List medical documents"""
-    return {"documents": [], "total": 0}
+    has_preview = (
+        select(DocumentPreview.id)
+        .where(
+            DocumentPreview.user_id == Document.user_id,
+            DocumentPreview.content_key == Document.content_key,
+            DocumentPreview.status == "ready",
+        )
+        .exists()
+        .label("has_preview")
+    )
+    query = select(Document, has_preview).where(Document.user_id == current_user.id)
+    if document_type:
+        query = query.where(Document.document_type == document_type)
+
+    result = await db.execute(query.order_by(Document.created_at.desc()).limit(limit))
+    rows = result.all()
+    previews = {row.Document.id: row.has_preview for row in rows}
+    documents = from_rows(
+        DocumentResponse,
+        [row.Document for row in rows],
+        lambda d: {
+            "description": field_encryption.decrypt_if_present(d.description_encrypted),
+            "has_preview": previews[d.id],
+        },
+    )
+    return {"documents": documents, "total": len(documents)}
 
 
 @router.get("/documents/{document_id}")
-async def get_document(document_id: UUID):
-    """Download/view document"""
-    return {"id": document_id, "download_url": ""}
+async def get_document(
+    document_id: UUID,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Download/view document (supports Range and If-None-Match)"""
+    document = await document_repo.get(db, current_user.id, document_id)
+    storage_key = field_encryption.decrypt(document.s3_key_encrypted)
+
+    return await encrypted_blob_response(
+        request,
+        ObjectStorage(),
+        storage_key,
+        size=document.file_size,
+        etag=blob_etag(document.id, storage_key),
+        media_type=document.file_type,
+        filename=document.title,
+        owner_key=await get_owner_key(db, current_user.id),
+    )
+
+
+@router.get("/documents/{document_id}/preview")
+async def get_document_preview(
+    document_id: UUID,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """First-page thumbnail of a document (404 until it has been rendered)"""
+    preview = await preview_for_document(db, current_user.id, document_id)
+    if preview is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Preview not available")
+
+    storage_key = field_encryption.decrypt(preview.storage_key_encrypted)
+    return await encrypted_blob_response(
+        request,
+        ObjectStorage(),
+        storage_key,
+        size=preview.size,
+        etag=blob_etag(preview.id, storage_key),
+        media_type=preview.media_type,
+        owner_key=await get_owner_key(db, current_user.id),
+    )
+
+
+@router.post("/sync", response_model=List[ClinicSyncResult])
+async def sync_records(current_user: User = Depends(get_current_active_user)):
+    """Pull the latest medications and documents from the clinic"""
+    if not settings.clinic_api_url:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Clinic integration is not configured",
+        )
+    if not current_user.clinic_patient_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Account is not linked to a clinic record",
+        )
+
+    async with ClinicClient() as client:
+        results = await ClinicSyncEngine(client).sync_patient(
+            current_user.id, current_user.clinic_patient_id
+        )
+    return results
 
 
 @router.get("/allergies")
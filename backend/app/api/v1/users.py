@@ -1,7 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, EmailStr
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
+from app.api.deps import get_current_active_user
+from app.core.serialization import from_row, render
+from app.database import get_db
+from app.models.user import User
+from app.schemas.gdpr import DataDeletionRequest, DataDeletionResponse
+from app.services.erasure import request_erasure
+
 router = APIRouter()
 
 
@@ -54,10 +62,25 @@ async def change_password(current_password: str, new_password: str):
     return {"message": "Password changed successfully"}
 
 
-@router.delete("/me")
-async def delete_account():
-    """Delete account (GDPR right to erasure)"""
-    return {"message": "Account deletion request submitted"}
+@router.delete("/me", response_model=DataDeletionResponse, status_code=status.HTTP_202_ACCEPTED)
+async def delete_account(
+    request: DataDeletionRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Delete account (GDPR right to erasure); data is removed in the background
+
+    Shredding the owner key cannot be undone, so like ``POST /gdpr/data-delete``
+    this needs the confirmation and the account's email, not just a token.
+    """
+    if not request.confirms(current_user.email):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Confirm the deletion and your email address",
+        )
+    erasure = await request_erasure(db, current_user.id, request.reason)
+    await db.commit()
+    return render(from_row(DataDeletionResponse, erasure), status_code=status.HTTP_202_ACCEPTED)
 
 
 @router.post("/me/link-nhs")
@@ -0,0 +1,20 @@
+"""Shared Redis client."""
+from functools import lru_cache
+
+from redis.asyncio import BlockingConnectionPool, Redis
+
+from app.config import get_settings
+
+settings = get_settings()
+
+
+def create_redis(url: str, max_connections: int) -> Redis:
+    """Client whose pool waits for a free connection instead of failing on bursts."""
+    pool = BlockingConnectionPool.from_url(url, max_connections=max_connections)
+    return Redis(connection_pool=pool)
+
+
+@lru_cache
+def get_redis() -> Redis:
+    """Process-wide client; its connection pool is shared by every caller."""
+    return create_redis(settings.redis_url, settings.redis_max_connections)
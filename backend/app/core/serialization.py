@@ -0,0 +1,72 @@
+"""Fast ORM-to-JSON serialization for API responses.
+
+Routes build their response schema straight from ORM rows with
+``from_attributes`` and hand back pre-rendered JSON bytes. FastAPI skips
+``response_model`` validation and ``jsonable_encoder`` for a returned
+``Response``, so each payload is validated once and encoded by pydantic-core.
+"""
+from functools import lru_cache
+from typing import Any, Callable, Iterable, List, Mapping, Optional, Type, TypeVar
+
+from fastapi.responses import Response
+from pydantic import BaseModel, TypeAdapter
+
+SchemaT = TypeVar("SchemaT", bound=BaseModel)
+
+
+@lru_cache(maxsize=None)
+def type_adapter(tp: Any) -> TypeAdapter:
+    """Return a cached TypeAdapter so validators/serializers are compiled once."""
+    return TypeAdapter(tp)
+
+
+class RowView:
+    """Attribute view over an ORM row with per-field overrides.
+
+    Used for response fields that are not plain columns, such as values
+    decrypted from ``*_encrypted`` columns.
+    """
+
+    __slots__ = ("_row", "_overrides")
+
+    def __init__(self, row: Any, overrides: Mapping[str, Any]):
+        self._row = row
+        self._overrides = overrides
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self._overrides[name]
+        except KeyError:
+            return getattr(self._row, name)
+
+
+def from_row(schema: Type[SchemaT], row: Any, **overrides: Any) -> SchemaT:
+    """Validate a single ORM row into ``schema``."""
+    source = RowView(row, overrides) if overrides else row
+    return type_adapter(schema).validate_python(source, from_attributes=True)
+
+
+def from_rows(
+    schema: Type[SchemaT],
+    rows: Iterable[Any],
+    overrides: Optional[Callable[[Any], Mapping[str, Any]]] = None
+) -> List[SchemaT]:
+    """Validate many ORM rows into ``schema`` in one adapter call."""
+    if overrides is not None:
+        rows = [RowView(row, overrides(row)) for row in rows]
+    return type_adapter(List[schema]).validate_python(list(rows), from_attributes=True)
+
+
+class JSONBytesResponse(Response):
+    """Response carrying JSON that was already rendered by pydantic-core."""
+
+    media_type = "application/json"
+
+
+def render(value: Any, tp: Any = None, status_code: int = 200) -> JSONBytesResponse:
+    """Render validated schema instances to JSON without re-validation.
+
+    ``tp`` defaults to the instance's own type; pass ``List[Schema]`` for lists.
+    """
+    adapter = type_adapter(tp if tp is not None else type(value))
+    return JSONBytesResponse(content=adapter.dump_json(value), status_code=status_code)
@@ -0,0 +1,152 @@
+"""Segmented streaming AEAD for file blobs.
+
+Fernet needs the whole plaintext in memory, so files are encrypted in
+fixed-size segments with AES-256-GCM instead, following the STREAM
+construction::
+
+    header   = magic(4) | segment_size(4) | salt(16) | nonce_prefix(7)
+    segment  = AES-GCM(key, nonce_prefix | counter(4) | last(1), plaintext, aad=header)
+
+Every ciphertext segment except the last is exactly ``segment_size + 16``
+bytes, so segment ``i`` starts at ``HEADER_SIZE + i * (segment_size + 16)``.
+That gives random access for range reads. The counter and the last-segment
+flag in the nonce stop segments from being reordered, dropped or truncated.
+Each blob uses its own key, derived from the master key and the header salt.
+
+Blobs written with an *owner key* (a random per-user key, see
+``app.services.user_keys``) carry the magic ``SPS2`` and derive their key
+from it instead. Destroying the owner key crypto-shreds every such blob at
+once, wherever copies of the ciphertext live on.
+"""
+import hashlib
+import os
+import struct
+from typing import AsyncIterator, Optional
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from app.config import settings
+
+MAGIC = b"SPS1"
+OWNER_MAGIC = b"SPS2"
+TAG_SIZE = 16
+DEFAULT_SEGMENT_SIZE = 64 * 1024
+_HEADER = struct.Struct(">4sI16s7s")
+HEADER_SIZE = _HEADER.size
+_MAX_SEGMENTS = 2 ** 32
+
+
+def _master_key() -> bytes:
+    key = settings.blob_encryption_key or settings.encryption_key
+    return hashlib.sha256(key.encode()).digest()
+
+
+class OwnerKeyMissing(ValueError):
+    """An owner-keyed blob was opened without its key, e.g. after shredding."""
+
+
+def _derive_key(master_key: bytes, salt: bytes, info: bytes = b"stratosphere-blob-v1") -> bytes:
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        info=info
+    ).derive(master_key)
+
+
+def _blob_key(magic: bytes, salt: bytes, master_key: Optional[bytes], owner_key: Optional[bytes]) -> bytes:
+    if magic == OWNER_MAGIC:
+        if owner_key is None:
+            raise OwnerKeyMissing("Blob is encrypted under an owner key that was not supplied")
+        return _derive_key(owner_key, salt, b"stratosphere-blob-owner-v1")
+    return _derive_key(master_key or _master_key(), salt)
+
+
+def _nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    if index >= _MAX_SEGMENTS:
+        raise ValueError("Blob exceeds the maximum number of segments")
+    return prefix + struct.pack(">I", index) + (b"\x01" if last else b"\x00")
+
+
+def ciphertext_size(plaintext_size: int, segment_size: int = DEFAULT_SEGMENT_SIZE) -> int:
+    """Size of the encrypted blob for a plaintext of ``plaintext_size`` bytes."""
+    segments = max(1, -(-plaintext_size // segment_size))
+    return HEADER_SIZE + plaintext_size + segments * TAG_SIZE
+
+
+class SegmentEncryptor:
+    """Encrypts a blob segment by segment."""
+
+    def __init__(
+        self,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        master_key: Optional[bytes] = None,
+        owner_key: Optional[bytes] = None
+    ):
+        self.segment_size = segment_size
+        salt, self._prefix = os.urandom(16), os.urandom(7)
+        magic = OWNER_MAGIC if owner_key is not None else MAGIC
+        self.header = _HEADER.pack(magic, segment_size, salt, self._prefix)
+        self._aead = AESGCM(_blob_key(magic, salt, master_key, owner_key))
+        self._index = 0
+
+    def encrypt_segment(self, plaintext: bytes, last: bool) -> bytes:
+        if len(plaintext) > self.segment_size or (not last and len(plaintext) != self.segment_size):
+            raise ValueError("Only the last segment may be shorter than segment_size")
+        ciphertext = self._aead.encrypt(_nonce(self._prefix, self._index, last), plaintext, self.header)
+        self._index += 1
+        return ciphertext
+
+    async def encrypt_stream(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Yield the header then encrypted segments for arbitrarily sized input chunks.
+
+        Holds at most one segment of plaintext plus the current input chunk.
+        """
+        yield self.header
+        buffer = bytearray()
+        async for chunk in chunks:
+            buffer += chunk
+            # Keep at least one byte back so the final segment is flagged last
+            while len(buffer) > self.segment_size:
+                yield self.encrypt_segment(bytes(buffer[:self.segment_size]), last=False)
+                del buffer[:self.segment_size]
+        yield self.encrypt_segment(bytes(buffer), last=True)
+
+
+class SegmentDecryptor:
+    """Decrypts individual segments of a blob given its header."""
+
+    def __init__(
+        self,
+        header: bytes,
+        master_key: Optional[bytes] = None,
+        owner_key: Optional[bytes] = None
+    ):
+        magic, segment_size, salt, prefix = _HEADER.unpack(header[:HEADER_SIZE])
+        if magic not in (MAGIC, OWNER_MAGIC):
+            raise ValueError("Not a segmented blob")
+        self.header = bytes(header[:HEADER_SIZE])
+        self.segment_size = segment_size
+        self._prefix = prefix
+        # owner_key is ignored for blobs written before owner keys existed
+        self._aead = AESGCM(_blob_key(magic, salt, master_key, owner_key))
+
+    @property
+    def encrypted_segment_size(self) -> int:
+        return self.segment_size + TAG_SIZE
+
+    def segment_offset(self, index: int) -> int:
+        """Byte offset of encrypted segment ``index`` within the blob."""
+        return HEADER_SIZE + index * self.encrypted_segment_size
+
+    def segment_count(self, blob_size: int) -> int:
+        """Number of segments in a blob of ``blob_size`` encrypted bytes."""
+        return max(1, -(-(blob_size - HEADER_SIZE) // self.encrypted_segment_size))
+
+    def plaintext_size(self, blob_size: int) -> int:
+        return blob_size - HEADER_SIZE - self.segment_count(blob_size) * TAG_SIZE
+
+    def decrypt_segment(self, index: int, ciphertext: bytes, last: bool) -> bytes:
+        return self._aead.decrypt(_nonce(self._prefix, index, last), ciphertext, self.header)
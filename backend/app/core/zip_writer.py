@@ -0,0 +1,152 @@
+"""Append-only ZIP writer whose progress can be saved and resumed.
+
+``zipfile`` needs a seekable file, or keeps each member's metadata in
+memory with no way to persist it. ``ZipWriter`` returns the archive's
+bytes to the caller instead, who forwards them anywhere (an upload, a
+response). The sizes and CRCs of each member go in a data descriptor after
+its data.
+
+``flush`` ends the current DEFLATE block with ``Z_FULL_FLUSH``. Output
+after that point does not refer back to anything before it, so a fresh
+compressor can carry on the same member. ``state`` taken right after a
+flush is a small JSON-able dict. ``ZipWriter(state=...)`` continues the
+archive from there in another process.
+
+ZIP64 is not written: archives are limited to 4 GiB and 65535 members.
+"""
+import struct
+import zlib
+from datetime import datetime
+from typing import Any, Optional
+
+STORED = 0
+DEFLATED = 8
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_DATA_DESCRIPTOR = struct.Struct("<IIII")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END_OF_CENTRAL_DIRECTORY = struct.Struct("<IHHHHIIH")
+
+_FLAGS = 0x0008 | 0x0800  # sizes in a data descriptor; UTF-8 names
+_VERSION = 20
+_MADE_BY = (3 << 8) | _VERSION  # Unix, so the external attributes are file modes
+_FILE_MODE = 0o100644 << 16
+_LIMIT = 0xFFFFFFFF
+
+
+class ZipLimitExceeded(ValueError):
+    """The archive would need ZIP64."""
+
+
+def _dos_time(value: datetime) -> tuple[int, int]:
+    value = max(value, datetime(1980, 1, 1))
+    return (
+        value.hour << 11 | value.minute << 5 | value.second // 2,
+        (value.year - 1980) << 9 | value.month << 5 | value.day
+    )
+
+
+class ZipWriter:
+    """Builds a ZIP archive member by member."""
+
+    def __init__(self, modified: Optional[datetime] = None, state: Optional[dict[str, Any]] = None, level: int = 6):
+        self.level = level
+        if state is None:
+            self.offset = 0
+            self._dos = _dos_time(modified or datetime.utcnow())
+            self._entries: list[list[Any]] = []
+            self._member: Optional[list[Any]] = None
+        else:
+            self.offset = state["offset"]
+            self._dos = tuple(state["dos"])
+            self._entries = [list(entry) for entry in state["entries"]]
+            self._member = list(state["member"]) if state["member"] else None
+        self._compressor = self._new_compressor() if self._member else None
+
+    def _new_compressor(self) -> Any:
+        if self._member[1] != DEFLATED:
+            return None
+        return zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    def _emit(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        if self.offset > _LIMIT:
+            raise ZipLimitExceeded("Archive exceeds 4 GiB")
+        return data
+
+    @property
+    def in_member(self) -> bool:
+        return self._member is not None
+
+    def start(self, name: str, method: int = DEFLATED) -> bytes:
+        """Open member ``name``; returns its local header."""
+        if self._member is not None:
+            raise RuntimeError("Previous member is still open")
+        if len(self._entries) >= 0xFFFF:
+            raise ZipLimitExceeded("Archive exceeds 65535 members")
+        encoded = name.encode()
+        # name, method, crc, compressed size, size, header offset
+        self._member = [name, method, 0, 0, 0, self.offset]
+        self._compressor = self._new_compressor()
+        return self._emit(_LOCAL_HEADER.pack(
+            0x04034B50, _VERSION, _FLAGS, method, *self._dos, 0, 0, 0, len(encoded), 0
+        ) + encoded)
+
+    def _output(self, data: bytes) -> bytes:
+        self._member[3] += len(data)
+        return self._emit(data)
+
+    def write(self, data: bytes) -> bytes:
+        """Add ``data`` to the open member; returns whatever output is ready."""
+        member = self._member
+        member[2] = zlib.crc32(data, member[2])
+        member[4] += len(data)
+        if member[4] > _LIMIT:
+            raise ZipLimitExceeded("Member exceeds 4 GiB")
+        if self._compressor is None:
+            return self._output(data)
+        return self._output(self._compressor.compress(data))
+
+    def flush(self) -> bytes:
+        """Drain the compressor to a point from which ``state`` can resume."""
+        if self._compressor is None:
+            return b""
+        return self._output(self._compressor.flush(zlib.Z_FULL_FLUSH))
+
+    def end(self) -> bytes:
+        """Close the open member; returns the rest of its data and its descriptor."""
+        tail = self._output(self._compressor.flush()) if self._compressor is not None else b""
+        name, method, crc, compressed, size, offset = self._member
+        self._entries.append(self._member)
+        self._member, self._compressor = None, None
+        return tail + self._emit(_DATA_DESCRIPTOR.pack(0x08074B50, crc, compressed, size))
+
+    def add(self, name: str, data: bytes, method: int = DEFLATED) -> bytes:
+        """Write a whole member at once."""
+        return self.start(name, method) + self.write(data) + self.end()
+
+    def finish(self) -> bytes:
+        """Write the central directory. The writer cannot be used afterwards."""
+        if self._member is not None:
+            raise RuntimeError("A member is still open")
+        directory = bytearray()
+        for name, method, crc, compressed, size, offset in self._entries:
+            encoded = name.encode()
+            directory += _CENTRAL_HEADER.pack(
+                0x02014B50, _MADE_BY, _VERSION, _FLAGS, method, *self._dos,
+                crc, compressed, size, len(encoded), 0, 0, 0, 0, _FILE_MODE, offset
+            ) + encoded
+        start = self.offset
+        count = len(self._entries)
+        return self._emit(bytes(directory) + _END_OF_CENTRAL_DIRECTORY.pack(
+            0x06054B50, 0, 0, count, count, len(directory), start, 0
+        ))
+
+    def state(self) -> dict[str, Any]:
+        """Resumable state; only valid straight after ``flush``, ``end`` or ``start``."""
+        return {
+            "offset": self.offset,
+            "dos": list(self._dos),
+            "entries": self._entries,
+            "member": self._member
+        }
@@ -1,15 +1,282 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence
+
+from fastapi import Request
+from sqlalchemy import CHAR, JSON, Table, func, make_url, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import JSONB, UUID as PG_UUID
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.types import TypeDecorator
 
 from app.config import get_settings
 
+logger = logging.getLogger(__name__)
+
 settings = get_settings()
 
-engine = create_async_engine(
-    settings.database_url,
-    echo=settings.debug,
-    pool_pre_ping=True,
-)
+
+class PoolMetrics:
+    """Connection checkouts and the time spent waiting for them, for one pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record(self, waited: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+class MeteredPool(AsyncAdaptedQueuePool):
+    """``AsyncAdaptedQueuePool`` that times each checkout, including connecting for overflow."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self) -> "MeteredPool":
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            entry = super()._do_get()
+        except PoolTimeout:
+            self.metrics.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - started)
+        return entry
+
+
+def _unique_statement_name() -> str:
+    return f"__asyncpg_{uuid.uuid4()}__"
+
+
+def make_engine(url: Optional[str] = None, **overrides: Any) -> AsyncEngine:
+    """An engine for ``url`` (default ``database_url``) with the pool and statement-cache settings.
+
+    ``overrides`` replace individual ``create_async_engine`` arguments.
+    """
+    url = make_url(url or settings.database_url)
+    options: dict[str, Any] = {
+        "echo": settings.debug,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "query_cache_size": settings.db_compiled_cache_size,
+    }
+    if url.get_backend_name() == "postgresql":
+        options.update(
+            poolclass=MeteredPool,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+        )
+    if url.get_driver_name() == "asyncpg":
+        if settings.db_pgbouncer:
+            # Statements are still compiled once by SQLAlchemy; only the server-side
+            # preparation is per use, under a name no other client can collide with
+            connect_args = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": _unique_statement_name,
+            }
+        else:
+            connect_args = {
+                "statement_cache_size": settings.db_statement_cache_size,
+                "prepared_statement_cache_size": settings.db_statement_cache_size,
+            }
+        options["connect_args"] = connect_args
+    options.update(overrides)
+    return create_async_engine(url, **options)
+
+
+def pool_stats(engine: AsyncEngine) -> dict[str, Any]:
+    """Point-in-time pool state plus checkout counters since start."""
+    pool = engine.pool
+    stats: dict[str, Any] = {"pool": type(pool).__name__}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        stats.update(
+            checkouts=metrics.checkouts,
+            timeouts=metrics.timeouts,
+            wait_seconds_mean=metrics.wait_seconds / metrics.checkouts if metrics.checkouts else 0.0,
+            wait_seconds_max=metrics.max_wait_seconds,
+        )
+    return stats
+
+
+def parse_lsn(value: str) -> int:
+    """A PostgreSQL LSN (``'16/B374D848'``) as an integer; raises ValueError."""
+    high, low = value.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+@dataclass
+class Replica:
+    url: str
+    engine: AsyncEngine
+    session_maker: async_sessionmaker
+    replayed: Optional[int] = None  # WAL position replayed as of the last check
+    in_rotation: bool = False
+
+
+class ReplicaSet:
+    """The primary and its read replicas, and which replicas are fit to read from.
+
+    Every ``check_seconds`` (lazily, from the request path) the primary's
+    current WAL position is sampled and each replica is asked how far it
+    has replayed. A replica stays in rotation while it has replayed at
+    least what the primary had written ``max_lag_seconds`` ago. Comparing
+    WAL positions, unlike ``pg_last_xact_replay_timestamp()``, does not
+    mistake an idle primary for a lagging replica. A replica that errors
+    or times out leaves rotation until a later check succeeds.
+
+    ``session_maker(min_lsn)`` picks a random replica in rotation that had
+    replayed ``min_lsn`` at its last check, and falls back to the primary.
+    The rotation is trusted for ``2 * check_seconds``. A write is therefore
+    on every replica in rotation within ``read_after_seconds``, which is
+    how long the read-your-writes cookie has to last.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        urls: Sequence[str] = (),
+        max_lag_seconds: Optional[float] = None,
+        check_seconds: Optional[float] = None
+    ):
+        self.primary = primary
+        self.primary_session_maker = async_sessionmaker(primary, class_=AsyncSession, expire_on_commit=False)
+        self.max_lag_seconds = max_lag_seconds or settings.replica_max_lag_seconds
+        self.check_seconds = check_seconds or settings.replica_check_seconds
+        self.replicas: list[Replica] = []
+        for url in urls:
+            replica_engine = make_engine(url)
+            self.replicas.append(Replica(
+                url=make_url(url).render_as_string(hide_password=True),
+                engine=replica_engine,
+                session_maker=async_sessionmaker(replica_engine, class_=AsyncSession, expire_on_commit=False)
+            ))
+        self._samples: deque[tuple[float, int]] = deque()
+        self._checked_at = float("-inf")
+        self._check: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    @property
+    def read_after_seconds(self) -> int:
+        return math.ceil(self.max_lag_seconds + 2 * self.check_seconds)
+
+    async def primary_lsn(self) -> int:
+        async with self.primary.connect() as conn:
+            return parse_lsn(await conn.scalar(select(func.pg_current_wal_lsn())))
+
+    async def _replayed(self, replica: Replica) -> Optional[int]:
+        async with replica.engine.connect() as conn:
+            value = await conn.scalar(select(func.pg_last_wal_replay_lsn()))
+        # NULL: the server is not replaying WAL, i.e. not a replica
+        return parse_lsn(value) if value is not None else None
+
+    async def check(self) -> None:
+        """Sample the primary and every replica, and update the rotation."""
+        now = time.monotonic()
+        self._samples.append((now, await asyncio.wait_for(self.primary_lsn(), self.max_lag_seconds)))
+        # Keep one sample at least max_lag old: the bar the replicas are held to
+        while len(self._samples) > 1 and self._samples[1][0] <= now - self.max_lag_seconds:
+            self._samples.popleft()
+        required = self._samples[0][1]
+
+        results = await asyncio.gather(
+            *(asyncio.wait_for(self._replayed(replica), self.max_lag_seconds) for replica in self.replicas),
+            return_exceptions=True
+        )
+        for replica, result in zip(self.replicas, results):
+            if isinstance(result, BaseException):
+                replica.replayed, fit = None, False
+                reason = f"check failed: {result!r}"
+            else:
+                replica.replayed = result
+                fit = result is not None and result >= required
+                reason = "not in recovery" if result is None else f"{required - result} bytes behind"
+            if replica.in_rotation and not fit:
+                logger.warning("replica %s out of rotation: %s", replica.url, reason)
+            elif fit and not replica.in_rotation:
+                logger.info("replica %s in rotation", replica.url)
+            replica.in_rotation = fit
+        self._checked_at = now
+
+    def _refresh(self) -> None:
+        if time.monotonic() - self._checked_at < self.check_seconds:
+            return
+        if self._check is not None and not self._check.done():
+            return
+        self._check = asyncio.create_task(self._run_check())
+
+    async def _run_check(self) -> None:
+        try:
+            await self.check()
+        except Exception as exc:
+            # Without a primary sample nothing can be judged: read from the primary
+            logger.warning("replica check failed: %r", exc)
+            for replica in self.replicas:
+                replica.in_rotation = False
+            self._checked_at = time.monotonic()
+
+    def session_maker(self, min_lsn: Optional[int] = None) -> async_sessionmaker:
+        """Sessions on a replica in rotation that has replayed ``min_lsn``, else on the primary."""
+        if not self.replicas:
+            return self.primary_session_maker
+        self._refresh()
+        if time.monotonic() - self._checked_at > 2 * self.check_seconds:
+            # The rotation is too old to vouch for (idle worker, slow check)
+            return self.primary_session_maker
+        candidates = [
+            replica for replica in self.replicas
+            if replica.in_rotation and (min_lsn is None or (replica.replayed or 0) >= min_lsn)
+        ]
+        if not candidates:
+            return self.primary_session_maker
+        return random.choice(candidates).session_maker
+
+    def stats(self) -> list[dict[str, Any]]:
+        # Position in database_replica_urls, not the URL: no hosts or database names
+        return [
+            {"replica": position, "in_rotation": replica.in_rotation, **pool_stats(replica.engine)}
+            for position, replica in enumerate(self.replicas)
+        ]
+
+
+engine = make_engine()
 
 async_session_maker = async_sessionmaker(
     engine,
@@ -17,14 +284,83 @@ async_session_maker = async_sessionmaker(
     expire_on_commit=False,
 )
 
+replicas = ReplicaSet(engine, settings.database_replica_urls)
+
 
 class Base(DeclarativeBase):
     pass
 
 
+class GUID(TypeDecorator):
+    """UUID column: native UUID on PostgreSQL, CHAR(36) elsewhere."""
+
+    impl = CHAR(36)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(PG_UUID(as_uuid=True))
+        return dialect.type_descriptor(CHAR(36))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == "postgresql":
+            return value
+        return str(value if isinstance(value, uuid.UUID) else uuid.UUID(str(value)))
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        return uuid.UUID(str(value))
+
+
+class JSONType(TypeDecorator):
+    """JSON column: JSONB on PostgreSQL, generic JSON elsewhere."""
+
+    impl = JSON
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(JSON())
+
+
+def upsert_insert(session: AsyncSession, table: Table):
+    """Dialect INSERT supporting ON CONFLICT (PostgreSQL in production, SQLite locally)."""
+    dialect = sqlite if session.bind.dialect.name == "sqlite" else postgresql
+    return dialect.insert(table)
+
+
 async def get_db() -> AsyncSession:
     async with async_session_maker() as session:
         try:
             yield session
         finally:
             await session.close()
+
+
+def read_after(request: Request) -> Optional[int]:
+    """The WAL position the client must see: its last write, from the ``replica_lsn_cookie`` (hex)."""
+    value = request.cookies.get(settings.replica_lsn_cookie)
+    if not value:
+        return None
+    try:
+        return int(value, 16)
+    except ValueError:
+        return None
+
+
+async def get_read_db(request: Request) -> AsyncSession:
+    """Session for read-only routes. Uses a replica that has caught up with
+    the caller's last write when there is one, else the primary. A route
+    can ask for the primary by setting ``request.state.read_primary``.
+    """
+    if getattr(request.state, "read_primary", False):
+        session_maker = replicas.primary_session_maker
+    else:
+        session_maker = replicas.session_maker(read_after(request))
+    async with session_maker() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
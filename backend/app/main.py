@@ -1,17 +1,41 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import get_settings
-from app.api.v1 import auth, users, health, appointments, messages, records, gdpr
+from app.api.deps import require_scope
+from app.api.middleware import ReadYourWritesMiddleware
+from app.database import engine, pool_stats, replicas
+from app.api.v1 import auth, users, health, appointments, messages, medications, records, gdpr, events, admin
+from app.services.drug_dictionary import load_drug_dictionary
+from app.services.jobs import run_in_process
 
 settings = get_settings()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Compile/open the medication dictionary off the event loop before serving
+    await load_drug_dictionary()
+    jobs = None
+    if settings.job_runner == "inprocess":
+        # Single-node deployments: exports and erasures run in the API process
+        jobs = asyncio.create_task(run_in_process())
+    yield
+    if jobs is not None:
+        jobs.cancel()
+        await asyncio.gather(jobs, return_exceptions=True)
+
+
 app = FastAPI(
     title=settings.app_name,
     description="Patient-facing API for Stratosphere EMR BD",
     version="1.0.0",
     docs_url="/docs" if settings.debug else None,
     redoc_url="/redoc" if settings.debug else None,
+    lifespan=lifespan,
 )
 
 # CORS
@@ -23,14 +47,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Read replicas: clients read their own writes
+app.add_middleware(ReadYourWritesMiddleware)
+
 # API Routes
 app.include_router(auth.router, prefix=f"{settings.api_v1_prefix}/auth", tags=["Authentication"])
 app.include_router(users.router, prefix=f"{settings.api_v1_prefix}/users", tags=["Users"])
 app.include_router(health.router, prefix=f"{settings.api_v1_prefix}/health", tags=["Health"])
 app.include_router(appointments.router, prefix=f"{settings.api_v1_prefix}/appointments", tags=["Appointments"])
+app.include_router(medications.router, prefix=f"{settings.api_v1_prefix}/medications", tags=["Medications"])
 app.include_router(messages.router, prefix=f"{settings.api_v1_prefix}/messages", tags=["Messages"])
 app.include_router(records.router, prefix=f"{settings.api_v1_prefix}/records", tags=["Medical Records"])
 app.include_router(gdpr.router, prefix=f"{settings.api_v1_prefix}/gdpr", tags=["GDPR"])
+app.include_router(events.router, prefix=f"{settings.api_v1_prefix}/events", tags=["Events"])
+app.include_router(admin.router, prefix=f"{settings.api_v1_prefix}/admin", tags=["Admin"])
 
 
 @app.get("/health")
@@ -38,6 +68,11 @@ async def health_check():
     return {"status": "healthy", "service": settings.app_name}
 
 
+@app.get("/health/db-pool", dependencies=[Depends(require_scope("ops:read"))])
+async def db_pool_stats():
+    return {**pool_stats(engine), "replicas": replicas.stats()}
+
+
 @app.get("/")
 async def root():
     return {
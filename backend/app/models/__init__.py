@@ -1,20 +1,42 @@
-from app.models.user import User
+from app.models.user import User, UserKey
 from app.models.health_record import HealthMeasurement, Symptom
 from app.models.appointment import Appointment
-from app.models.message import Message, MessageAttachment
+from app.models.message import Message, MessageAttachment, MessageSearchToken
 from app.models.consent import ConsentRecord, DataRequest
 from app.models.audit_log import AuditLog
 from app.models.device import Device
+from app.models.clinic_sync import ClinicSyncCursor
+from app.models.blob import StoredBlob
+from app.models.outbox import ClinicOutbox
+from app.models.clinician import Clinician, ClinicianSession, ClinicianException
+from app.models.document import Document, DocumentPreview
+from app.models.medication import PatientMedication, MedicationAdherence
+from app.models.session import Session
+from app.models.notification import Notification
 
 __all__ = [
     "User",
+    "UserKey",
     "HealthMeasurement",
     "Symptom",
     "Appointment",
     "Message",
     "MessageAttachment",
+    "MessageSearchToken",
     "ConsentRecord",
     "DataRequest",
     "AuditLog",
     "Device",
+    "ClinicSyncCursor",
+    "StoredBlob",
+    "ClinicOutbox",
+    "Clinician",
+    "ClinicianSession",
+    "ClinicianException",
+    "Document",
+    "DocumentPreview",
+    "PatientMedication",
+    "MedicationAdherence",
+    "Session",
+    "Notification",
 ]
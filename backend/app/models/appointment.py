@@ -1,16 +1,19 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, LargeBinary, Integer, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import DDL, Column, String, DateTime, LargeBinary, Integer, ForeignKey, Index, event, func, text
+from sqlalchemy.dialects.postgresql import ExcludeConstraint, UUID
 from app.database import Base
 
+# Statuses that hold a clinician's time; everything else frees the slot
+BLOCKING_STATUSES = ("requested", "confirmed")
+
 
 class Appointment(Base):
     __tablename__ = "appointments"
-
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     clinic_appointment_id = Column(UUID(as_uuid=True), nullable=True)
+    clinician_id = Column(UUID(as_uuid=True), ForeignKey("clinicians.id"), nullable=True)
     
     appointment_type = Column(String(50), nullable=False)  # routine, follow_up, urgent, phone, video
     status = Column(String(20), default="requested")  # requested, confirmed, cancelled, completed, no_show
@@ -24,3 +27,28 @@ class Appointment(Base):
     
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # Availability: a clinician's bookings in a date window
+        Index("ix_appointments_clinician_scheduled", "clinician_id", "scheduled_at"),
+        # Availability refresh: bookings changed since the last load
+        Index("ix_appointments_updated_at", "updated_at"),
+        # Reminders: live appointments entering a reminder window
+        Index("ix_appointments_status_scheduled", "status", "scheduled_at"),
+        # No two live bookings may overlap for the same clinician
+        ExcludeConstraint(
+            (clinician_id, "="),
+            (func.tsrange(scheduled_at, scheduled_at + func.make_interval(0, 0, 0, 0, 0, duration_minutes)), "&&"),
+            name="ex_appointments_clinician_slot",
+            using="gist",
+            where=text("status IN ('requested', 'confirmed')"),
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+# The exclusion constraint compares UUIDs with = inside a GiST index
+event.listen(
+    Appointment.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"),
+)
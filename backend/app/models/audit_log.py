@@ -1,12 +1,23 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, Text
+from sqlalchemy import Column, String, DateTime, Text, Index
 from sqlalchemy.dialects.postgresql import UUID, INET, JSONB
 from app.database import Base
 
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        # Rows arrive in created_at order, so a block-range index covers time
+        # ranges at a tiny fraction of a btree's size
+        Index(
+            "ix_audit_logs_created_at_brin", "created_at",
+            postgresql_using="brin", postgresql_with={"pages_per_range": 32}
+        ),
+        # Compliance queries by account or address, read in time order
+        Index("ix_audit_logs_user_created", "user_id", "created_at", "id"),
+        Index("ix_audit_logs_ip_created", "ip_address", "created_at", "id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), nullable=True)  # Can be null for system actions
@@ -20,4 +31,4 @@ class AuditLog(Base):
     
     details = Column(JSONB, nullable=True)
     
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,51 @@
+"""Content-addressed blob storage model."""
+import uuid
+from datetime import datetime
+
+from sqlalchemy import String, DateTime, ForeignKey, LargeBinary, Integer, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base, GUID
+
+
+class StoredBlob(Base):
+    """An encrypted object in storage, shared by every reference to the same content.
+
+    Blobs are addressed by a keyed hash of their plaintext within one user's
+    scope, so identical files a patient uploads repeatedly are stored once
+    without revealing matches across users.
+    """
+
+    __tablename__ = "stored_blobs"
+    __table_args__ = (
+        UniqueConstraint("user_id", "content_hash", name="uq_stored_blobs_user_hash"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        GUID(),
+        primary_key=True,
+        default=uuid.uuid4
+    )
+
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        GUID(),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False
+    )
+
+    # HMAC-SHA256 of the plaintext under a per-user key (hex)
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+
+    storage_key_encrypted: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    # Number of MessageAttachment / Document rows pointing at this blob
+    ref_count: Mapped[int] = mapped_column(Integer, nullable=False, default=1, index=True)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=datetime.utcnow
+    )
+
+    def __repr__(self) -> str:
+        return f"<StoredBlob {self.content_hash[:12]} refs={self.ref_count}>"
@@ -0,0 +1,42 @@
+"""Clinic EMR sync state."""
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base, GUID
+
+
+class ClinicSyncCursor(Base):
+    """Per-patient, per-resource position in the clinic EMR change feed."""
+
+    __tablename__ = "clinic_sync_cursors"
+    __table_args__ = (
+        UniqueConstraint("user_id", "resource", name="uq_clinic_sync_cursors_user_resource"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        GUID(),
+        primary_key=True,
+        default=uuid.uuid4
+    )
+
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        GUID(),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False
+    )
+
+    # Resource feed: medications, documents
+    resource: Mapped[str] = mapped_column(String(50), nullable=False)
+
+    # Opaque EMR cursor passed back as ?since= and the ETag of the last page
+    cursor: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    etag: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+
+    last_synced_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<ClinicSyncCursor {self.resource} for {self.user_id} at {self.cursor}>"
@@ -0,0 +1,85 @@
+"""Clinician rota models used for appointment availability."""
+import uuid
+from datetime import date, datetime, time
+from typing import Optional
+
+from sqlalchemy import Boolean, Date, DateTime, ForeignKey, Index, SmallInteger, String, Time
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base, GUID, JSONType
+
+
+class Clinician(Base):
+    """A clinician patients can book with."""
+
+    __tablename__ = "clinicians"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        GUID(),
+        primary_key=True,
+        default=uuid.uuid4
+    )
+    clinic_clinician_id: Mapped[Optional[uuid.UUID]] = mapped_column(GUID(), nullable=True, unique=True)
+    display_name: Mapped[str] = mapped_column(String(255), nullable=False)
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+
+    def __repr__(self) -> str:
+        return f"<Clinician {self.display_name}>"
+
+
+class ClinicianSession(Base):
+    """Recurring weekly session template, in clinic local time."""
+
+    __tablename__ = "clinician_sessions"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        GUID(),
+        primary_key=True,
+        default=uuid.uuid4
+    )
+    clinician_id: Mapped[uuid.UUID] = mapped_column(
+        GUID(),
+        ForeignKey("clinicians.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True
+    )
+
+    # 0 = Monday ... 6 = Sunday
+    weekday: Mapped[int] = mapped_column(SmallInteger, nullable=False)
+    start_time: Mapped[time] = mapped_column(Time, nullable=False)
+    end_time: Mapped[time] = mapped_column(Time, nullable=False)
+
+    # Appointment types bookable in this session; null means all types
+    appointment_types: Mapped[Optional[list]] = mapped_column(JSONType, nullable=True)
+
+    valid_from: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
+    valid_until: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<ClinicianSession {self.weekday} {self.start_time}-{self.end_time}>"
+
+
+class ClinicianException(Base):
+    """A period a clinician is unavailable (leave, training), in UTC."""
+
+    __tablename__ = "clinician_exceptions"
+    __table_args__ = (
+        Index("ix_clinician_exceptions_clinician_range", "clinician_id", "starts_at", "ends_at"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        GUID(),
+        primary_key=True,
+        default=uuid.uuid4
+    )
+    clinician_id: Mapped[uuid.UUID] = mapped_column(
+        GUID(),
+        ForeignKey("clinicians.id", ondelete="CASCADE"),
+        nullable=False
+    )
+    starts_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    ends_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    reason: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<ClinicianException {self.starts_at}-{self.ends_at}>"
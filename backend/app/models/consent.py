@@ -1,8 +1,8 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, LargeBinary, Boolean, Text, ForeignKey
+from sqlalchemy import Column, String, DateTime, LargeBinary, Boolean, Text, ForeignKey, Integer, BigInteger, Index
 from sqlalchemy.dialects.postgresql import UUID, INET
-from app.database import Base
+from app.database import Base, JSONType
 
 
 class ConsentRecord(Base):
@@ -26,12 +26,18 @@ class ConsentRecord(Base):
 
 class DataRequest(Base):
     __tablename__ = "data_requests"
+    __table_args__ = (
+        # Job pickup: pending requests, and processing ones whose lease ran out
+        Index("ix_data_requests_due", "request_type", "status", "locked_until"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # Null once an erasure has removed the user; the erasure request itself is kept as the record
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
     
     request_type = Column(String(50), nullable=False)  # export, delete, rectify
-    status = Column(String(20), default="pending")  # pending, processing, completed, rejected
+    status = Column(String(20), default="pending")  # pending, processing, completed, rejected, failed, expired
+    options = Column(JSONType, nullable=True)  # e.g. DataExportRequest flags
     
     requested_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
@@ -40,3 +46,14 @@ class DataRequest(Base):
     download_expires_at = Column(DateTime, nullable=True)
     
     notes = Column(Text, nullable=True)
+
+    # Background job state
+    progress = Column(JSONType, nullable=True)
+    checkpoint_encrypted = Column(LargeBinary, nullable=True)  # where an interrupted job resumes
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    # Finished export: encrypted list of the stored pieces of the archive
+    result_encrypted = Column(LargeBinary, nullable=True)
+    result_size = Column(BigInteger, nullable=True)
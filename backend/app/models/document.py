@@ -3,7 +3,9 @@ import uuid
 from datetime import datetime, date
 from typing import Optional
 
-from sqlalchemy import String, DateTime, Date, ForeignKey, LargeBinary, Boolean, Integer
+from sqlalchemy import (
+    String, DateTime, Date, ForeignKey, LargeBinary, Boolean, Integer, Index, UniqueConstraint
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base, GUID
@@ -13,6 +15,10 @@ class Document(Base):
     """Model for patient documents (prescriptions, test results, letters)."""
 
     __tablename__ = "documents"
+    __table_args__ = (
+        UniqueConstraint("user_id", "clinic_document_id", name="uq_documents_clinic_id"),
+        Index("ix_documents_user_content_key", "user_id", "content_key"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
         GUID(),
@@ -38,12 +44,21 @@ class Document(Base):
     s3_key_encrypted: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
     file_type: Mapped[str] = mapped_column(String(100), nullable=False)
     file_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    blob_id: Mapped[Optional[uuid.UUID]] = mapped_column(
+        GUID(),
+        ForeignKey("stored_blobs.id"),
+        nullable=True,
+        index=True
+    )
+    # Hash of the file content; documents with identical content share a preview
+    content_key: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
 
     # Date info
     issued_at: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
 
     # Sync status
     synced_from_clinic: Mapped[bool] = mapped_column(Boolean, default=False)
+    clinic_document_id: Mapped[Optional[uuid.UUID]] = mapped_column(GUID(), nullable=True)
 
     # Timestamps
     created_at: Mapped[datetime] = mapped_column(
@@ -56,3 +71,41 @@ class Document(Base):
 
     def __repr__(self) -> str:
         return f"<Document {self.title}>"
+
+
+class DocumentPreview(Base):
+    """Encrypted first-page preview image, cached per user by content hash."""
+
+    __tablename__ = "document_previews"
+    __table_args__ = (
+        UniqueConstraint("user_id", "content_key", name="uq_document_previews_content"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        GUID(),
+        primary_key=True,
+        default=uuid.uuid4
+    )
+
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        GUID(),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False
+    )
+    content_key: Mapped[str] = mapped_column(String(64), nullable=False)
+
+    # Status: ready, failed (unsupported or unrenderable source; not retried)
+    status: Mapped[str] = mapped_column(String(20), nullable=False)
+    storage_key_encrypted: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    media_type: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    size: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    width: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    height: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=datetime.utcnow
+    )
+
+    def __repr__(self) -> str:
+        return f"<DocumentPreview {self.content_key[:12]} {self.status}>"
@@ -3,7 +3,7 @@ import uuid
 from datetime import datetime, date
 from typing import Optional
 
-from sqlalchemy import String, DateTime, Date, ForeignKey, LargeBinary, Boolean
+from sqlalchemy import String, DateTime, Date, ForeignKey, LargeBinary, Boolean, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base, GUID, JSONType
@@ -13,6 +13,9 @@ class PatientMedication(Base):
     """Model for patient medications and tracking."""
 
     __tablename__ = "patient_medications"
+    __table_args__ = (
+        UniqueConstraint("user_id", "clinic_medication_id", name="uq_patient_medications_clinic_id"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
         GUID(),
@@ -29,6 +32,8 @@ class PatientMedication(Base):
 
     # Medication info
     medication_name: Mapped[str] = mapped_column(String(255), nullable=False)
+    # Dictionary (dm+d / RxNorm) code, when the name matched the medication dictionary
+    medication_code: Mapped[Optional[str]] = mapped_column(String(50), nullable=True, index=True)
     dosage: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
     frequency: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
     instructions_encrypted: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
@@ -42,8 +47,12 @@ class PatientMedication(Base):
     reminder_enabled: Mapped[bool] = mapped_column(Boolean, default=False)
     reminder_times: Mapped[Optional[dict]] = mapped_column(JSONType, nullable=True)  # ["08:00", "20:00"]
 
+    # Interaction screening against the patient's other active medications
+    interaction_warnings: Mapped[Optional[list]] = mapped_column(JSONType, nullable=True)
+
     # Sync status
     synced_from_clinic: Mapped[bool] = mapped_column(Boolean, default=False)
+    clinic_medication_id: Mapped[Optional[uuid.UUID]] = mapped_column(GUID(), nullable=True)
 
     # Timestamps
     created_at: Mapped[datetime] = mapped_column(
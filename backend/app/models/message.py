@@ -1,12 +1,16 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, LargeBinary, Boolean, Integer, ForeignKey
+from sqlalchemy import Column, String, DateTime, LargeBinary, Boolean, Integer, ForeignKey, Index, PrimaryKeyConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from app.database import Base
 
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Inbox aggregation: one user's messages grouped by thread in time order
+        Index("ix_messages_user_thread_created", "user_id", "thread_id", "created_at"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -18,7 +22,7 @@ class Message(Base):
     parent_message_id = Column(UUID(as_uuid=True), ForeignKey("messages.id"), nullable=True)
     thread_id = Column(UUID(as_uuid=True), nullable=True)
     
-    status = Column(String(20), default="sent")  # draft, sent, delivered, read
+    status = Column(String(20), default="sent")  # draft, queued, sent, delivered, failed, read
     read_at = Column(DateTime, nullable=True)
     has_attachments = Column(Boolean, default=False)
     
@@ -34,4 +38,19 @@ class MessageAttachment(Base):
     file_type = Column(String(100), nullable=False)
     file_size = Column(Integer, nullable=False)
     s3_key_encrypted = Column(LargeBinary, nullable=False)
+    blob_id = Column(UUID(as_uuid=True), ForeignKey("stored_blobs.id"), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class MessageSearchToken(Base):
+    """Blind index entry: a keyed hash of one normalised word in a message."""
+    __tablename__ = "message_search_tokens"
+    __table_args__ = (
+        # Leading (user_id, token) serves lookups; message_id makes entries unique
+        PrimaryKeyConstraint("user_id", "token", "message_id"),
+        Index("ix_message_search_tokens_message", "message_id"),
+    )
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    token = Column(LargeBinary(16), nullable=False)
+    message_id = Column(UUID(as_uuid=True), ForeignKey("messages.id", ondelete="CASCADE"), nullable=False)
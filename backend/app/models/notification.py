@@ -37,6 +37,9 @@ class Notification(Base):
     # Additional data for deep linking
     data: Mapped[Optional[dict]] = mapped_column(JSONType, nullable=True)
 
+    # Set by jobs that must not notify twice, e.g. one reminder per appointment and window
+    dedupe_key: Mapped[Optional[str]] = mapped_column(String(150), nullable=True, unique=True)
+
     # Read status
     read: Mapped[bool] = mapped_column(Boolean, default=False, index=True)
     read_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -52,3 +55,4 @@ class Notification(Base):
 
     def __repr__(self) -> str:
         return f"<Notification {self.notification_type}: {self.title}>"
+
@@ -0,0 +1,57 @@
+"""Transactional outbox for deliveries to the clinic EMR."""
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, Integer, LargeBinary, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base, GUID
+
+
+class ClinicOutbox(Base):
+    """A pending delivery, written in the same transaction as the row it describes."""
+
+    __tablename__ = "clinic_outbox"
+    __table_args__ = (
+        Index("ix_clinic_outbox_due", "status", "next_attempt_at"),
+        # Ordering check: is an earlier entry of this thread still pending?
+        Index("ix_clinic_outbox_thread", "thread_id", "status", "id"),
+    )
+
+    # Monotonic id gives delivery order within a thread
+    id: Mapped[int] = mapped_column(
+        BigInteger().with_variant(Integer, "sqlite"),
+        primary_key=True,
+        autoincrement=True
+    )
+
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        GUID(),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False
+    )
+    message_id: Mapped[uuid.UUID] = mapped_column(
+        GUID(),
+        ForeignKey("messages.id", ondelete="CASCADE"),
+        nullable=False
+    )
+    thread_id: Mapped[uuid.UUID] = mapped_column(GUID(), nullable=False)
+
+    # Encrypted JSON body sent to the EMR
+    payload_encrypted: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+    # Status: pending, delivered, failed
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=datetime.utcnow
+    )
+    delivered_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<ClinicOutbox {self.id} {self.status} attempts={self.attempts}>"
@@ -1,7 +1,8 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Boolean, DateTime, LargeBinary
+from sqlalchemy import Column, String, Boolean, DateTime, Integer, SmallInteger, LargeBinary, ForeignKey
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
 from app.database import Base
 
 
@@ -33,9 +34,30 @@ class User(Base):
     gdpr_consent_date = Column(DateTime, nullable=True)
     data_processing_consent = Column(Boolean, default=False)
     marketing_consent = Column(Boolean, default=False)
+    # Current consents reduced from ConsentRecord, one bit per type (app.services.consent)
+    consent_bits = Column(SmallInteger, nullable=False, default=0, server_default="0")
+
+    # Calendar feed: bumping this revokes every previously issued feed URL
+    calendar_feed_generation = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Metadata
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_login_at = Column(DateTime, nullable=True)
     deleted_at = Column(DateTime, nullable=True)
+
+    # Rows go with the user through ON DELETE CASCADE, not through the ORM
+    documents = relationship("Document", back_populates="user", passive_deletes=True)
+    medications = relationship("PatientMedication", back_populates="user", passive_deletes=True)
+    sessions = relationship("Session", back_populates="user", passive_deletes=True)
+    notifications = relationship("Notification", back_populates="user", passive_deletes=True)
+
+
+class UserKey(Base):
+    """Per-user owner key for stored blobs; deleting the row crypto-shreds them."""
+
+    __tablename__ = "user_keys"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    key_encrypted = Column(LargeBinary, nullable=False)  # wrapped with the master key
+    created_at = Column(DateTime, default=datetime.utcnow)
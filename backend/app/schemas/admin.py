@@ -0,0 +1,24 @@
+"""Staff-only schemas."""
+from typing import Any, Optional, List
+from datetime import datetime
+from uuid import UUID
+from pydantic import BaseModel
+
+
+class AuditLogEntry(BaseModel):
+    """One audit log row."""
+    id: UUID
+    created_at: datetime
+    user_id: Optional[UUID] = None
+    action: str
+    resource_type: Optional[str] = None
+    resource_id: Optional[UUID] = None
+    ip_address: Optional[str] = None
+    user_agent: Optional[str] = None
+    details: Optional[dict[str, Any]] = None
+
+
+class AuditLogPage(BaseModel):
+    """A page of audit log entries, oldest first."""
+    entries: List[AuditLogEntry]
+    next_cursor: Optional[str] = None
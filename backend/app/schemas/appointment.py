@@ -12,6 +12,11 @@ class AppointmentCreate(BaseModel):
         description="Type: routine, follow_up, urgent, phone, video"
     )
     preferred_date: Optional[datetime] = None
+    scheduled_at: Optional[datetime] = Field(
+        default=None,
+        description="Start of an offered slot; omit to request an appointment without one"
+    )
+    clinician_id: Optional[UUID] = None
     reason: str = Field(..., min_length=10, max_length=500)
     notes: Optional[str] = None
 
@@ -38,6 +43,7 @@ class AppointmentResponse(BaseModel):
     id: UUID
     appointment_type: str
     status: str
+    clinician_id: Optional[UUID] = None
     scheduled_at: Optional[datetime]
     duration_minutes: int
     reason: Optional[str]
@@ -52,4 +58,21 @@ class AvailableSlot(BaseModel):
     date: datetime
     duration_minutes: int
     slot_type: str  # morning, afternoon, evening
+    clinician_id: Optional[UUID] = None
     available: bool = True
+
+
+class AvailableSlotList(BaseModel):
+    """Available slots response schema."""
+    slots: List[AvailableSlot]
+
+
+class SlotConflict(BaseModel):
+    """Returned with 409 when a slot was taken; offers alternatives."""
+    detail: str
+    alternatives: List[AvailableSlot]
+
+
+class CalendarFeedResponse(BaseModel):
+    """Calendar subscription URL; treat it like a password."""
+    url: str
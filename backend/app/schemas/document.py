@@ -0,0 +1,34 @@
+"""Document schemas."""
+from typing import Optional
+from datetime import datetime, date
+from uuid import UUID
+from pydantic import BaseModel, ConfigDict
+
+
+class DocumentResponse(BaseModel):
+    """Document metadata response schema."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: UUID
+    document_type: str
+    title: str
+    description: Optional[str]
+    file_type: str
+    file_size: int
+    issued_at: Optional[date]
+    synced_from_clinic: bool
+    has_preview: bool = False
+    created_at: datetime
+
+
+class ClinicSyncResult(BaseModel):
+    """Outcome of one clinic sync feed."""
+    model_config = ConfigDict(from_attributes=True)
+
+    resource: str
+    pages: int
+    fetched: int
+    upserted: int
+    not_modified: bool
+    elapsed_ms: float
+    error: Optional[str] = None
@@ -1,5 +1,5 @@
 """GDPR-related schemas."""
-from typing import Optional, List
+from typing import Any, Optional, List
 from datetime import datetime
 from uuid import UUID
 from pydantic import BaseModel, ConfigDict
@@ -50,6 +50,8 @@ class DataExportResponse(BaseModel):
     completed_at: Optional[datetime]
     download_url: Optional[str]
     download_expires_at: Optional[datetime]
+    progress: Optional[dict[str, Any]] = None
+    size: Optional[int] = None
 
 
 class AuditLogResponse(BaseModel):
@@ -68,3 +70,16 @@ class DataDeletionRequest(BaseModel):
     confirm_email: str
     reason: Optional[str] = None
     confirm_deletion: bool = False
+
+    def confirms(self, email: str) -> bool:
+        """Whether the caller ticked the confirmation and typed the account's email."""
+        return self.confirm_deletion and self.confirm_email.strip().lower() == email.lower()
+
+
+class DataDeletionResponse(BaseModel):
+    """Erasure request response schema."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: UUID
+    status: str
+    requested_at: datetime
@@ -2,12 +2,13 @@
 from typing import Optional, List
 from datetime import datetime, date
 from uuid import UUID
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, field_validator
 
 
 class MedicationCreate(BaseModel):
     """Create medication schema."""
     medication_name: str = Field(..., min_length=1, max_length=255)
+    medication_code: Optional[str] = Field(None, max_length=50, description="Dictionary code from search")
     dosage: Optional[str] = None
     frequency: Optional[str] = None
     instructions: Optional[str] = None
@@ -27,12 +28,21 @@ class MedicationUpdate(BaseModel):
     reminder_times: Optional[List[str]] = None
 
 
+class InteractionWarning(BaseModel):
+    """Interaction with another of the patient's active medications."""
+    medication_code: str
+    medication_name: str
+    severity: str  # contraindicated, major, moderate, minor
+    description: str
+
+
 class MedicationResponse(BaseModel):
     """Medication response schema."""
     model_config = ConfigDict(from_attributes=True)
 
     id: UUID
     medication_name: str
+    medication_code: Optional[str] = None
     dosage: Optional[str]
     frequency: Optional[str]
     instructions: Optional[str]
@@ -42,9 +52,24 @@ class MedicationResponse(BaseModel):
     reminder_enabled: bool
     reminder_times: Optional[List[str]]
     synced_from_clinic: bool
+    interaction_warnings: List[InteractionWarning] = []
     created_at: datetime
     updated_at: datetime
 
+    @field_validator("interaction_warnings", mode="before")
+    @classmethod
+    def default_warnings(cls, v: Optional[list]) -> list:
+        """Rows that were never screened have no warnings."""
+        return v or []
+
+
+class MedicationSearchResult(BaseModel):
+    """Medication dictionary search result."""
+    model_config = ConfigDict(from_attributes=True)
+
+    code: str
+    name: str
+
 
 class MedicationAdherenceCreate(BaseModel):
     """Create medication adherence log schema."""
@@ -12,6 +12,11 @@ class MessageCreate(BaseModel):
     parent_message_id: Optional[UUID] = None
 
 
+class MessageReply(BaseModel):
+    """Reply to an existing thread."""
+    body: str = Field(..., min_length=1, max_length=5000)
+
+
 class MessageAttachmentResponse(BaseModel):
     """Message attachment response schema."""
     model_config = ConfigDict(from_attributes=True)
@@ -47,3 +52,9 @@ class MessageThreadResponse(BaseModel):
     last_message_at: datetime
     unread_count: int
     messages: List[MessageResponse] = []
+
+
+class MessageThreadPage(BaseModel):
+    """A page of inbox threads, newest activity first."""
+    threads: List[MessageThreadResponse]
+    next_cursor: Optional[str] = None
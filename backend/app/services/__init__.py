@@ -0,0 +1 @@
+"""Business logic and data-access services."""
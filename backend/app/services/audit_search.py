@@ -0,0 +1,170 @@
+"""Audit log search for compliance reviews.
+
+Results are ordered by ``(created_at, id)`` and paged with a keyset cursor,
+so page N costs the same as page 1 however many years the range spans.
+
+A search by account or single IP address reads its btree
+(``ix_audit_logs_user_created`` / ``ix_audit_logs_ip_created``) in order
+and stops at the page size. A btree cannot answer a network containment
+(``<<=``) test, so a CIDR filter does not count. Any other search relies on the BRIN index on
+``created_at``. BRIN finds the blocks of a time range but cannot return
+them sorted, so one query over years would sort everything before
+returning the first row. Such searches scan the range in time slices
+instead. A slice starts at ``audit_scan_window_minutes`` and doubles while
+slices come back short of a page. A page therefore needs a handful of
+small sorts, even when the filter (a rare action, say) is sparse.
+
+``stream`` returns the same rows as NDJSON through a series of short
+keyset queries. No transaction or cursor is held open while a large
+export drains to the client.
+"""
+import ipaddress
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Iterator, Optional, Union
+from uuid import UUID
+
+import orjson
+from sqlalchemy import Row, Table, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import get_settings
+from app.models.audit_log import AuditLog
+from app.services.inbox import decode_cursor, encode_cursor
+
+settings = get_settings()
+
+audit_table: Table = AuditLog.__table__
+
+IPFilter = Union[ipaddress.IPv4Address, ipaddress.IPv6Address, ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_ip_filter(value: str) -> IPFilter:
+    """An address, or a network in CIDR notation; raises ValueError."""
+    return ipaddress.ip_network(value, strict=False) if "/" in value else ipaddress.ip_address(value)
+
+
+@dataclass(frozen=True)
+class AuditQuery:
+    """Filters for one search; ``starts_at`` inclusive, ``ends_before`` exclusive."""
+    starts_at: datetime
+    ends_before: datetime
+    user_id: Optional[UUID] = None
+    ip_address: Optional[IPFilter] = None
+    action: Optional[str] = None
+    resource_type: Optional[str] = None
+
+    @property
+    def indexed(self) -> bool:
+        """Whether a btree narrows the search before the time range does."""
+        return self.user_id is not None or isinstance(
+            self.ip_address, (ipaddress.IPv4Address, ipaddress.IPv6Address)
+        )
+
+    def conditions(self) -> list[Any]:
+        conditions = []
+        if self.user_id is not None:
+            conditions.append(audit_table.c.user_id == self.user_id)
+        if isinstance(self.ip_address, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            # inet <<= cidr: contained in or equal to the network
+            conditions.append(audit_table.c.ip_address.op("<<=")(str(self.ip_address)))
+        elif self.ip_address is not None:
+            conditions.append(audit_table.c.ip_address == str(self.ip_address))
+        if self.action is not None:
+            conditions.append(audit_table.c.action == self.action)
+        if self.resource_type is not None:
+            conditions.append(audit_table.c.resource_type == self.resource_type)
+        return conditions
+
+
+def _columns() -> list[Any]:
+    return [
+        audit_table.c.id,
+        audit_table.c.created_at,
+        audit_table.c.user_id,
+        audit_table.c.action,
+        audit_table.c.resource_type,
+        audit_table.c.resource_id,
+        audit_table.c.ip_address,
+        audit_table.c.user_agent,
+        audit_table.c.details
+    ]
+
+
+def _slices(query: AuditQuery, starts_at: datetime) -> Iterator[tuple[datetime, datetime]]:
+    """Time slices from ``starts_at`` to the end of the range, each twice as wide as the last.
+
+    A page only moves on to the next slice when the previous one came back
+    short, so the widening is what keeps sparse filters to a few queries.
+    """
+    if query.indexed:
+        yield starts_at, query.ends_before
+        return
+    width = timedelta(minutes=settings.audit_scan_window_minutes)
+    low = starts_at
+    while low < query.ends_before:
+        high = min(low + width, query.ends_before)
+        yield low, high
+        width *= 2
+        low = high
+
+
+async def search(
+    db: AsyncSession,
+    query: AuditQuery,
+    limit: int,
+    cursor: Optional[str] = None
+) -> tuple[list[Row], Optional[str]]:
+    """One page of matching entries, oldest first, and the cursor for the next. Raises InvalidCursor."""
+    after: Optional[tuple[datetime, UUID]] = decode_cursor(cursor) if cursor else None
+    starts_at = max(query.starts_at, after[0]) if after else query.starts_at
+    rows: list[Row] = []
+
+    for low, high in _slices(query, starts_at):
+        statement = (
+            select(*_columns())
+            .where(
+                *query.conditions(),
+                audit_table.c.created_at >= low,
+                audit_table.c.created_at < high
+            )
+            .order_by(audit_table.c.created_at, audit_table.c.id)
+            .limit(limit + 1 - len(rows))
+        )
+        if after is not None:
+            statement = statement.where(tuple_(audit_table.c.created_at, audit_table.c.id) > tuple_(*after))
+        found = (await db.execute(statement)).all()
+        rows.extend(found)
+        if len(rows) > limit:
+            break
+
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(page[-1].created_at, page[-1].id)
+    return page, next_cursor
+
+
+def entry(row: Row) -> dict[str, Any]:
+    values = dict(row._mapping)
+    if values["ip_address"] is not None:
+        # asyncpg returns inet values as ipaddress objects
+        values["ip_address"] = str(values["ip_address"])
+    return values
+
+
+async def stream(
+    session_maker: async_sessionmaker,
+    query: AuditQuery,
+    batch_size: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Every matching entry as NDJSON, oldest first."""
+    batch_size = batch_size or settings.audit_stream_batch
+    cursor: Optional[str] = None
+    while True:
+        async with session_maker() as session:
+            rows, cursor = await search(session, query, batch_size, cursor)
+        if rows:
+            yield b"".join(orjson.dumps(entry(row), option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+        if cursor is None:
+            return
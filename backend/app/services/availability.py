@@ -0,0 +1,443 @@
+"""Appointment slot availability from clinician rotas and bookings.
+
+A day is 288 five-minute ticks held as one Python int per
+``(clinician, local day)``:
+
+* ``open``: ticks covered by the clinician's weekly session templates that
+  allow the appointment type. This is derived lazily and cached per
+  weekday and type.
+* ``blocked``: the OR of exception periods (leave, training) and every
+  blocking booking. Each booking's masks are kept by appointment id, so a
+  change only touches the days that booking covers.
+
+Free starts for a duration of ``n`` ticks are ``open & ~blocked`` reduced
+by the shift-AND doubling trick. After that, bit ``i`` is set iff ticks
+``i .. i+n-1`` are all free. The result is masked to a grid at multiples
+of the duration, so a day's slots cost a handful of big-int operations
+instead of a scan over bookings.
+
+``AvailabilityService`` owns one index per worker. It loads a window of
+days in four queries (clinicians, sessions, exceptions, bookings). It then applies changed appointments incrementally
+using ``updated_at``, and reloads everything when the template TTL expires.
+The TTL reload also picks up rota edits and hard-deleted rows.
+"""
+import asyncio
+import time as monotonic_time
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Iterable, Iterator, NamedTuple, Optional
+from uuid import UUID
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import Table, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import get_settings
+from app.database import async_session_maker
+from app.models.appointment import BLOCKING_STATUSES, Appointment
+from app.models.clinician import Clinician, ClinicianException, ClinicianSession
+
+settings = get_settings()
+
+appointments_table: Table = Appointment.__table__
+clinicians_table: Table = Clinician.__table__
+sessions_table: Table = ClinicianSession.__table__
+exceptions_table: Table = ClinicianException.__table__
+
+TICK_MINUTES = 5
+TICKS_PER_DAY = 24 * 60 // TICK_MINUTES
+
+# Changes committed just before the previous poll can carry an older updated_at
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+
+def duration_for(appointment_type: str) -> int:
+    return settings.appointment_durations.get(appointment_type, 15)
+
+
+def _ticks(minutes: int) -> int:
+    return -(-minutes // TICK_MINUTES)
+
+
+def _span_mask(start_tick: int, end_tick: int) -> int:
+    """Bits ``start_tick .. end_tick - 1``."""
+    if end_tick <= start_tick:
+        return 0
+    return ((1 << (end_tick - start_tick)) - 1) << start_tick
+
+
+@lru_cache(maxsize=64)
+def _grid_mask(step: int) -> int:
+    mask = 0
+    for tick in range(0, TICKS_PER_DAY, step):
+        mask |= 1 << tick
+    return mask
+
+
+def _run_starts(free: int, length: int) -> int:
+    """Bits ``i`` of ``free`` where ``length`` consecutive bits start."""
+    covered = 1
+    while covered < length and free:
+        shift = min(covered, length - covered)
+        free &= free >> shift
+        covered += shift
+    return free
+
+
+def slot_type(minute_of_day: int) -> str:
+    if minute_of_day < 12 * 60:
+        return "morning"
+    if minute_of_day < 17 * 60:
+        return "afternoon"
+    return "evening"
+
+
+_SLOT_TYPES = [slot_type(tick * TICK_MINUTES) for tick in range(TICKS_PER_DAY)]
+_TICK_OFFSETS = [timedelta(minutes=tick * TICK_MINUTES) for tick in range(TICKS_PER_DAY)]
+
+
+class Slot(NamedTuple):
+    """A bookable start; ``starts_at`` is naive UTC like ``Appointment.scheduled_at``."""
+    clinician_id: UUID
+    starts_at: datetime
+    duration_minutes: int
+    slot_type: str
+
+
+@dataclass(frozen=True)
+class _Session:
+    weekday: int
+    mask: int
+    types: Optional[frozenset[str]]
+    valid_from: Optional[date]
+    valid_until: Optional[date]
+
+
+class AvailabilityIndex:
+    """Per-day bitmaps of open and blocked time for a set of clinicians."""
+
+    def __init__(self, tz: Optional[ZoneInfo] = None):
+        self.tz = tz or ZoneInfo(settings.clinic_timezone)
+        self.clinicians: list[UUID] = []
+        self._sessions: dict[UUID, list[_Session]] = {}
+        self._open: dict[tuple[UUID, date, str], int] = {}
+        self._exceptions: dict[tuple[UUID, date], int] = {}
+        self._bookings: dict[UUID, tuple[UUID, list[tuple[date, int]]]] = {}
+        self._day_bookings: dict[tuple[UUID, date], dict[UUID, int]] = {}
+        self._blocked: dict[tuple[UUID, date], int] = {}
+
+    @classmethod
+    def build(
+        cls,
+        clinician_ids: Iterable[UUID],
+        sessions: Iterable[Any],
+        exceptions: Iterable[Any],
+        bookings: Iterable[Any],
+        tz: Optional[ZoneInfo] = None
+    ) -> "AvailabilityIndex":
+        """Index from rows shaped like the clinician, session, exception and appointment tables."""
+        index = cls(tz)
+        index.clinicians = list(clinician_ids)
+        for clinician_id in index.clinicians:
+            index._sessions[clinician_id] = []
+        for row in sessions:
+            start = row.start_time.hour * 60 + row.start_time.minute
+            end = row.end_time.hour * 60 + row.end_time.minute
+            index._sessions.setdefault(row.clinician_id, []).append(_Session(
+                weekday=row.weekday,
+                # Sessions ending at a partial tick lose that tick
+                mask=_span_mask(_ticks(start), end // TICK_MINUTES),
+                types=frozenset(row.appointment_types) if row.appointment_types else None,
+                valid_from=row.valid_from,
+                valid_until=row.valid_until
+            ))
+        for row in exceptions:
+            for day, mask in index._day_masks(row.starts_at, row.ends_at):
+                key = (row.clinician_id, day)
+                index._exceptions[key] = index._exceptions.get(key, 0) | mask
+                index._blocked[key] = index._blocked.get(key, 0) | mask
+        for row in bookings:
+            index.apply_booking(row)
+        return index
+
+    def _local(self, utc_naive: datetime) -> datetime:
+        return utc_naive.replace(tzinfo=timezone.utc).astimezone(self.tz)
+
+    def _utc(self, day: date, tick: int) -> datetime:
+        local = datetime.combine(day, time(), tzinfo=self.tz) + timedelta(minutes=tick * TICK_MINUTES)
+        return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+    def _day_masks(self, starts_at: datetime, ends_at: datetime) -> Iterator[tuple[date, int]]:
+        """Tick masks per local day covering a naive-UTC interval, rounded outward."""
+        start, end = self._local(starts_at), self._local(ends_at)
+        day = start.date()
+        while day <= end.date():
+            first = (start.hour * 60 + start.minute) // TICK_MINUTES if day == start.date() else 0
+            if day == end.date():
+                last = _ticks(end.hour * 60 + end.minute + (1 if end.second or end.microsecond else 0))
+            else:
+                last = TICKS_PER_DAY
+            mask = _span_mask(first, last)
+            if mask:
+                yield day, mask
+            day += timedelta(days=1)
+
+    def _rebuild_blocked(self, key: tuple[UUID, date]) -> None:
+        mask = self._exceptions.get(key, 0)
+        for booking_mask in self._day_bookings.get(key, {}).values():
+            mask |= booking_mask
+        if mask:
+            self._blocked[key] = mask
+        else:
+            self._blocked.pop(key, None)
+
+    def remove_booking(self, appointment_id: UUID) -> None:
+        previous = self._bookings.pop(appointment_id, None)
+        if previous is None:
+            return
+        clinician_id, days = previous
+        for day, _ in days:
+            key = (clinician_id, day)
+            day_bookings = self._day_bookings.get(key)
+            if day_bookings is not None:
+                day_bookings.pop(appointment_id, None)
+                if not day_bookings:
+                    del self._day_bookings[key]
+            self._rebuild_blocked(key)
+
+    def apply_booking(self, row: Any) -> None:
+        """Add, move or release one appointment row (id, clinician_id, status, scheduled_at, duration_minutes)."""
+        self.remove_booking(row.id)
+        if row.clinician_id is None or row.scheduled_at is None or row.status not in BLOCKING_STATUSES:
+            return
+        ends_at = row.scheduled_at + timedelta(minutes=row.duration_minutes or 15)
+        days = list(self._day_masks(row.scheduled_at, ends_at))
+        self._bookings[row.id] = (row.clinician_id, days)
+        for day, mask in days:
+            key = (row.clinician_id, day)
+            self._day_bookings.setdefault(key, {})[row.id] = mask
+            self._blocked[key] = self._blocked.get(key, 0) | mask
+
+    def open_mask(self, clinician_id: UUID, day: date, appointment_type: str) -> int:
+        key = (clinician_id, day, appointment_type)
+        mask = self._open.get(key)
+        if mask is None:
+            mask = 0
+            weekday = day.weekday()
+            for session in self._sessions.get(clinician_id, ()):
+                if (
+                    session.weekday == weekday
+                    and (session.types is None or appointment_type in session.types)
+                    and (session.valid_from is None or session.valid_from <= day)
+                    and (session.valid_until is None or day <= session.valid_until)
+                ):
+                    mask |= session.mask
+            self._open[key] = mask
+        return mask
+
+    def free_starts(
+        self,
+        clinician_id: UUID,
+        day: date,
+        appointment_type: str,
+        duration_minutes: int,
+        ignore: Optional[UUID] = None
+    ) -> int:
+        """Bitmap of grid-aligned ticks where a booking of ``duration_minutes`` fits.
+
+        ``ignore`` leaves one appointment's own time free, for rescheduling it.
+        """
+        key = (clinician_id, day)
+        blocked = self._blocked.get(key, 0)
+        day_bookings = self._day_bookings.get(key)
+        if ignore is not None and day_bookings and ignore in day_bookings:
+            blocked = self._exceptions.get(key, 0)
+            for appointment_id, booking_mask in day_bookings.items():
+                if appointment_id != ignore:
+                    blocked |= booking_mask
+        free = self.open_mask(clinician_id, day, appointment_type) & ~blocked
+        if not free:
+            return 0
+        length = _ticks(duration_minutes)
+        return _run_starts(free, length) & _grid_mask(length)
+
+    def is_free(
+        self,
+        clinician_id: UUID,
+        starts_at: datetime,
+        appointment_type: str,
+        duration_minutes: int,
+        ignore: Optional[UUID] = None
+    ) -> bool:
+        """Whether exactly this start is offered as a slot."""
+        local = self._local(starts_at)
+        minutes = local.hour * 60 + local.minute
+        if minutes % TICK_MINUTES or local.second or local.microsecond:
+            return False
+        starts = self.free_starts(clinician_id, local.date(), appointment_type, duration_minutes, ignore)
+        return bool(starts >> (minutes // TICK_MINUTES) & 1)
+
+    def slots(
+        self,
+        starts_after: datetime,
+        ends_before: datetime,
+        appointment_type: str,
+        duration_minutes: Optional[int] = None,
+        clinician_ids: Optional[Iterable[UUID]] = None,
+        limit: Optional[int] = None
+    ) -> list[Slot]:
+        """Free slots starting in ``[starts_after, ends_before)`` (naive UTC), ordered by time."""
+        duration = duration_minutes or duration_for(appointment_type)
+        clinicians = list(clinician_ids) if clinician_ids is not None else self.clinicians
+        found: list[Slot] = []
+        day, last_day = self._local(starts_after).date(), self._local(ends_before).date()
+        while day <= last_day:
+            # Sort keys are tick * len(clinicians) + position: ints, not UUID tuples
+            day_slots: list[int] = []
+            for position, clinician_id in enumerate(clinicians):
+                starts = self.free_starts(clinician_id, day, appointment_type, duration)
+                while starts:
+                    low = starts & -starts
+                    day_slots.append((low.bit_length() - 1) * len(clinicians) + position)
+                    starts ^= low
+            if day_slots:
+                day_slots.sort()
+                midnight = self._utc(day, 0)
+                # A UTC offset change during the day shifts ticks after it
+                uniform = self._utc(day + timedelta(days=1), 0) - midnight == timedelta(days=1)
+                for key in day_slots:
+                    tick, position = divmod(key, len(clinicians))
+                    if uniform:
+                        starts_at = midnight + _TICK_OFFSETS[tick]
+                    else:
+                        starts_at = self._utc(day, tick)
+                    if not starts_after <= starts_at < ends_before:
+                        continue
+                    found.append(Slot(clinicians[position], starts_at, duration, _SLOT_TYPES[tick]))
+                    if limit is not None and len(found) >= limit:
+                        return found
+            day += timedelta(days=1)
+        return found
+
+
+class AvailabilityService:
+    """Keeps one worker's ``AvailabilityIndex`` loaded and current."""
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker = async_session_maker,
+        max_days: Optional[int] = None,
+        refresh_seconds: Optional[float] = None,
+        template_ttl_seconds: Optional[float] = None
+    ):
+        self.session_maker = session_maker
+        self.max_days = max_days or settings.availability_max_days
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None else settings.availability_refresh_seconds
+        self.template_ttl = template_ttl_seconds or settings.availability_template_ttl_seconds
+        self.index: Optional[AvailabilityIndex] = None
+        self._window: tuple[datetime, datetime] = (datetime.min, datetime.min)
+        self._watermark: Optional[datetime] = None
+        self._loaded_at = 0.0
+        self._refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _covers(self, starts_after: datetime, ends_before: datetime) -> bool:
+        return self._window[0] <= starts_after and ends_before <= self._window[1]
+
+    async def _load(self, session: AsyncSession, window: tuple[datetime, datetime]) -> None:
+        # Widen by a day so local days at the window edges are complete
+        lower, upper = window[0] - timedelta(days=1), window[1] + timedelta(days=1)
+        clinician_ids = (await session.execute(
+            select(clinicians_table.c.id)
+            .where(clinicians_table.c.is_active.is_(True))
+            .order_by(clinicians_table.c.id)
+        )).scalars().all()
+        sessions = (await session.execute(
+            select(sessions_table).where(sessions_table.c.clinician_id.in_(
+                select(clinicians_table.c.id).where(clinicians_table.c.is_active.is_(True))
+            ))
+        )).all()
+        exceptions = (await session.execute(
+            select(exceptions_table).where(
+                exceptions_table.c.starts_at < upper,
+                exceptions_table.c.ends_at > lower
+            )
+        )).all()
+        bookings = (await session.execute(
+            select(
+                appointments_table.c.id,
+                appointments_table.c.clinician_id,
+                appointments_table.c.status,
+                appointments_table.c.scheduled_at,
+                appointments_table.c.duration_minutes,
+                appointments_table.c.updated_at
+            ).where(
+                appointments_table.c.clinician_id.is_not(None),
+                appointments_table.c.status.in_(BLOCKING_STATUSES),
+                # Longest appointment type is well under a day
+                appointments_table.c.scheduled_at >= lower - timedelta(days=1),
+                appointments_table.c.scheduled_at < upper
+            )
+        )).all()
+        self.index = AvailabilityIndex.build(clinician_ids, sessions, exceptions, bookings)
+        self._window = window
+        self._watermark = max((row.updated_at for row in bookings if row.updated_at), default=None)
+        if self._watermark is None:
+            self._watermark = datetime.now(timezone.utc).replace(tzinfo=None)
+        self._loaded_at = self._refreshed_at = monotonic_time.monotonic()
+
+    async def _refresh(self, session: AsyncSession) -> None:
+        result = await session.execute(
+            select(
+                appointments_table.c.id,
+                appointments_table.c.clinician_id,
+                appointments_table.c.status,
+                appointments_table.c.scheduled_at,
+                appointments_table.c.duration_minutes,
+                appointments_table.c.updated_at
+            ).where(appointments_table.c.updated_at >= self._watermark - REFRESH_OVERLAP)
+        )
+        for row in result.all():
+            self.index.apply_booking(row)
+            if row.updated_at and row.updated_at > self._watermark:
+                self._watermark = row.updated_at
+        self._refreshed_at = monotonic_time.monotonic()
+
+    async def ensure_current(self, starts_after: datetime, ends_before: datetime) -> AvailabilityIndex:
+        """The index, loaded for the range and no older than the refresh interval."""
+        async with self._lock:
+            now = monotonic_time.monotonic()
+            if self.index is None or now - self._loaded_at >= self.template_ttl or not self._covers(starts_after, ends_before):
+                today = datetime.now(timezone.utc).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+                window = (
+                    min(starts_after, today),
+                    max(ends_before, today + timedelta(days=self.max_days + 1))
+                )
+                async with self.session_maker() as session:
+                    await self._load(session, window)
+            elif now - self._refreshed_at >= self.refresh_seconds:
+                async with self.session_maker() as session:
+                    await self._refresh(session)
+            return self.index
+
+    def booking_changed(self, row: Any) -> None:
+        """Apply a booking this worker just committed without waiting for the next poll."""
+        if self.index is not None:
+            self.index.apply_booking(row)
+
+    async def slots(
+        self,
+        starts_after: datetime,
+        ends_before: datetime,
+        appointment_type: str,
+        clinician_ids: Optional[Iterable[UUID]] = None,
+        limit: Optional[int] = None
+    ) -> list[Slot]:
+        index = await self.ensure_current(starts_after, ends_before)
+        return index.slots(starts_after, ends_before, appointment_type, clinician_ids=clinician_ids, limit=limit)
+
+
+@lru_cache
+def get_availability() -> AvailabilityService:
+    return AvailabilityService()
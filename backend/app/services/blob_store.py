@@ -0,0 +1,221 @@
+"""Content-addressed, reference-counted blob storage.
+
+Blobs are keyed by ``HMAC-SHA256(user_key, plaintext)``. ``user_key`` is
+derived from the master key and the user id, so dedup only ever happens
+inside one patient's data. An upload first hashes the locally spooled
+file. If the blob is already known, the reference count is bumped and
+nothing is encrypted or sent to object storage.
+
+A blob's reference count tracks the ``MessageAttachment`` and ``Document``
+rows that point at it. Once it reaches zero, ``collect_garbage`` removes
+the row with a conditional delete and then the object. A re-upload of the
+same content that arrives first simply revives the blob. Run
+``python -m app.services.blob_store gc`` periodically to sweep stragglers.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import sys
+from dataclasses import dataclass
+from typing import Any, Optional
+from uuid import UUID, uuid4
+
+from sqlalchemy import Table, delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.core.encryption import field_encryption
+from app.database import async_session_maker, upsert_insert
+from app.models.blob import StoredBlob
+from app.services.object_storage import ObjectStorage, UploadTooLarge, read_chunks
+from app.services.user_keys import ensure_owner_key
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+blobs_table: Table = StoredBlob.__table__
+
+
+@dataclass
+class BlobRef:
+    """A reference acquired on a stored blob."""
+    id: UUID
+    storage_key: str
+    size: int
+    deduplicated: bool
+
+
+def _user_hash_key(user_id: UUID) -> bytes:
+    master = (settings.blob_encryption_key or settings.encryption_key).encode()
+    return hmac.new(master, b"blob-hash:" + user_id.bytes, hashlib.sha256).digest()
+
+
+async def content_hash(
+    user_id: UUID,
+    source: Any,
+    chunk_size: int,
+    max_size: Optional[int] = None
+) -> tuple[str, int]:
+    """Keyed hash and size of an ``UploadFile``-like source; rewinds it afterwards."""
+    mac = hmac.new(_user_hash_key(user_id), digestmod=hashlib.sha256)
+    size = 0
+    async for chunk in read_chunks(source, chunk_size):
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+        mac.update(chunk)
+    await source.seek(0)
+    return mac.hexdigest(), size
+
+
+class BlobStore:
+    """Dedup-aware upload, reference counting and garbage collection."""
+
+    def __init__(self, storage: Optional[ObjectStorage] = None):
+        self._storage = storage
+
+    @property
+    def storage(self) -> ObjectStorage:
+        if self._storage is None:
+            self._storage = ObjectStorage()
+        return self._storage
+
+    async def _acquire_existing(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        digest: str
+    ) -> Optional[BlobRef]:
+        result = await db.execute(
+            update(blobs_table)
+            .where(blobs_table.c.user_id == user_id, blobs_table.c.content_hash == digest)
+            .values(ref_count=blobs_table.c.ref_count + 1)
+            .returning(blobs_table.c.id, blobs_table.c.storage_key_encrypted, blobs_table.c.size)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        return BlobRef(
+            id=row.id,
+            storage_key=field_encryption.decrypt(row.storage_key_encrypted),
+            size=row.size,
+            deduplicated=True
+        )
+
+    async def store(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        source: Any,
+        max_size: Optional[int] = None,
+        content_type: str = "application/octet-stream"
+    ) -> BlobRef:
+        """Store an upload (or reuse an identical one) and take a reference on it.
+
+        Runs inside the caller's transaction; the caller commits together with
+        the row that holds the reference.
+        """
+        chunk_size = settings.upload_read_chunk_size
+        digest, size = await content_hash(user_id, source, chunk_size, max_size)
+
+        existing = await self._acquire_existing(db, user_id, digest)
+        if existing is not None:
+            return existing
+
+        key = f"blobs/{user_id}/{uuid4()}"
+        stored = await self.storage.upload_encrypted(
+            key,
+            read_chunks(source, chunk_size),
+            max_size=max_size,
+            content_type=content_type,
+            owner_key=await ensure_owner_key(db, user_id)
+        )
+
+        stmt = upsert_insert(db, blobs_table).values(
+            id=uuid4(),
+            user_id=user_id,
+            content_hash=digest,
+            storage_key_encrypted=field_encryption.encrypt(key),
+            size=stored.plaintext_size,
+            ref_count=1
+        )
+        result = await db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["user_id", "content_hash"],
+                set_={"ref_count": blobs_table.c.ref_count + 1}
+            ).returning(blobs_table.c.id, blobs_table.c.storage_key_encrypted)
+        )
+        row = result.one()
+        winner_key = field_encryption.decrypt(row.storage_key_encrypted)
+        if winner_key != key:
+            # A concurrent upload of the same content won the race; drop our copy
+            await self.storage.delete(key)
+            return BlobRef(id=row.id, storage_key=winner_key, size=size, deduplicated=True)
+
+        return BlobRef(id=row.id, storage_key=key, size=stored.plaintext_size, deduplicated=False)
+
+    async def release(self, db: AsyncSession, blob_id: UUID) -> bool:
+        """Drop a reference without committing; True when the blob is now unreferenced."""
+        result = await db.execute(
+            update(blobs_table)
+            .where(blobs_table.c.id == blob_id, blobs_table.c.ref_count > 0)
+            .values(ref_count=blobs_table.c.ref_count - 1)
+            .returning(blobs_table.c.ref_count)
+        )
+        return result.scalar_one_or_none() == 0
+
+    async def collect_garbage(
+        self,
+        db: AsyncSession,
+        blob_ids: Optional[list[UUID]] = None,
+        batch_size: int = 500
+    ) -> int:
+        """Delete unreferenced blobs and their objects; returns the number removed.
+
+        Call with ``blob_ids`` right after committing a release, or without to
+        sweep blobs left at zero by a worker that died before collecting. The
+        row delete is conditional, so a blob revived by a concurrent upload is
+        kept, and it commits before any object is removed.
+        """
+        candidates = (
+            select(blobs_table.c.id)
+            .where(blobs_table.c.ref_count <= 0)
+            .limit(batch_size)
+        )
+        if blob_ids is not None:
+            candidates = candidates.where(blobs_table.c.id.in_(blob_ids))
+
+        result = await db.execute(
+            delete(blobs_table)
+            .where(blobs_table.c.id.in_(candidates), blobs_table.c.ref_count <= 0)
+            .returning(blobs_table.c.storage_key_encrypted)
+        )
+        keys = [field_encryption.decrypt(k) for k in result.scalars().all()]
+        await db.commit()
+
+        for key in keys:
+            try:
+                await self.storage.delete(key)
+            except Exception as exc:
+                logger.warning("blob gc failed to delete %s: %s", key, exc)
+        return len(keys)
+
+
+async def collect_all(batch_size: int = 500) -> int:
+    """Sweep every unreferenced blob in batches. Returns the number removed."""
+    store = BlobStore()
+    total = 0
+    while True:
+        async with async_session_maker() as session:
+            removed = await store.collect_garbage(session, batch_size=batch_size)
+        total += removed
+        if removed < batch_size:
+            return total
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["gc"]:
+        sys.exit("usage: python -m app.services.blob_store gc")
+    print(f"removed {asyncio.run(collect_all())} unreferenced blobs")
@@ -0,0 +1,288 @@
+"""Contention-safe appointment booking.
+
+When a clinic opens slots, many patients race for the same start.
+Correctness rests on the ``ex_appointments_clinician_slot`` exclusion
+constraint. PostgreSQL refuses any live booking whose
+``[scheduled_at, scheduled_at + duration)`` overlaps another for the same
+clinician. No application lock is taken, so bookings for different slots
+never wait on each other.
+
+Losing requests are turned away as early and cheaply as possible:
+
+1. ``taken``: the worker's ``AvailabilityIndex`` already shows the slot
+   booked. No database work is done.
+2. ``contended``: ``pg_try_advisory_xact_lock`` on (clinician, start)
+   fails because another request is mid-transaction for the same slot.
+   The request gives up instead of queueing behind that row.
+3. ``overlap``: the INSERT or UPDATE violates the exclusion constraint
+   (for example an overlapping booking with a different start).
+
+Each attempt is one short transaction: lock, one write, commit. A failure
+raises ``SlotUnavailable`` carrying the nearest alternative slots, taken
+from the index.
+
+SQLite (local development) has no exclusion constraint. There, the
+overlap check and the write run under one in-process lock instead.
+"""
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+from uuid import UUID
+
+from sqlalchemy import Row, Table, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.models.appointment import BLOCKING_STATUSES, Appointment
+from app.services.availability import (
+    AvailabilityIndex,
+    AvailabilityService,
+    Slot,
+    duration_for,
+    get_availability,
+)
+
+settings = get_settings()
+
+appointments_table: Table = Appointment.__table__
+
+EXCLUSION_VIOLATION = "23P01"
+ALTERNATIVES_HORIZON = timedelta(days=14)
+
+# SQLite runs in a single development process
+_development_lock = asyncio.Lock()
+
+
+class SlotUnavailable(Exception):
+    """The requested start cannot be booked; ``alternatives`` are free nearby."""
+
+    def __init__(self, reason: str, alternatives: list[Slot]):
+        super().__init__(reason)
+        self.reason = reason
+        self.alternatives = alternatives
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    """``Appointment.scheduled_at`` is naive UTC; aware input is converted."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _earliest_start() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(minutes=settings.booking_min_lead_minutes)
+
+
+def _lock_key(clinician_id: UUID, starts_at: datetime) -> int:
+    digest = hashlib.blake2b(
+        clinician_id.bytes + starts_at.isoformat().encode(), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def _is_overlap(exc: IntegrityError) -> bool:
+    code = getattr(exc.orig, "sqlstate", None) or getattr(exc.orig, "pgcode", None)
+    return code == EXCLUSION_VIOLATION
+
+
+def alternatives(
+    index: AvailabilityIndex,
+    appointment_type: str,
+    starts_at: datetime,
+    clinician_id: Optional[UUID] = None,
+    limit: Optional[int] = None
+) -> list[Slot]:
+    """Free slots from ``starts_at`` onward, the preferred clinician first.
+
+    The requested start itself is left out even if this worker's index has
+    not yet seen the booking that took it.
+    """
+    limit = limit or settings.booking_alternatives
+    starts_after = max(starts_at, _earliest_start())
+    ends_before = starts_after + ALTERNATIVES_HORIZON
+    found: list[Slot] = []
+    if clinician_id is not None:
+        found = index.slots(starts_after, ends_before, appointment_type, clinician_ids=[clinician_id], limit=limit + 1)
+    if len(found) <= limit:
+        seen = set(found)
+        for slot in index.slots(starts_after, ends_before, appointment_type, limit=2 * limit + 1):
+            if slot not in seen:
+                found.append(slot)
+    found = [
+        slot for slot in found
+        if slot.starts_at != starts_at or (clinician_id is not None and slot.clinician_id != clinician_id)
+    ]
+    found.sort(key=lambda slot: (slot.clinician_id != clinician_id, slot.starts_at))
+    return found[:limit]
+
+
+async def _try_lock(db: AsyncSession, clinician_id: UUID, starts_at: datetime) -> bool:
+    result = await db.execute(select(func.pg_try_advisory_xact_lock(_lock_key(clinician_id, starts_at))))
+    return bool(result.scalar())
+
+
+async def _overlaps(
+    db: AsyncSession,
+    clinician_id: UUID,
+    starts_at: datetime,
+    duration_minutes: int,
+    ignore: Optional[UUID]
+) -> bool:
+    """Overlap check for databases without the exclusion constraint (SQLite in development)."""
+    ends_at = starts_at + timedelta(minutes=duration_minutes)
+    longest = max(settings.appointment_durations.values())
+    result = await db.execute(
+        select(appointments_table.c.id, appointments_table.c.scheduled_at, appointments_table.c.duration_minutes)
+        .where(
+            appointments_table.c.clinician_id == clinician_id,
+            appointments_table.c.status.in_(BLOCKING_STATUSES),
+            appointments_table.c.scheduled_at < ends_at,
+            appointments_table.c.scheduled_at > starts_at - timedelta(minutes=longest)
+        )
+    )
+    return any(
+        row.id != ignore and row.scheduled_at + timedelta(minutes=row.duration_minutes) > starts_at
+        for row in result.all()
+    )
+
+
+async def _write(
+    db: AsyncSession,
+    clinician_id: UUID,
+    starts_at: datetime,
+    duration_minutes: int,
+    statement: Any,
+    ignore: Optional[UUID] = None
+) -> tuple[Optional[Row], Optional[str]]:
+    """Run one booking write in its own short transaction. Returns (row, failure reason)."""
+    if db.bind.dialect.name == "postgresql":
+        try:
+            if not await _try_lock(db, clinician_id, starts_at):
+                await db.rollback()
+                return None, "contended"
+            row = (await db.execute(statement)).first()
+            await db.commit()
+        except IntegrityError as exc:
+            await db.rollback()
+            if not _is_overlap(exc):
+                raise
+            return None, "overlap"
+    else:
+        # No exclusion constraint here: check and write under one process-wide lock
+        async with _development_lock:
+            if await _overlaps(db, clinician_id, starts_at, duration_minutes, ignore):
+                await db.rollback()
+                return None, "overlap"
+            row = (await db.execute(statement)).first()
+            await db.commit()
+    return row, None if row is not None else "missing"
+
+
+async def book_slot(
+    db: AsyncSession,
+    user_id: UUID,
+    appointment_type: str,
+    scheduled_at: datetime,
+    clinician_id: Optional[UUID] = None,
+    values: Optional[dict[str, Any]] = None,
+    service: Optional[AvailabilityService] = None
+) -> Row:
+    """Book a confirmed appointment at ``scheduled_at``, or raise ``SlotUnavailable``.
+
+    Without ``clinician_id`` any clinician offering the slot is tried, up
+    to ``booking_max_candidates`` of them. Commits.
+    """
+    service = service or get_availability()
+    scheduled_at = to_utc_naive(scheduled_at)
+    duration = duration_for(appointment_type)
+    index = await service.ensure_current(scheduled_at - timedelta(days=1), scheduled_at + timedelta(days=1))
+
+    if scheduled_at < _earliest_start():
+        raise SlotUnavailable("too_soon", alternatives(index, appointment_type, scheduled_at, clinician_id))
+    pool = [clinician_id] if clinician_id is not None else index.clinicians
+    candidates = [
+        candidate for candidate in pool
+        if index.is_free(candidate, scheduled_at, appointment_type, duration)
+    ][:settings.booking_max_candidates]
+
+    reason = "taken"
+    for candidate in candidates:
+        statement = (
+            insert(appointments_table)
+            .values(
+                user_id=user_id,
+                clinician_id=candidate,
+                appointment_type=appointment_type,
+                status="confirmed",
+                scheduled_at=scheduled_at,
+                duration_minutes=duration,
+                **(values or {})
+            )
+            .returning(appointments_table)
+        )
+        row, reason = await _write(db, candidate, scheduled_at, duration, statement)
+        if row is not None:
+            service.booking_changed(row)
+            return row
+    raise SlotUnavailable(reason, alternatives(index, appointment_type, scheduled_at, clinician_id))
+
+
+async def reschedule(
+    db: AsyncSession,
+    user_id: UUID,
+    appointment: Any,
+    scheduled_at: datetime,
+    values: Optional[dict[str, Any]] = None,
+    service: Optional[AvailabilityService] = None
+) -> Row:
+    """Move a live appointment to ``scheduled_at`` with the same clinician. Commits.
+
+    Raises ``SlotUnavailable`` when the new start is taken; the appointment
+    then keeps its current time.
+    """
+    service = service or get_availability()
+    scheduled_at = to_utc_naive(scheduled_at)
+    duration = appointment.duration_minutes or duration_for(appointment.appointment_type)
+    index = await service.ensure_current(scheduled_at - timedelta(days=1), scheduled_at + timedelta(days=1))
+    clinician_id = appointment.clinician_id
+
+    def unavailable(reason: str) -> SlotUnavailable:
+        return SlotUnavailable(
+            reason, alternatives(index, appointment.appointment_type, scheduled_at, clinician_id)
+        )
+
+    if scheduled_at < _earliest_start():
+        raise unavailable("too_soon")
+    if clinician_id is None:
+        # A request never placed on a rota takes the first clinician free then
+        clinician_id = next((
+            candidate for candidate in index.clinicians
+            if index.is_free(candidate, scheduled_at, appointment.appointment_type, duration)
+        ), None)
+        if clinician_id is None:
+            raise unavailable("taken")
+    elif not index.is_free(clinician_id, scheduled_at, appointment.appointment_type, duration, ignore=appointment.id):
+        raise unavailable("taken")
+
+    statement = (
+        update(appointments_table)
+        .where(
+            appointments_table.c.id == appointment.id,
+            appointments_table.c.user_id == user_id,
+            appointments_table.c.status.in_(BLOCKING_STATUSES)
+        )
+        .values(
+            clinician_id=clinician_id,
+            scheduled_at=scheduled_at,
+            duration_minutes=duration,
+            **(values or {})
+        )
+        .returning(appointments_table)
+    )
+    row, reason = await _write(db, clinician_id, scheduled_at, duration, statement, ignore=appointment.id)
+    if row is None:
+        raise unavailable(reason)
+    service.booking_changed(row)
+    return row
@@ -0,0 +1,167 @@
+"""Tokenised iCalendar (.ics) subscription feed of a patient's appointments.
+
+Calendar apps cannot send a bearer token, so the feed URL carries its own
+credential: ``base64url(user_id | generation | HMAC)``. Checking the MAC needs
+no database access. Rotating the feed bumps
+``User.calendar_feed_generation``, and every older URL gets a 404 from
+then on: each request compares the token's generation with the user's
+by primary key before anything else.
+
+The strong ETag is ``"<generation>.<appointments version>"`` from
+``app.services.versions``. A poll whose If-None-Match still matches gets a
+304 after that key lookup and one Redis read, without loading or
+rendering any appointments. The body for a given
+version is byte-for-byte deterministic: rows are ordered by id within
+scheduled_at, and DTSTAMP comes from ``updated_at``, not the clock.
+"""
+import base64
+import hashlib
+import hmac
+import struct
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+from uuid import UUID
+
+from sqlalchemy import Row, Table, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.models.appointment import Appointment
+from app.models.user import User
+
+settings = get_settings()
+
+appointments_table: Table = Appointment.__table__
+users_table: Table = User.__table__
+
+_MAC_SIZE = 16
+_PAYLOAD = struct.Struct(">16sI")
+
+_STATUS = {
+    "requested": "TENTATIVE",
+    "confirmed": "CONFIRMED",
+    "completed": "CONFIRMED",
+    "cancelled": "CANCELLED",
+    "no_show": "CANCELLED",
+}
+
+
+def _mac(payload: bytes) -> bytes:
+    key = (settings.calendar_feed_key or settings.secret_key).encode()
+    return hmac.new(key, b"calendar-feed:" + payload, hashlib.sha256).digest()[:_MAC_SIZE]
+
+
+def feed_token(user_id: UUID, generation: int) -> str:
+    payload = _PAYLOAD.pack(user_id.bytes, generation)
+    return base64.urlsafe_b64encode(payload + _mac(payload)).rstrip(b"=").decode()
+
+
+def parse_feed_token(token: str) -> Optional[tuple[UUID, int]]:
+    """(user_id, generation) for an authentic token, else None."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (ValueError, TypeError):
+        return None
+    if len(raw) != _PAYLOAD.size + _MAC_SIZE:
+        return None
+    payload, mac = raw[:_PAYLOAD.size], raw[_PAYLOAD.size:]
+    if not hmac.compare_digest(mac, _mac(payload)):
+        return None
+    user_bytes, generation = _PAYLOAD.unpack(payload)
+    return UUID(bytes=user_bytes), generation
+
+
+def feed_etag(generation: int, version: int) -> str:
+    return f'"{generation}.{version}"'
+
+
+async def current_generation(db: AsyncSession, user_id: UUID) -> Optional[int]:
+    result = await db.execute(
+        select(users_table.c.calendar_feed_generation).where(users_table.c.id == user_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def rotate_feed(db: AsyncSession, user_id: UUID) -> int:
+    """Revoke the user's feed URLs and return the new generation. Does not commit."""
+    result = await db.execute(
+        update(users_table)
+        .where(users_table.c.id == user_id)
+        .values(calendar_feed_generation=users_table.c.calendar_feed_generation + 1)
+        .returning(users_table.c.calendar_feed_generation)
+    )
+    return result.scalar_one()
+
+
+async def feed_appointments(db: AsyncSession, user_id: UUID) -> list[Row]:
+    result = await db.execute(
+        select(
+            appointments_table.c.id,
+            appointments_table.c.appointment_type,
+            appointments_table.c.status,
+            appointments_table.c.scheduled_at,
+            appointments_table.c.duration_minutes,
+            appointments_table.c.updated_at
+        )
+        .where(
+            appointments_table.c.user_id == user_id,
+            appointments_table.c.scheduled_at.is_not(None)
+        )
+        .order_by(appointments_table.c.scheduled_at.desc(), appointments_table.c.id)
+        .limit(settings.calendar_feed_limit)
+    )
+    return list(result.all())
+
+
+def _escape(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Fold a content line at 75 octets (RFC 5545 section 3.1)."""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line
+    parts, start, limit = [], 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Never split a UTF-8 sequence
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode())
+        start, limit = end, 74
+    return "\r\n ".join(parts)
+
+
+def _utc(value: datetime) -> str:
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def render_calendar(appointments: Iterable[Row]) -> bytes:
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:-//{_escape(settings.app_name)}//Appointments//EN",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        "X-WR-CALNAME:Appointments",
+        f"X-PUBLISHED-TTL:PT{max(settings.calendar_feed_max_age // 60, 1)}M",
+    ]
+    for appointment in sorted(appointments, key=lambda row: (row.scheduled_at, row.id)):
+        starts_at = appointment.scheduled_at
+        ends_at = starts_at + timedelta(minutes=appointment.duration_minutes or 15)
+        kind = appointment.appointment_type.replace("_", " ").capitalize()
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{appointment.id}@appointments",
+            f"DTSTAMP:{_utc(appointment.updated_at or starts_at)}",
+            f"DTSTART:{_utc(starts_at)}",
+            f"DTEND:{_utc(ends_at)}",
+            f"SUMMARY:{_escape(kind)} appointment",
+            f"STATUS:{_STATUS.get(appointment.status, 'CONFIRMED')}",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(_fold(line) for line in lines) + "\r\n").encode()
@@ -0,0 +1,523 @@
+"""Incremental sync of medications and documents from the clinic EMR.
+
+The EMR exposes a change feed per patient and resource::
+
+    GET /patients/{clinic_patient_id}/{resource}?since=<cursor>&limit=<n>
+    If-None-Match: <etag of the last first page>
+
+It answers 304 when nothing changed since the stored ETag. Otherwise it
+answers 200 with ``{"items": [...], "next_cursor": "...", "has_more": bool}``.
+A deleted record arrives as a tombstone, ``{"id": "...", "deleted": true}``.
+Each page is upserted in batches, and the cursor is advanced in the same
+transaction, so an interrupted sync resumes from the last committed page.
+
+Document files belong to the EMR. Each new or changed file is fetched from
+``GET /patients/{clinic_patient_id}/documents/{id}/file`` and copied into
+our own blob storage, encrypted under the patient's owner key. Documents
+only ever point at blobs we wrote, and a replaced or deleted document
+releases its blob rather than touching the EMR's object.
+"""
+import asyncio
+import hashlib
+import logging
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from typing import Any, Awaitable, Callable, Iterable, Optional
+from uuid import UUID
+
+import httpx
+from botocore.exceptions import BotoCoreError, ClientError
+from sqlalchemy import Table, delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from starlette.datastructures import UploadFile
+
+from app.config import get_settings
+from app.core.encryption import field_encryption
+from app.database import async_session_maker, upsert_insert
+from app.models.clinic_sync import ClinicSyncCursor
+from app.models.document import Document
+from app.models.medication import PatientMedication
+from app.models.user import User
+from app.services.blob_store import BlobStore
+from app.services.drug_dictionary import match_medication
+from app.services.interactions import rescreen_patient
+from app.services.realtime import publish_event
+from app.services.user_keys import OwnerKeyShredded
+from app.services.versions import DOCUMENTS, MEDICATIONS, bump_version
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# Core tables: sync only needs bulk statements, not ORM identity tracking
+cursors_table: Table = ClinicSyncCursor.__table__
+medications_table: Table = PatientMedication.__table__
+documents_table: Table = Document.__table__
+
+# Downloaded files stay in memory up to this size, then spill to disk
+SPOOL_MEMORY_BYTES = 1024 * 1024
+
+
+@dataclass
+class ChangesPage:
+    """One page of the EMR change feed."""
+    items: list[dict[str, Any]]
+    next_cursor: Optional[str]
+    has_more: bool
+    etag: Optional[str]
+
+
+@dataclass
+class SyncResult:
+    """Outcome of syncing one resource feed for one patient."""
+    user_id: UUID
+    resource: str
+    pages: int = 0
+    fetched: int = 0
+    upserted: int = 0
+    removed: int = 0
+    not_modified: bool = False
+    elapsed_ms: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class SyncReport:
+    """Aggregate of a multi-patient sync run."""
+    results: list[SyncResult] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+    @property
+    def upserted(self) -> int:
+        return sum(r.upserted for r in self.results)
+
+    @property
+    def removed(self) -> int:
+        return sum(r.removed for r in self.results)
+
+    @property
+    def failed(self) -> int:
+        return sum(1 for r in self.results if r.error)
+
+
+class ClinicClient:
+    """Pooled HTTP client for the clinic EMR change feed and message intake."""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        base_url = base_url or settings.clinic_api_url
+        if not base_url:
+            raise ValueError("clinic_api_url is not configured")
+
+        headers = {"Accept": "application/json"}
+        api_key = api_key or settings.clinic_api_key
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=settings.clinic_http_timeout_seconds,
+            limits=httpx.Limits(
+                max_connections=settings.clinic_http_max_connections,
+                max_keepalive_connections=settings.clinic_http_max_connections
+            ),
+            transport=transport
+        )
+
+    async def __aenter__(self) -> "ClinicClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def fetch_changes(
+        self,
+        clinic_patient_id: UUID,
+        resource: str,
+        since: Optional[str],
+        etag: Optional[str],
+        limit: int
+    ) -> Optional[ChangesPage]:
+        """Fetch one page of changes, or None when the feed is unchanged (304)."""
+        params: dict[str, Any] = {"limit": limit}
+        if since:
+            params["since"] = since
+        headers = {"If-None-Match": etag} if etag else {}
+
+        response = await self._client.get(
+            f"/patients/{clinic_patient_id}/{resource}",
+            params=params,
+            headers=headers
+        )
+        if response.status_code == httpx.codes.NOT_MODIFIED:
+            return None
+        response.raise_for_status()
+
+        payload = response.json()
+        return ChangesPage(
+            items=payload.get("items", []),
+            next_cursor=payload.get("next_cursor"),
+            has_more=bool(payload.get("has_more")),
+            etag=response.headers.get("ETag")
+        )
+
+    async def download_document(
+        self,
+        clinic_patient_id: UUID,
+        clinic_document_id: UUID,
+        destination: UploadFile
+    ) -> None:
+        """Stream a document's file into ``destination`` and rewind it."""
+        async with self._client.stream(
+            "GET", f"/patients/{clinic_patient_id}/documents/{clinic_document_id}/file"
+        ) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(settings.upload_read_chunk_size):
+                await destination.write(chunk)
+        await destination.seek(0)
+
+    async def post_message(
+        self,
+        clinic_patient_id: UUID,
+        message: dict[str, Any],
+        idempotency_key: str
+    ) -> dict[str, Any]:
+        """Deliver a patient message; the key makes redelivery after a crash a no-op."""
+        response = await self._client.post(
+            f"/patients/{clinic_patient_id}/messages",
+            json=message,
+            headers={"Idempotency-Key": idempotency_key}
+        )
+        response.raise_for_status()
+        return response.json() if response.content else {}
+
+
+def _parse_date(value: Optional[str]) -> Optional[date]:
+    return date.fromisoformat(value) if value else None
+
+
+async def _medication_row(user_id: UUID, item: dict[str, Any], now: datetime) -> dict[str, Any]:
+    entry = await match_medication(item["name"], item.get("code"))
+    return {
+        "user_id": user_id,
+        "clinic_medication_id": UUID(item["id"]),
+        "medication_name": item["name"],
+        "medication_code": entry.code if entry else item.get("code"),
+        "dosage": item.get("dosage"),
+        "frequency": item.get("frequency"),
+        "instructions_encrypted": field_encryption.encrypt_if_present(item.get("instructions")),
+        "started_at": _parse_date(item.get("started_at")),
+        "ended_at": _parse_date(item.get("ended_at")),
+        "is_active": item.get("is_active", True),
+        "synced_from_clinic": True,
+        "updated_at": now
+    }
+
+
+async def _document_row(user_id: UUID, item: dict[str, Any], now: datetime) -> dict[str, Any]:
+    # s3_key_encrypted and blob_id are filled in once the file is in our storage
+    return {
+        "user_id": user_id,
+        "clinic_document_id": UUID(item["id"]),
+        "document_type": item["document_type"],
+        "title": item["title"],
+        "description_encrypted": field_encryption.encrypt_if_present(item.get("description")),
+        # EMR objects are immutable, so the key identifies the content when no digest is sent
+        "content_key": item.get("content_sha256") or hashlib.sha256(item["file_key"].encode()).hexdigest(),
+        "file_type": item["file_type"],
+        "file_size": item["file_size"],
+        "issued_at": _parse_date(item.get("issued_at")),
+        "synced_from_clinic": True
+    }
+
+
+@dataclass(frozen=True)
+class _Feed:
+    table: Table
+    key: str
+    to_row: Callable[[UUID, dict[str, Any], datetime], Awaitable[dict[str, Any]]]
+    # Values set on tombstoned rows; None deletes them
+    tombstone: Optional[dict[str, Any]] = None
+    # Rows carry a file that is copied into blob storage
+    files: bool = False
+
+
+FEEDS: dict[str, _Feed] = {
+    MEDICATIONS: _Feed(
+        medications_table, "clinic_medication_id", _medication_row, tombstone={"is_active": False}
+    ),
+    DOCUMENTS: _Feed(documents_table, "clinic_document_id", _document_row, files=True),
+}
+
+
+class ClinicSyncEngine:
+    """Pulls EMR deltas for many patients with bounded parallelism."""
+
+    def __init__(
+        self,
+        client: ClinicClient,
+        session_maker: async_sessionmaker = async_session_maker,
+        batch_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        blob_store: Optional[BlobStore] = None
+    ):
+        self.client = client
+        self.session_maker = session_maker
+        self.blob_store = blob_store or BlobStore()
+        self.batch_size = batch_size or settings.clinic_sync_batch_size
+        self.concurrency = concurrency or settings.clinic_sync_concurrency
+
+    async def _load_cursor(
+        self,
+        session: AsyncSession,
+        user_id: UUID,
+        resource: str
+    ) -> tuple[Optional[str], Optional[str]]:
+        result = await session.execute(
+            select(cursors_table.c.cursor, cursors_table.c.etag).where(
+                cursors_table.c.user_id == user_id,
+                cursors_table.c.resource == resource
+            )
+        )
+        row = result.first()
+        return (row.cursor, row.etag) if row else (None, None)
+
+    async def _save_cursor(
+        self,
+        session: AsyncSession,
+        user_id: UUID,
+        resource: str,
+        cursor: Optional[str],
+        etag: Optional[str],
+        now: datetime
+    ) -> None:
+        stmt = upsert_insert(session, cursors_table).values(
+            user_id=user_id,
+            resource=resource,
+            cursor=cursor,
+            etag=etag,
+            last_synced_at=now
+        )
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["user_id", "resource"],
+                set_={
+                    "cursor": stmt.excluded.cursor,
+                    "etag": stmt.excluded.etag,
+                    "last_synced_at": stmt.excluded.last_synced_at
+                }
+            )
+        )
+
+    async def _upsert(
+        self,
+        session: AsyncSession,
+        feed: _Feed,
+        rows: list[dict[str, Any]]
+    ) -> int:
+        """Upsert rows in batches, one statement per batch."""
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            stmt = upsert_insert(session, feed.table).values(batch)
+            updatable = [name for name in batch[0] if name not in ("user_id", feed.key)]
+            await session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["user_id", feed.key],
+                    set_={name: stmt.excluded[name] for name in updatable}
+                )
+            )
+        return len(rows)
+
+    async def _store_files(
+        self,
+        session: AsyncSession,
+        user_id: UUID,
+        clinic_patient_id: UUID,
+        items: list[dict[str, Any]],
+        rows: list[dict[str, Any]]
+    ) -> list[UUID]:
+        """Copy each changed file into blob storage. Returns the blobs the rows stop using."""
+        result = await session.execute(
+            select(
+                documents_table.c.clinic_document_id,
+                documents_table.c.content_key,
+                documents_table.c.s3_key_encrypted,
+                documents_table.c.blob_id
+            ).where(
+                documents_table.c.user_id == user_id,
+                documents_table.c.clinic_document_id.in_([row["clinic_document_id"] for row in rows])
+            )
+        )
+        existing = {row.clinic_document_id: row for row in result}
+
+        released = []
+        for item, row in zip(items, rows):
+            current = existing.get(row["clinic_document_id"])
+            # Metadata-only changes keep the copy we already hold
+            if current is not None and current.blob_id is not None and current.content_key == row["content_key"]:
+                row["s3_key_encrypted"] = current.s3_key_encrypted
+                row["blob_id"] = current.blob_id
+                continue
+
+            spool = UploadFile(tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES))
+            try:
+                await self.client.download_document(clinic_patient_id, row["clinic_document_id"], spool)
+                blob = await self.blob_store.store(session, user_id, spool, content_type=item["file_type"])
+            finally:
+                await spool.close()
+
+            row["s3_key_encrypted"] = field_encryption.encrypt(blob.storage_key)
+            row["blob_id"] = blob.id
+            row["file_size"] = blob.size
+            if current is not None and current.blob_id is not None:
+                released.append(current.blob_id)
+        return released
+
+    async def _remove(
+        self,
+        session: AsyncSession,
+        feed: _Feed,
+        user_id: UUID,
+        clinic_ids: list[UUID]
+    ) -> tuple[int, list[UUID]]:
+        """Apply tombstones. Returns the rows affected and the blobs they released."""
+        match = (feed.table.c.user_id == user_id, feed.table.c[feed.key].in_(clinic_ids))
+        if feed.tombstone is not None:
+            result = await session.execute(update(feed.table).where(*match).values(feed.tombstone))
+            return result.rowcount, []
+
+        stmt = delete(feed.table).where(*match)
+        if feed.files:
+            result = await session.execute(stmt.returning(feed.table.c.blob_id))
+            blob_ids = list(result.scalars())
+            return len(blob_ids), [blob_id for blob_id in blob_ids if blob_id is not None]
+        result = await session.execute(stmt)
+        return result.rowcount, []
+
+    async def sync_resource(
+        self,
+        user_id: UUID,
+        clinic_patient_id: UUID,
+        resource: str
+    ) -> SyncResult:
+        """Drain the change feed for one resource of one patient."""
+        feed = FEEDS[resource]
+        result = SyncResult(user_id=user_id, resource=resource)
+        started = time.perf_counter()
+
+        async with self.session_maker() as session:
+            cursor, etag = await self._load_cursor(session, user_id, resource)
+            # Only the first page is conditional; later pages are new cursors
+            if_none_match = etag
+
+            while True:
+                page = await self.client.fetch_changes(
+                    clinic_patient_id, resource, cursor, if_none_match, self.batch_size
+                )
+                if page is None:
+                    result.not_modified = True
+                    break
+
+                now = datetime.now(timezone.utc)
+                changed = [item for item in page.items if not item.get("deleted")]
+                removed = [UUID(item["id"]) for item in page.items if item.get("deleted")]
+                rows = [await feed.to_row(user_id, item, now) for item in changed]
+                released: list[UUID] = []
+                result.pages += 1
+                result.fetched += len(page.items)
+                if rows:
+                    if feed.files:
+                        released += await self._store_files(session, user_id, clinic_patient_id, changed, rows)
+                    result.upserted += await self._upsert(session, feed, rows)
+                if removed:
+                    count, blob_ids = await self._remove(session, feed, user_id, removed)
+                    result.removed += count
+                    released += blob_ids
+                if (rows or removed) and feed.table is medications_table:
+                    await rescreen_patient(session, user_id)
+                unreferenced = [blob_id for blob_id in released if await self.blob_store.release(session, blob_id)]
+
+                cursor = page.next_cursor or cursor
+                etag = page.etag if result.pages == 1 else etag
+                await self._save_cursor(session, user_id, resource, cursor, etag, now)
+                await session.commit()
+
+                if unreferenced:
+                    await self.blob_store.collect_garbage(session, blob_ids=unreferenced)
+
+                if not page.has_more:
+                    break
+                if_none_match = None
+
+        if result.upserted or result.removed:
+            await bump_version(user_id, resource)
+            await publish_event(
+                user_id, "records.updated", {"resource": resource, "count": result.upserted + result.removed}
+            )
+
+        result.elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(
+            "clinic sync user=%s resource=%s pages=%d fetched=%d upserted=%d "
+            "removed=%d not_modified=%s elapsed_ms=%.1f",
+            user_id, resource, result.pages, result.fetched, result.upserted,
+            result.removed, result.not_modified, result.elapsed_ms
+        )
+        return result
+
+    async def sync_patient(self, user_id: UUID, clinic_patient_id: UUID) -> list[SyncResult]:
+        """Sync every resource feed for one patient."""
+        results = []
+        for resource in FEEDS:
+            try:
+                results.append(await self.sync_resource(user_id, clinic_patient_id, resource))
+            except (httpx.HTTPError, BotoCoreError, ClientError, OwnerKeyShredded, ValueError, KeyError) as exc:
+                logger.warning("clinic sync failed user=%s resource=%s: %s", user_id, resource, exc)
+                results.append(SyncResult(user_id=user_id, resource=resource, error=str(exc)))
+        return results
+
+    async def sync_many(self, patients: Iterable[tuple[UUID, UUID]]) -> SyncReport:
+        """Sync many ``(user_id, clinic_patient_id)`` pairs, at most ``concurrency`` at once."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+
+        async def run(user_id: UUID, clinic_patient_id: UUID) -> list[SyncResult]:
+            async with semaphore:
+                return await self.sync_patient(user_id, clinic_patient_id)
+
+        batches = await asyncio.gather(*(run(u, p) for u, p in patients))
+        report = SyncReport(results=[r for batch in batches for r in batch])
+        report.elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(
+            "clinic sync run results=%d upserted=%d failed=%d elapsed_ms=%.1f",
+            len(report.results), report.upserted, report.failed, report.elapsed_ms
+        )
+        return report
+
+
+async def sync_linked_patients(
+    client: ClinicClient,
+    session_maker: async_sessionmaker = async_session_maker
+) -> SyncReport:
+    """Sync every active user linked to a clinic patient record."""
+    users_table: Table = User.__table__
+    async with session_maker() as session:
+        result = await session.execute(
+            select(users_table.c.id, users_table.c.clinic_patient_id).where(
+                users_table.c.clinic_patient_id.is_not(None),
+                users_table.c.status == "active"
+            )
+        )
+        patients = [(row.id, row.clinic_patient_id) for row in result]
+
+    engine = ClinicSyncEngine(client, session_maker=session_maker)
+    return await engine.sync_many(patients)
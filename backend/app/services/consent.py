@@ -0,0 +1,173 @@
+"""Current consent per user as a bitset.
+
+``ConsentRecord`` is an append-only history. What processing needs is the
+current answer, which fits in one bit per consent type. The bit is set
+when the latest record of that type grants the version currently in force
+(``settings.consent_versions``). A user's bits are reduced from history
+whenever their consents change and stored on ``users.consent_bits`` in the
+same transaction. A check is then a bit test on the user row that
+processing loads anyway, and a batch job filters on one integer column
+(``consent_bits & required = required``) without reading history.
+
+Run ``python -m app.services.consent rebuild`` after publishing a new
+document version so the column catches up.
+"""
+import asyncio
+import logging
+import sys
+from datetime import datetime
+from typing import Any, Iterable, Optional, Sequence
+from uuid import UUID
+
+from sqlalchemy import Row, Table, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import get_settings
+from app.database import async_session_maker
+from app.models.consent import ConsentRecord
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+records_table: Table = ConsentRecord.__table__
+users_table: Table = User.__table__
+
+CONSENT_TYPES = ("terms_of_service", "privacy_policy", "data_processing", "marketing")
+TERMS_OF_SERVICE, PRIVACY_POLICY, DATA_PROCESSING, MARKETING = (1 << bit for bit in range(len(CONSENT_TYPES)))
+_BITS = {consent_type: 1 << bit for bit, consent_type in enumerate(CONSENT_TYPES)}
+
+
+def consent_bit(consent_type: str) -> int:
+    """The bit for ``consent_type``; raises KeyError for an unknown type."""
+    return _BITS[consent_type]
+
+
+def has_consent(bits: int, required: int) -> bool:
+    """Whether ``bits`` include every consent in ``required``."""
+    return bits & required == required
+
+
+def current_consents(records: Iterable[Any]) -> dict[str, Any]:
+    """The latest record of each type, from records in ``created_at`` order."""
+    latest: dict[str, Any] = {}
+    for record in records:
+        latest[record.consent_type] = record
+    return latest
+
+
+def reduce_consents(records: Iterable[Any]) -> int:
+    """Consent bits from records in ``created_at`` order."""
+    bits = 0
+    for consent_type, record in current_consents(records).items():
+        if (
+            consent_type in _BITS
+            and record.granted
+            and record.version == settings.consent_versions.get(consent_type)
+        ):
+            bits |= _BITS[consent_type]
+    return bits
+
+
+def _history(user_ids: Sequence[UUID]) -> Any:
+    return (
+        select(
+            records_table.c.user_id,
+            records_table.c.consent_type,
+            records_table.c.version,
+            records_table.c.granted,
+            records_table.c.granted_at,
+            records_table.c.withdrawn_at
+        )
+        .where(records_table.c.user_id.in_(user_ids))
+        .order_by(records_table.c.user_id, records_table.c.created_at, records_table.c.id)
+    )
+
+
+async def consent_history(db: AsyncSession, user_id: UUID) -> list[Row]:
+    """The user's consent records, oldest first."""
+    result = await db.execute(_history([user_id]))
+    return result.all()
+
+
+async def record_consents(
+    db: AsyncSession,
+    user_id: UUID,
+    changes: Sequence[tuple[str, bool]],
+    ip_address: Optional[str] = None,
+    user_agent: Optional[str] = None
+) -> int:
+    """Append ``(consent_type, granted)`` records for the versions in force and
+    store the reduced bits. Does not commit. Returns the new bits.
+    """
+    # Serialise changes per user, so the bits reduce from history that includes every change
+    await db.execute(select(users_table.c.id).where(users_table.c.id == user_id).with_for_update())
+    now = datetime.utcnow()
+    await db.execute(
+        records_table.insert(),
+        [
+            {
+                "user_id": user_id,
+                "consent_type": consent_type,
+                "version": settings.consent_versions[consent_type],
+                "granted": granted,
+                "granted_at": now if granted else None,
+                "withdrawn_at": None if granted else now,
+                "ip_address": ip_address,
+                "user_agent": user_agent,
+                "created_at": now
+            }
+            for consent_type, granted in changes
+        ]
+    )
+    bits = reduce_consents(await consent_history(db, user_id))
+    await db.execute(
+        update(users_table)
+        .where(users_table.c.id == user_id)
+        .values(
+            consent_bits=bits,
+            data_processing_consent=has_consent(bits, DATA_PROCESSING),
+            marketing_consent=has_consent(bits, MARKETING),
+            gdpr_consent_date=now
+        )
+    )
+    return bits
+
+
+async def rebuild(session_maker: async_sessionmaker = async_session_maker, batch_size: int = 1000) -> int:
+    """Recompute ``users.consent_bits`` from history for every user. Returns rows changed."""
+    changed = 0
+    after: Optional[UUID] = None
+    while True:
+        async with session_maker() as session:
+            statement = select(users_table.c.id, users_table.c.consent_bits).order_by(users_table.c.id).limit(batch_size)
+            if after is not None:
+                statement = statement.where(users_table.c.id > after)
+            users = (await session.execute(statement)).all()
+            if not users:
+                return changed
+            history: dict[UUID, list[Row]] = {user.id: [] for user in users}
+            for record in await session.execute(_history(list(history))):
+                history[record.user_id].append(record)
+            for user in users:
+                bits = reduce_consents(history[user.id])
+                if bits != user.consent_bits:
+                    changed += 1
+                    await session.execute(
+                        update(users_table)
+                        .where(users_table.c.id == user.id)
+                        .values(
+                            consent_bits=bits,
+                            data_processing_consent=has_consent(bits, DATA_PROCESSING),
+                            marketing_consent=has_consent(bits, MARKETING)
+                        )
+                    )
+            await session.commit()
+        after = users[-1].id
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python -m app.services.consent rebuild")
+    print(f"updated consent bits for {asyncio.run(rebuild())} users")
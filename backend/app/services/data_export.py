@@ -0,0 +1,564 @@
+"""GDPR data exports (right of access) as a resumable background job.
+
+``POST /gdpr/data-export`` queues a ``DataRequest``. A worker
+(``python -m app.services.data_export run``) claims it with
+``FOR UPDATE SKIP LOCKED`` and a lease, then writes one ZIP archive:
+
+* ``<table>.jsonl`` per table, one JSON object per row, with every
+  ``*_encrypted`` column decrypted under its plain name;
+* ``documents/<id>/<file>`` and ``message_attachments/<id>/<file>``;
+* ``manifest.json`` last, with row and file counts.
+
+Each table is read in id order through a server-side cursor. Chunks of
+``export_chunk_rows`` rows are decrypted and encoded on a process pool
+(Fernet is CPU-bound), with two chunks per process in flight. Results are
+written in order. Memory stays flat whatever the archive size: the cursor
+window, the in-flight chunks and one multipart part.
+
+The archive is stored as a sequence of *pieces* of about
+``export_piece_size`` bytes. Each piece is its own encrypted object with a
+fresh key. A piece is cut only between chunks or files, after the
+compressor has been fully flushed. The checkpoint (pieces so far,
+``ZipWriter`` state, current step and last id) is committed straight
+after the cut. A restarted job resumes there, so at most one piece of
+work is repeated. Bytes rewritten after a restart go into a new piece
+under a new key, so no nonce is ever reused. Downloads stream the pieces
+back to back.
+"""
+import asyncio
+import base64
+import collections
+import logging
+import mimetypes
+import multiprocessing
+import re
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import aclosing
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Optional, Union
+from uuid import UUID, uuid4
+
+import orjson
+from sqlalchemy import Row, Table, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config import get_settings
+from app.core.encryption import field_encryption
+from app.core.zip_writer import STORED, ZipWriter
+from app.database import async_session_maker
+from app.models.appointment import Appointment
+from app.models.audit_log import AuditLog
+from app.models.consent import ConsentRecord, DataRequest
+from app.models.document import Document
+from app.models.health_record import HealthMeasurement, Symptom
+from app.models.medication import MedicationAdherence, PatientMedication
+from app.models.message import Message, MessageAttachment
+from app.models.notification import Notification
+from app.models.user import User
+from app.services.data_requests import LeaseLost, RequestJob, touch_request, utcnow
+from app.services.object_storage import EncryptedUpload, ObjectStorage
+from app.services.realtime import publish_event
+from app.services.user_keys import OwnerKeyShredded, ensure_owner_key
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+requests_table: Table = DataRequest.__table__
+users_table: Table = User.__table__
+messages_table: Table = Message.__table__
+attachments_table: Table = MessageAttachment.__table__
+documents_table: Table = Document.__table__
+medications_table: Table = PatientMedication.__table__
+
+REQUEST_TYPE = "export"
+ARCHIVE_MEDIA_TYPE = "application/zip"
+
+_ENCRYPTED_SUFFIX = "_encrypted"
+_UNSAFE_NAME = re.compile(r"[^\w.\- ]+")
+
+
+def _by_user(table: Table) -> Callable[[UUID], Any]:
+    return lambda user_id: table.c.user_id == user_id
+
+
+@dataclass(frozen=True)
+class TableExport:
+    """Rows of one table, written as ``<name>.jsonl``."""
+    name: str
+    table: Table
+    owned_by: Callable[[UUID], Any]
+    option: Optional[str] = None
+    exclude: tuple[str, ...] = ()
+
+    def columns(self) -> list[Any]:
+        # id first: it is the keyset and the chunk's resume point
+        return [self.table.c.id] + [
+            column for column in self.table.c
+            if column.name != "id" and column.name not in self.exclude
+        ]
+
+
+@dataclass(frozen=True)
+class FileExport:
+    """Stored files, written as ``<name>/<id>/<file name>``."""
+    name: str
+    table: Table
+    owned_by: Callable[[UUID], Any]
+    file_name: str
+    option: Optional[str] = None
+
+
+Step = Union[TableExport, FileExport]
+
+_JOB_COLUMNS = (
+    "options", "progress", "checkpoint_encrypted", "attempts", "locked_until",
+    "last_error", "result_encrypted", "result_size", "download_link_encrypted"
+)
+
+STEPS: tuple[Step, ...] = (
+    TableExport(
+        "account", users_table, lambda user_id: users_table.c.id == user_id,
+        exclude=("password_hash", "mfa_secret_encrypted", "calendar_feed_generation")
+    ),
+    TableExport("consent_records", ConsentRecord.__table__, _by_user(ConsentRecord.__table__)),
+    TableExport("data_requests", requests_table, _by_user(requests_table), exclude=_JOB_COLUMNS),
+    TableExport("audit_log", AuditLog.__table__, _by_user(AuditLog.__table__)),
+    TableExport(
+        "notifications", Notification.__table__, _by_user(Notification.__table__),
+        exclude=("dedupe_key",)
+    ),
+    TableExport(
+        "health_measurements", HealthMeasurement.__table__, _by_user(HealthMeasurement.__table__),
+        option="include_health_data"
+    ),
+    TableExport("symptoms", Symptom.__table__, _by_user(Symptom.__table__), option="include_health_data"),
+    TableExport("medications", medications_table, _by_user(medications_table), option="include_health_data"),
+    TableExport(
+        "medication_adherence",
+        MedicationAdherence.__table__,
+        lambda user_id: MedicationAdherence.__table__.c.medication_id.in_(
+            select(medications_table.c.id).where(medications_table.c.user_id == user_id)
+        ),
+        option="include_health_data"
+    ),
+    TableExport(
+        "appointments", Appointment.__table__, _by_user(Appointment.__table__),
+        option="include_appointments"
+    ),
+    TableExport("messages", messages_table, _by_user(messages_table), option="include_messages"),
+    TableExport(
+        "message_attachments",
+        attachments_table,
+        lambda user_id: attachments_table.c.message_id.in_(
+            select(messages_table.c.id).where(messages_table.c.user_id == user_id)
+        ),
+        option="include_messages",
+        exclude=("s3_key_encrypted", "blob_id")
+    ),
+    FileExport(
+        "message_attachments",
+        attachments_table,
+        lambda user_id: attachments_table.c.message_id.in_(
+            select(messages_table.c.id).where(messages_table.c.user_id == user_id)
+        ),
+        file_name="file_name",
+        option="include_messages"
+    ),
+    TableExport(
+        "documents", documents_table, _by_user(documents_table),
+        option="include_documents",
+        exclude=("s3_key_encrypted", "blob_id", "content_key")
+    ),
+    FileExport(
+        "documents", documents_table, _by_user(documents_table),
+        file_name="title",
+        option="include_documents"
+    ),
+)
+
+
+def export_plan(options: dict[str, Any]) -> list[Step]:
+    """Steps for a request's ``DataExportRequest`` flags (missing flags mean yes)."""
+    return [step for step in STEPS if step.option is None or options.get(step.option, True)]
+
+
+def encode_rows(rows: list[tuple], columns: tuple[str, ...]) -> bytes:
+    """Decrypt and encode a chunk of rows as JSON lines. Runs in a pool process."""
+    out = bytearray()
+    for row in rows:
+        record = {}
+        for name, value in zip(columns, row):
+            if name.endswith(_ENCRYPTED_SUFFIX):
+                record[name[:-len(_ENCRYPTED_SUFFIX)]] = field_encryption.decrypt_if_present(value)
+            elif isinstance(value, bytes):
+                record[name] = base64.b64encode(value).decode()
+            else:
+                record[name] = value
+        # default=str covers Decimal and INET values
+        out += orjson.dumps(record, default=str, option=orjson.OPT_APPEND_NEWLINE)
+    return bytes(out)
+
+
+def create_export_pool(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    # forkserver: never fork a process that already has event-loop and boto3 threads
+    return ProcessPoolExecutor(
+        max_workers=workers or settings.export_workers,
+        mp_context=multiprocessing.get_context("forkserver")
+    )
+
+
+def _member_file_name(row: Row, column: str, media_type: Optional[str]) -> str:
+    name = _UNSAFE_NAME.sub("_", getattr(row, column) or "").strip(" .") or "file"
+    if "." not in name and media_type:
+        name += mimetypes.guess_extension(media_type) or ""
+    return name[:200]
+
+
+def export_pieces(request: Any) -> list[dict[str, Any]]:
+    """The stored pieces of a completed export, in order."""
+    return orjson.loads(field_encryption.decrypt(request.result_encrypted))
+
+
+async def read_export(
+    storage: ObjectStorage,
+    pieces: list[dict[str, Any]],
+    start: int,
+    end: int,
+    owner_key: Optional[bytes] = None
+) -> AsyncIterator[bytes]:
+    """Yield archive bytes ``start..end`` (inclusive) across its pieces."""
+    position = 0
+    for piece in pieces:
+        first, last = position, position + piece["size"] - 1
+        position += piece["size"]
+        if last < start or first > end:
+            continue
+        async for chunk in storage.read_decrypted(
+            piece["key"], piece["size"], max(start - first, 0), min(end, last) - first, owner_key=owner_key
+        ):
+            yield chunk
+
+
+class _Archive:
+    """A ``ZipWriter`` whose output is stored as a series of encrypted pieces."""
+
+    def __init__(
+        self,
+        storage: ObjectStorage,
+        prefix: str,
+        piece_size: int,
+        writer: ZipWriter,
+        pieces: list[dict[str, Any]],
+        owner_key: Optional[bytes] = None
+    ):
+        self.storage = storage
+        self.owner_key = owner_key
+        self.prefix = prefix
+        self.piece_size = piece_size
+        self.writer = writer
+        self.pieces = pieces
+        self._piece: Optional[EncryptedUpload] = None
+
+    @property
+    def full(self) -> bool:
+        return self._piece is not None and self._piece.plaintext_size >= self.piece_size
+
+    async def emit(self, data: bytes) -> None:
+        if not data:
+            return
+        if self._piece is None:
+            key = f"{self.prefix}{len(self.pieces):05d}-{uuid4()}"
+            self._piece = self.storage.open_upload(key, ARCHIVE_MEDIA_TYPE, owner_key=self.owner_key)
+        await self._piece.write(data)
+
+    async def cut(self) -> None:
+        """Close the current piece at a resumable point."""
+        await self.emit(self.writer.flush())
+        if self._piece is not None:
+            piece, self._piece = self._piece, None
+            stored = await piece.close()
+            self.pieces.append({"key": stored.key, "size": stored.plaintext_size})
+
+    async def abort(self) -> None:
+        if self._piece is not None:
+            piece, self._piece = self._piece, None
+            await piece.abort()
+
+
+class DataExportJob(RequestJob):
+    """Claims export requests and writes their archives."""
+
+    request_type = REQUEST_TYPE
+    claim_columns = ("options", "checkpoint_encrypted")
+    abandon = (LeaseLost, OwnerKeyShredded)
+
+    def __init__(
+        self,
+        executor: Optional[Executor] = None,
+        storage: Optional[ObjectStorage] = None,
+        session_maker: async_sessionmaker = async_session_maker,
+        workers: Optional[int] = None,
+        chunk_rows: Optional[int] = None,
+        piece_size: Optional[int] = None,
+        lease_seconds: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        concurrency: Optional[int] = None
+    ):
+        super().__init__(
+            session_maker,
+            lease=timedelta(seconds=lease_seconds or settings.export_lease_seconds),
+            max_attempts=max_attempts or settings.export_max_attempts,
+            concurrency=concurrency,
+            poll_seconds=settings.export_poll_seconds
+        )
+        self.workers = workers or settings.export_workers
+        # Shared by every export this worker runs at once
+        self.executor = executor or create_export_pool(self.workers)
+        self._storage = storage
+        self.chunk_rows = chunk_rows or settings.export_chunk_rows
+        self.piece_size = piece_size or settings.export_piece_size
+
+    @property
+    def storage(self) -> ObjectStorage:
+        if self._storage is None:
+            self._storage = ObjectStorage()
+        return self._storage
+
+    async def _touch(self, request_id: UUID, **values: Any) -> None:
+        await touch_request(self.session_maker, request_id, self.lease, **values)
+
+    async def _encoded(
+        self,
+        rows: AsyncIterator[list[Row]],
+        columns: tuple[str, ...]
+    ) -> AsyncIterator[tuple[int, UUID, bytes]]:
+        """(row count, last id, JSON lines) per chunk, in order, encoded concurrently."""
+        loop = asyncio.get_running_loop()
+        pending: collections.deque = collections.deque()
+        try:
+            async for chunk in rows:
+                encoded = loop.run_in_executor(
+                    self.executor, encode_rows, [tuple(row) for row in chunk], columns
+                )
+                pending.append((len(chunk), chunk[-1][0], encoded))
+                if len(pending) >= 2 * self.workers:
+                    count, last_id, encoded = pending.popleft()
+                    yield count, last_id, await encoded
+            while pending:
+                count, last_id, encoded = pending.popleft()
+                yield count, last_id, await encoded
+        finally:
+            for *_, encoded in pending:
+                encoded.cancel()
+            # Release the cursor now rather than whenever the generator is collected
+            await rows.aclose()
+
+    async def _stream(self, statement: Any) -> AsyncIterator[list[Row]]:
+        async with self.session_maker() as session:
+            result = await session.stream(statement.execution_options(yield_per=self.chunk_rows))
+            async for chunk in result.partitions():
+                yield chunk
+
+    async def _export_table(
+        self,
+        step: TableExport,
+        user_id: UUID,
+        after: Optional[UUID],
+        archive: _Archive,
+        checkpoint: Callable[[UUID, int], Any]
+    ) -> int:
+        columns = step.columns()
+        statement = select(*columns).where(step.owned_by(user_id))
+        if after is not None:
+            statement = statement.where(step.table.c.id > after)
+        statement = statement.order_by(step.table.c.id)
+
+        if not archive.writer.in_member:
+            await archive.emit(archive.writer.start(f"{step.name}.jsonl"))
+        written = 0
+        async for count, last_id, data in self._encoded(
+            self._stream(statement), tuple(column.name for column in columns)
+        ):
+            await archive.emit(archive.writer.write(data))
+            written += count
+            await checkpoint(last_id, written)
+        await archive.emit(archive.writer.end())
+        return written
+
+    async def _export_files(
+        self,
+        step: FileExport,
+        user_id: UUID,
+        after: Optional[UUID],
+        archive: _Archive,
+        checkpoint: Callable[[UUID, int], Any],
+        owner_key: Optional[bytes] = None
+    ) -> int:
+        table = step.table
+        statement = (
+            select(table.c.id, table.c[step.file_name], table.c.file_type, table.c.file_size, table.c.s3_key_encrypted)
+            .where(step.owned_by(user_id))
+        )
+        if after is not None:
+            statement = statement.where(table.c.id > after)
+        statement = statement.order_by(table.c.id)
+
+        written = 0
+        async with aclosing(self._stream(statement)) as chunks:
+            async for chunk in chunks:
+                for row in chunk:
+                    name = f"{step.name}/{row.id}/{_member_file_name(row, step.file_name, row.file_type)}"
+                    # Documents and attachments are mostly compressed formats already
+                    await archive.emit(archive.writer.start(name, STORED))
+                    storage_key = field_encryption.decrypt(row.s3_key_encrypted)
+                    async for data in self.storage.read_decrypted(storage_key, row.file_size, owner_key=owner_key):
+                        await archive.emit(archive.writer.write(data))
+                    await archive.emit(archive.writer.end())
+                    written += 1
+                    await checkpoint(row.id, written)
+        return written
+
+    async def export(self, request: Row) -> tuple[list[dict[str, Any]], int]:
+        """Write (or finish writing) the archive for ``request``. Returns (pieces, size)."""
+        steps = export_plan(request.options or {})
+        state: dict[str, Any] = {"pieces": [], "zip": None, "step": 0, "after": None, "counts": {}}
+        if request.checkpoint_encrypted is not None:
+            state = orjson.loads(field_encryption.decrypt(request.checkpoint_encrypted))
+            logger.info("resuming export %s at step %d with %d pieces", request.id, state["step"], len(state["pieces"]))
+
+        async with self.session_maker() as session:
+            owner_key = await ensure_owner_key(session, request.user_id)
+            await session.commit()
+
+        writer = ZipWriter(state=state["zip"]) if state["zip"] else ZipWriter(modified=request.requested_at)
+        archive = _Archive(
+            self.storage, f"exports/{request.user_id}/{request.id}/", self.piece_size, writer, state["pieces"],
+            owner_key=owner_key
+        )
+        counts: dict[str, int] = state["counts"]
+        heartbeat_every = self.lease / 3
+        last_touch = datetime.now(timezone.utc)
+
+        def progress(index: int, rows: int = 0) -> dict[str, Any]:
+            return {
+                "step": steps[index].name if index < len(steps) else None,
+                "steps_done": index,
+                "steps_total": len(steps),
+                "rows": sum(counts.values()) + rows,
+                "bytes": writer.offset
+            }
+
+        try:
+            for index in range(state["step"], len(steps)):
+                step = steps[index]
+                key = f"{step.name}.jsonl" if isinstance(step, TableExport) else f"{step.name}/"
+                resumed = index == state["step"] and state["after"] is not None
+                after = UUID(state["after"]) if resumed else None
+                done = counts.get(key, 0) if resumed else 0
+                await self._touch(request.id, progress=progress(index))
+                last_touch = datetime.now(timezone.utc)
+
+                async def checkpoint(last_id: UUID, written: int) -> None:
+                    nonlocal last_touch
+                    if archive.full:
+                        await archive.cut()
+                        counts[key] = done + written
+                        snapshot = {
+                            "pieces": archive.pieces,
+                            "zip": writer.state(),
+                            "step": index,
+                            "after": str(last_id),
+                            "counts": counts
+                        }
+                        await self._touch(
+                            request.id,
+                            progress=progress(index),
+                            checkpoint_encrypted=field_encryption.encrypt(orjson.dumps(snapshot).decode())
+                        )
+                    elif datetime.now(timezone.utc) - last_touch >= heartbeat_every:
+                        await self._touch(request.id, progress=progress(index, done + written - counts.get(key, 0)))
+                    else:
+                        return
+                    last_touch = datetime.now(timezone.utc)
+
+                if isinstance(step, TableExport):
+                    written = await self._export_table(step, request.user_id, after, archive, checkpoint)
+                else:
+                    written = await self._export_files(step, request.user_id, after, archive, checkpoint, owner_key)
+                counts[key] = done + written
+
+            manifest = {
+                "request_id": request.id,
+                "user_id": request.user_id,
+                "requested_at": request.requested_at,
+                "generated_at": utcnow(),
+                "format": "json",
+                "counts": counts
+            }
+            await archive.emit(writer.add("manifest.json", orjson.dumps(manifest, option=orjson.OPT_INDENT_2)))
+            await archive.emit(writer.finish())
+            await archive.cut()
+        except BaseException:
+            await archive.abort()
+            raise
+        return archive.pieces, writer.offset
+
+    async def _complete(self, request: Row, pieces: list[dict[str, Any]], size: int) -> None:
+        now = utcnow()
+        await self._touch(
+            request.id,
+            status="completed",
+            completed_at=now,
+            locked_until=None,
+            checkpoint_encrypted=None,
+            last_error=None,
+            result_encrypted=field_encryption.encrypt(orjson.dumps(pieces).decode()),
+            result_size=size,
+            download_expires_at=now + timedelta(days=settings.export_retention_days),
+            progress={"steps_done": len(export_plan(request.options or {})), "bytes": size}
+        )
+        await publish_event(request.user_id, "data_export.ready", {"id": request.id, "size": size})
+
+    async def gave_up(self, request: Row, exc: BaseException) -> None:
+        await super().gave_up(request, exc)
+        await self.storage.delete_prefix(f"exports/{request.user_id}/{request.id}/")
+
+    async def expire(self) -> int:
+        """Delete archives past ``download_expires_at``. Returns how many were removed."""
+        async with self.session_maker() as session:
+            result = await session.execute(
+                update(requests_table)
+                .where(
+                    requests_table.c.request_type == REQUEST_TYPE,
+                    requests_table.c.status == "completed",
+                    requests_table.c.download_expires_at <= utcnow()
+                )
+                .values(status="expired", result_encrypted=None)
+                .returning(requests_table.c.id, requests_table.c.user_id)
+            )
+            expired = result.all()
+            await session.commit()
+        for request in expired:
+            await self.storage.delete_prefix(f"exports/{request.user_id}/{request.id}/")
+        return len(expired)
+
+    async def maintain(self) -> None:
+        await self.expire()
+
+    async def process(self, request: Row) -> None:
+        pieces, size = await self.export(request)
+        await self._complete(request, pieces, size)
+        logger.info("export %s completed pieces=%d bytes=%d", request.id, len(pieces), size)
+
+
+async def _main() -> None:
+    await DataExportJob().run_forever()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["run"]:
+        sys.exit("usage: python -m app.services.data_export run")
+    asyncio.run(_main())
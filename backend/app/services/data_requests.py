@@ -0,0 +1,313 @@
+"""Lease-based lifecycle shared by the jobs that work through ``DataRequest`` rows.
+
+A worker claims the oldest due request of its type with ``FOR UPDATE SKIP
+LOCKED`` and holds it by a lease (``locked_until``). A heartbeat renews the
+lease every third of its length while the job runs. The job itself records
+checkpoints in ``progress`` / ``checkpoint_encrypted``. If the worker dies
+the lease runs out and the next claim picks the request up again, resuming
+from the last checkpoint. ``attempts`` counts claims, so a request that
+keeps failing is eventually given up on. Until then it goes back to
+``pending``, with ``locked_until`` as the time it may be retried.
+
+``job_concurrency`` caps the requests of each type running at once across
+all workers. Claims of a type take a transaction-scoped advisory lock and
+count the live leases before taking another. SQLite (development and
+tests) has no advisory locks; its in-process runner serialises capped
+claims under one process-wide lock instead.
+
+``RequestJob`` runs all of this for one request type. Subclasses implement
+``process``. ``app.services.jobs`` runs the jobs on Celery or in-process.
+"""
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+from uuid import UUID
+
+from sqlalchemy import Row, Table, and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import get_settings
+from app.database import async_session_maker
+from app.models.consent import DataRequest
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+requests_table: Table = DataRequest.__table__
+
+# SQLite fallback for the advisory lock; only one process runs jobs there
+_development_lock = asyncio.Lock()
+
+
+class LeaseLost(Exception):
+    """The request is no longer ``processing`` under this worker."""
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _lock_key(request_type: str) -> int:
+    digest = hashlib.blake2b(f"data_requests:{request_type}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+async def claim_request(
+    session: AsyncSession,
+    request_type: str,
+    lease: timedelta,
+    *columns: Any,
+    limit: Optional[int] = None
+) -> Optional[Row]:
+    """Claim the oldest due request of ``request_type`` and commit.
+
+    Due means pending and not backing off, or processing under a lease
+    that ran out. With ``limit``, nothing is claimed while that many
+    requests of the type hold a live lease. Returns the request's id,
+    user_id, requested_at, attempts and ``columns``.
+    """
+    if limit is not None and session.bind.dialect.name != "postgresql":
+        async with _development_lock:
+            return await _claim(session, request_type, lease, columns, limit)
+    return await _claim(session, request_type, lease, columns, limit)
+
+
+async def _claim(
+    session: AsyncSession,
+    request_type: str,
+    lease: timedelta,
+    columns: tuple[Any, ...],
+    limit: Optional[int]
+) -> Optional[Row]:
+    now = utcnow()
+    if limit is not None:
+        if session.bind.dialect.name == "postgresql":
+            # Serialise claims of this type, so two workers cannot both see a free slot
+            await session.execute(select(func.pg_advisory_xact_lock(_lock_key(request_type))))
+        running = await session.scalar(
+            select(func.count())
+            .select_from(requests_table)
+            .where(
+                requests_table.c.request_type == request_type,
+                requests_table.c.status == "processing",
+                requests_table.c.locked_until > now
+            )
+        )
+        if running >= limit:
+            await session.commit()
+            return None
+    due = (
+        select(requests_table.c.id)
+        .where(
+            requests_table.c.request_type == request_type,
+            or_(
+                and_(
+                    requests_table.c.status == "pending",
+                    or_(requests_table.c.locked_until.is_(None), requests_table.c.locked_until <= now)
+                ),
+                and_(requests_table.c.status == "processing", requests_table.c.locked_until <= now)
+            )
+        )
+        .order_by(requests_table.c.requested_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    result = await session.execute(
+        update(requests_table)
+        .where(requests_table.c.id.in_(due.scalar_subquery()))
+        .values(
+            status="processing",
+            attempts=requests_table.c.attempts + 1,
+            locked_until=now + lease
+        )
+        .returning(
+            requests_table.c.id,
+            requests_table.c.user_id,
+            requests_table.c.requested_at,
+            requests_table.c.attempts,
+            *columns
+        )
+    )
+    claimed = result.first()
+    await session.commit()
+    return claimed
+
+
+def touch_statement(request_id: UUID, lease: timedelta, **values: Any) -> Any:
+    """UPDATE renewing the lease on a processing request and setting ``values``."""
+    return (
+        update(requests_table)
+        .where(requests_table.c.id == request_id, requests_table.c.status == "processing")
+        .values(**{"locked_until": utcnow() + lease, **values})
+    )
+
+
+async def touch_request(
+    session_maker: async_sessionmaker,
+    request_id: UUID,
+    lease: timedelta,
+    **values: Any
+) -> None:
+    """Renew the lease, recording ``values``; raises ``LeaseLost`` if the request moved on."""
+    async with session_maker() as session:
+        result = await session.execute(touch_statement(request_id, lease, **values))
+        await session.commit()
+    if result.rowcount == 0:
+        raise LeaseLost(str(request_id))
+
+
+async def fail_request(
+    session_maker: async_sessionmaker,
+    request: Row,
+    exc: BaseException,
+    lease: timedelta,
+    max_attempts: int
+) -> bool:
+    """Record a failed attempt. Returns True once the request is given up on.
+
+    Otherwise it goes back to pending and is retried after a back-off,
+    resuming from its last checkpoint.
+    """
+    failed = request.attempts >= max_attempts
+    values: dict[str, Any] = {"last_error": f"{type(exc).__name__}: {exc}"[:1000]}
+    if failed:
+        values["status"] = "failed"
+    else:
+        # Pending frees the concurrency slot; locked_until holds the retry back
+        values["status"] = "pending"
+        values["locked_until"] = utcnow() + lease * request.attempts
+    async with session_maker() as session:
+        await session.execute(
+            update(requests_table)
+            .where(requests_table.c.id == request.id, requests_table.c.status == "processing")
+            .values(**values)
+        )
+        await session.commit()
+    return failed
+
+
+class RequestJob:
+    """Claims and runs the requests of one ``request_type``.
+
+    Subclasses set ``request_type`` and implement ``process``. ``process``
+    should checkpoint through ``touch_request`` and raise ``LeaseLost`` when
+    that fails. Exceptions in ``abandon`` drop the request without counting
+    a failure. Any other exception is a failed attempt.
+    """
+
+    request_type: str
+    claim_columns: tuple[str, ...] = ()
+    abandon: tuple[type[BaseException], ...] = (LeaseLost,)
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker = async_session_maker,
+        lease: timedelta = timedelta(minutes=5),
+        max_attempts: int = 5,
+        concurrency: Optional[int] = None,
+        poll_seconds: float = 5.0
+    ):
+        self.session_maker = session_maker
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.concurrency = concurrency or settings.job_concurrency.get(self.request_type, 1)
+        self.poll_seconds = poll_seconds
+
+    async def process(self, request: Row) -> None:
+        raise NotImplementedError
+
+    async def gave_up(self, request: Row, exc: BaseException) -> None:
+        """Called once a request is marked failed."""
+        logger.error("%s request %s gave up after %d attempts", self.request_type, request.id, request.attempts)
+
+    async def maintain(self) -> None:
+        """Periodic housekeeping, run before each drain."""
+
+    async def claim(self) -> Optional[Row]:
+        async with self.session_maker() as session:
+            return await claim_request(
+                session,
+                self.request_type,
+                self.lease,
+                *(requests_table.c[name] for name in self.claim_columns),
+                limit=self.concurrency
+            )
+
+    async def _status(self, request_id: UUID) -> Optional[str]:
+        async with self.session_maker() as session:
+            return await session.scalar(select(requests_table.c.status).where(requests_table.c.id == request_id))
+
+    async def _heartbeat(self, request_id: UUID) -> bool:
+        """Renew the lease until cancelled. Returns whether the request moved on without this worker."""
+        interval = self.lease.total_seconds() / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await touch_request(self.session_maker, request_id, self.lease)
+            except LeaseLost:
+                # Completed by the job itself in the meantime is not a loss
+                return await self._status(request_id) != "completed"
+            except Exception as exc:
+                # Keep trying: the lease only lapses if this goes on for two more beats
+                logger.warning("%s request %s heartbeat failed: %s", self.request_type, request_id, exc)
+
+    async def run(self, request: Row) -> None:
+        """Process a claimed request under a heartbeat and record the outcome."""
+        work = asyncio.create_task(self.process(request))
+        beat = asyncio.create_task(self._heartbeat(request.id))
+        try:
+            await asyncio.wait({work, beat}, return_when=asyncio.FIRST_COMPLETED)
+            if not work.done() and beat.result():
+                work.cancel()
+            await asyncio.wait({work})
+        finally:
+            beat.cancel()
+            work.cancel()
+            await asyncio.gather(work, beat, return_exceptions=True)
+
+        if work.cancelled():
+            logger.warning("%s request %s lost its lease; abandoning", self.request_type, request.id)
+            return
+        exc = work.exception()
+        if exc is None:
+            return
+        if isinstance(exc, self.abandon):
+            logger.warning("%s request %s abandoned: %r", self.request_type, request.id, exc)
+            return
+        logger.error(
+            "%s request %s failed (attempt %d)", self.request_type, request.id, request.attempts, exc_info=exc
+        )
+        if await fail_request(self.session_maker, request, exc, self.lease, self.max_attempts):
+            await self.gave_up(request, exc)
+
+    async def run_once(self) -> bool:
+        """Process one request if any is due and a slot is free. Returns whether one was claimed."""
+        request = await self.claim()
+        if request is None:
+            return False
+        await self.run(request)
+        return True
+
+    async def drain(self) -> int:
+        """Run due requests, up to ``concurrency`` at once, until none is left. Returns how many ran."""
+        ran = 0
+
+        async def lane() -> None:
+            nonlocal ran
+            while await self.run_once():
+                ran += 1
+
+        await asyncio.gather(*(lane() for _ in range(self.concurrency)))
+        return ran
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                await self.maintain()
+                await self.drain()
+            except Exception:
+                logger.exception("%s jobs failed", self.request_type)
+            await asyncio.sleep(self.poll_seconds)
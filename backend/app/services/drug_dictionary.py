@@ -0,0 +1,314 @@
+"""Medication dictionary with a memory-mapped prefix/trigram index.
+
+A dictionary extract (dm+d, RxNorm, ...) is a delimited text file with a
+``code`` and a ``name`` column. It is compiled once into a flat binary
+index, which every worker memory-maps read-only, so the pages are shared
+through the OS page cache rather than copied into each process.
+
+Index layout (little-endian uint32 arrays, each section 4-byte aligned)::
+
+    header        magic, entry count, trigram count, section lengths
+    key_offsets   count + 1 offsets into the normalised-name blob (sorted)
+    text_offsets  count + 1 offsets into the "code\\tdisplay name" blob
+    code_order    entry ids sorted by code, for code lookups
+    trigrams      sorted 24-bit trigram keys
+    post_offsets  trigram count + 1 offsets into postings
+    postings      entry ids per trigram
+    keys, texts   utf-8 blobs
+
+Prefix search is a binary search over the sorted keys. Trigram overlap is
+only used as a fallback for misspellings once prefix matches run out, and
+reads the rarest trigram posting lists first under a fixed budget.
+
+Opening the dictionary may compile the index first, which takes seconds
+for a full extract. The API loads it at startup in a worker thread, and
+async callers go through ``load_drug_dictionary``, so neither blocks the
+event loop.
+"""
+import asyncio
+import csv
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from app.config import get_settings
+
+settings = get_settings()
+
+MAGIC = b"DRUGIDX1"
+_HEADER = struct.Struct("<8sIIIII")
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+# Upper bound on postings read per fuzzy lookup, keeping misspelling fallback sub-millisecond
+FUZZY_SCAN_BUDGET = 8192
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, strip accents and collapse punctuation to single spaces."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    ascii_name = decomposed.encode("ascii", "ignore").decode()
+    return _NON_ALNUM.sub(" ", ascii_name.lower()).strip()
+
+
+def _trigrams(key: bytes) -> set[int]:
+    padded = b" " + key + b" "
+    return {int.from_bytes(padded[i:i + 3], "big") for i in range(len(padded) - 2)}
+
+
+@dataclass(frozen=True)
+class DrugEntry:
+    """A dictionary product."""
+    code: str
+    name: str
+
+
+def _pad(blob: bytes) -> bytes:
+    return blob + b"\0" * (-len(blob) % 4)
+
+
+def _u32(values: Iterable[int]) -> bytes:
+    data = list(values)
+    return struct.pack(f"<{len(data)}I", *data)
+
+
+def build_index(source_path: str, index_path: str) -> int:
+    """Compile a ``code``/``name`` extract into an index file. Returns the entry count."""
+    with open(source_path, newline="", encoding="utf-8") as handle:
+        sample = handle.read(4096)
+        handle.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=",\t|")
+        reader = csv.DictReader(handle, dialect=dialect)
+        entries: dict[str, tuple[str, str]] = {}
+        for row in reader:
+            code, name = (row.get("code") or "").strip(), (row.get("name") or "").strip()
+            key = normalize_name(name)
+            if code and key and key not in entries:
+                entries[key] = (code, name)
+
+    keys = sorted(entries)
+    key_blob, text_blob = bytearray(), bytearray()
+    key_offsets, text_offsets = [0], [0]
+    postings: dict[int, list[int]] = defaultdict(list)
+    for entry_id, key in enumerate(keys):
+        code, name = entries[key]
+        key_bytes = key.encode()
+        key_blob += key_bytes
+        text_blob += f"{code}\t{name}".encode()
+        key_offsets.append(len(key_blob))
+        text_offsets.append(len(text_blob))
+        for trigram in _trigrams(key_bytes):
+            postings[trigram].append(entry_id)
+
+    code_order = sorted(range(len(keys)), key=lambda i: entries[keys[i]][0])
+    trigram_keys = sorted(postings)
+    post_offsets, flat_postings = [0], []
+    for trigram in trigram_keys:
+        flat_postings.extend(postings[trigram])
+        post_offsets.append(len(flat_postings))
+
+    sections = [
+        _u32(key_offsets),
+        _u32(text_offsets),
+        _u32(code_order),
+        _u32(trigram_keys),
+        _u32(post_offsets),
+        _u32(flat_postings),
+        _pad(bytes(key_blob)),
+        _pad(bytes(text_blob)),
+    ]
+    header = _HEADER.pack(
+        MAGIC, len(keys), len(trigram_keys), len(flat_postings), len(key_blob), len(text_blob)
+    )
+
+    # A private temporary name per build: workers building lazily at the same
+    # time each replace the index with a complete file of their own
+    with tempfile.NamedTemporaryFile(
+        "wb", dir=os.path.dirname(os.path.abspath(index_path)), prefix=".drug-index-", delete=False
+    ) as out:
+        try:
+            out.write(_pad(header))
+            for section in sections:
+                out.write(section)
+        except BaseException:
+            out.close()
+            os.unlink(out.name)
+            raise
+    # mkstemp creates the file owner-only; other worker users only need to read it
+    os.chmod(out.name, 0o644)
+    os.replace(out.name, index_path)
+    return len(keys)
+
+
+class DrugDictionary:
+    """Read-only view over a memory-mapped index file."""
+
+    def __init__(self, index_path: str):
+        with open(index_path, "rb") as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, trigram_count, postings_len, keys_len, texts_len = _HEADER.unpack_from(
+            self._mmap, 0
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{index_path} is not a drug dictionary index")
+
+        self.count = count
+        view = memoryview(self._mmap)
+        position = _HEADER.size + (-_HEADER.size % 4)
+
+        def take(length: int, cast: bool = True) -> memoryview:
+            nonlocal position
+            section = view[position:position + length * (4 if cast else 1)]
+            position += len(section) + (-len(section) % 4)
+            return section.cast("I") if cast else section
+
+        self._key_offsets = take(count + 1)
+        self._text_offsets = take(count + 1)
+        self._code_order = take(count)
+        self._trigram_keys = take(trigram_count)
+        self._post_offsets = take(trigram_count + 1)
+        self._postings = take(postings_len)
+        self._keys = take(keys_len, cast=False)
+        self._texts = take(texts_len, cast=False)
+
+    def _key(self, entry_id: int) -> bytes:
+        return bytes(self._keys[self._key_offsets[entry_id]:self._key_offsets[entry_id + 1]])
+
+    def _entry(self, entry_id: int) -> DrugEntry:
+        text = bytes(
+            self._texts[self._text_offsets[entry_id]:self._text_offsets[entry_id + 1]]
+        ).decode()
+        code, name = text.split("\t", 1)
+        return DrugEntry(code=code, name=name)
+
+    def lookup(self, name: str) -> Optional[DrugEntry]:
+        """Exact match on the normalised name."""
+        key = normalize_name(name).encode()
+        entry_id = bisect_left(range(self.count), key, key=self._key)
+        if entry_id < self.count and self._key(entry_id) == key:
+            return self._entry(entry_id)
+        return None
+
+    def by_code(self, code: str) -> Optional[DrugEntry]:
+        """Find an entry by its dictionary code."""
+        position = bisect_left(
+            range(self.count), code, key=lambda i: self._entry(self._code_order[i]).code
+        )
+        if position < self.count:
+            entry = self._entry(self._code_order[position])
+            if entry.code == code:
+                return entry
+        return None
+
+    def _prefix_ids(self, key: bytes, limit: int) -> list[int]:
+        start = bisect_left(range(self.count), key, key=self._key)
+        ids = []
+        for entry_id in range(start, min(start + limit, self.count)):
+            if not self._key(entry_id).startswith(key):
+                break
+            ids.append(entry_id)
+        return ids
+
+    def _trigram_ids(self, key: bytes, limit: int, exclude: set[int]) -> list[int]:
+        postings = []
+        for trigram in _trigrams(key):
+            slot = bisect_left(self._trigram_keys, trigram)
+            if slot < len(self._trigram_keys) and self._trigram_keys[slot] == trigram:
+                postings.append((self._post_offsets[slot], self._post_offsets[slot + 1]))
+
+        # Rarest trigrams are the most selective; stop once the scan budget is spent
+        postings.sort(key=lambda bounds: bounds[1] - bounds[0])
+        scores: Counter = Counter()
+        scanned = used = 0
+        for start, end in postings:
+            if used and scanned + (end - start) > FUZZY_SCAN_BUDGET:
+                break
+            scores.update(self._postings[start:end])
+            scanned += end - start
+            used += 1
+
+        threshold = max(1, used // 2)
+        ranked = [
+            entry_id for entry_id, hits in scores.most_common()
+            if hits >= threshold and entry_id not in exclude
+        ]
+        return ranked[:limit]
+
+    def search(self, query: str, limit: int = 10) -> list[DrugEntry]:
+        """Prefix matches first, topped up with fuzzy trigram matches."""
+        key = normalize_name(query).encode()
+        if not key:
+            return []
+
+        ids = self._prefix_ids(key, limit)
+        if len(ids) < limit and len(key) >= 3:
+            ids += self._trigram_ids(key, limit - len(ids), set(ids))
+        return [self._entry(entry_id) for entry_id in ids]
+
+    def close(self) -> None:
+        for section in (
+            self._key_offsets, self._text_offsets, self._code_order, self._trigram_keys,
+            self._post_offsets, self._postings, self._keys, self._texts
+        ):
+            section.release()
+        self._mmap.close()
+
+
+_dictionary: Optional[DrugDictionary] = None
+_load_lock = threading.Lock()
+
+
+def get_drug_dictionary() -> Optional[DrugDictionary]:
+    """Open the configured dictionary once per process, compiling it if needed.
+
+    Blocking; async code uses ``load_drug_dictionary``. None when no
+    dictionary is configured yet, which is not cached, so one installed
+    later is picked up.
+    """
+    global _dictionary
+    if _dictionary is not None:
+        return _dictionary
+
+    with _load_lock:
+        if _dictionary is None:
+            index_path = settings.drug_index_path
+            if not index_path:
+                return None
+            if not os.path.exists(index_path):
+                source_path = settings.drug_dictionary_path
+                if not source_path or not os.path.exists(source_path):
+                    return None
+                build_index(source_path, index_path)
+            _dictionary = DrugDictionary(index_path)
+    return _dictionary
+
+
+async def load_drug_dictionary() -> Optional[DrugDictionary]:
+    """``get_drug_dictionary`` without blocking the event loop on the first load."""
+    if _dictionary is not None:
+        return _dictionary
+    return await asyncio.to_thread(get_drug_dictionary)
+
+
+async def match_medication(name: str, code: Optional[str] = None) -> Optional[DrugEntry]:
+    """Resolve a medication to a dictionary entry by code, falling back to its name."""
+    dictionary = await load_drug_dictionary()
+    if dictionary is None:
+        return None
+    entry = dictionary.by_code(code) if code else None
+    return entry or dictionary.lookup(name)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m app.services.drug_dictionary <source.csv> <index.bin>")
+    print(f"indexed {build_index(sys.argv[1], sys.argv[2])} products")
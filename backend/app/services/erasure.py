@@ -0,0 +1,353 @@
+"""GDPR erasure: cut an account off at once, then delete its data in the background.
+
+``request_erasure`` runs in the caller's transaction. It makes the account
+unusable and its data unreadable straight away:
+
+- the owner key is shredded, so every blob the user stored under it
+  (documents, attachments, previews, export archives) can no longer be
+  decrypted, wherever copies of it live;
+- the user row is tombstoned (``status="deleted"``, which authentication
+  rejects) and stripped of direct identifiers, and sessions are revoked;
+- open export requests are rejected, so no archive is written for an
+  account that is going away.
+
+``ErasureJob`` then removes the rows, one table at a time, children first.
+Each batch is one ``DELETE ... WHERE pk IN (SELECT ... LIMIT n)`` committed
+together with the request's progress and lease. Transactions stay short,
+locks are held briefly and WAL volume is spread out, with a short pause
+between batches. Stored objects are removed under the user's prefixes
+concurrently with the row deletes. Last, the user row goes, and the
+erasure request is kept (with ``user_id`` nulled) as the record that it
+happened.
+
+Audit log entries are kept as the security record, but their IP address
+and user agent are cleared. They hold only the user's id, which no longer
+resolves to anyone.
+
+Usage: ``python -m app.services.erasure run``
+"""
+import asyncio
+import logging
+import sys
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Callable, Optional
+from uuid import UUID
+
+from sqlalchemy import Row, Table, and_, delete, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import get_settings
+from app.core.encryption import field_encryption
+from app.database import async_session_maker
+from app.models.appointment import Appointment
+from app.models.audit_log import AuditLog
+from app.models.blob import StoredBlob
+from app.models.clinic_sync import ClinicSyncCursor
+from app.models.consent import ConsentRecord, DataRequest
+from app.models.device import Device
+from app.models.document import Document, DocumentPreview
+from app.models.health_record import HealthMeasurement, Symptom
+from app.models.medication import MedicationAdherence, PatientMedication
+from app.models.message import Message, MessageAttachment, MessageSearchToken
+from app.models.notification import Notification
+from app.models.outbox import ClinicOutbox
+from app.models.session import Session
+from app.models.user import User
+from app.services.data_export import REQUEST_TYPE as EXPORT_REQUEST_TYPE
+from app.services.data_requests import (
+    LeaseLost,
+    RequestJob,
+    touch_request,
+    touch_statement,
+    utcnow,
+)
+from app.services.object_storage import ObjectStorage
+from app.services.user_keys import shred_owner_key
+from app.services.versions import RESOURCES, bump_version
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+requests_table: Table = DataRequest.__table__
+users_table: Table = User.__table__
+sessions_table: Table = Session.__table__
+messages_table: Table = Message.__table__
+attachments_table: Table = MessageAttachment.__table__
+documents_table: Table = Document.__table__
+medications_table: Table = PatientMedication.__table__
+
+REQUEST_TYPE = "delete"
+
+# Everything stored for a user lives under these prefixes, except
+# attachments uploaded before blob storage, which are removed one by one.
+# Documents synced before files were copied still point at the EMR's
+# objects; those are not ours to delete.
+OBJECT_PREFIXES = ("blobs", "previews", "exports")
+
+
+def _by_user(table: Table) -> Callable[[UUID], Any]:
+    return lambda user_id: table.c.user_id == user_id
+
+
+def _by_parent(table: Table, column: str, parent: Table) -> Callable[[UUID], Any]:
+    return lambda user_id: table.c[column].in_(
+        select(parent.c.id).where(parent.c.user_id == user_id)
+    )
+
+
+@dataclass(frozen=True)
+class Purge:
+    """One user's rows in one table, removed in batches."""
+    name: str
+    table: Table
+    owned_by: Callable[[UUID], Any]
+    # Null these columns instead of deleting the rows
+    detach: tuple[str, ...] = ()
+    # Rows may point at an object outside the user's prefixes (no blob_id)
+    files: bool = False
+
+    def batch(self, user_id: UUID, size: int) -> Any:
+        key = list(self.table.primary_key.columns)
+        condition = self.owned_by(user_id)
+        if self.detach:
+            condition = and_(condition, or_(*(self.table.c[name].is_not(None) for name in self.detach)))
+        return select(*key).where(condition).limit(size)
+
+    def statement(self, keys: Any) -> Any:
+        """Delete (or detach) the rows whose keys are in ``keys``, a list or a ``batch`` select."""
+        key = list(self.table.primary_key.columns)
+        match = key[0].in_(keys) if len(key) == 1 else tuple_(*key).in_(keys)
+        if self.detach:
+            return update(self.table).where(match).values({name: None for name in self.detach})
+        return delete(self.table).where(match)
+
+
+STEPS: tuple[Purge, ...] = (
+    Purge("message_search_tokens", MessageSearchToken.__table__, _by_user(MessageSearchToken.__table__)),
+    Purge("clinic_outbox", ClinicOutbox.__table__, _by_user(ClinicOutbox.__table__)),
+    Purge(
+        "message_attachments", attachments_table, _by_parent(attachments_table, "message_id", messages_table),
+        files=True
+    ),
+    # Replies reference their parent without ON DELETE; unlink the thread first
+    Purge("message_threads", messages_table, _by_user(messages_table), detach=("parent_message_id",)),
+    Purge("messages", messages_table, _by_user(messages_table)),
+    Purge("document_previews", DocumentPreview.__table__, _by_user(DocumentPreview.__table__)),
+    Purge("documents", documents_table, _by_user(documents_table)),
+    Purge("stored_blobs", StoredBlob.__table__, _by_user(StoredBlob.__table__)),
+    Purge(
+        "medication_adherence", MedicationAdherence.__table__,
+        _by_parent(MedicationAdherence.__table__, "medication_id", medications_table)
+    ),
+    Purge("medications", medications_table, _by_user(medications_table)),
+    Purge("health_measurements", HealthMeasurement.__table__, _by_user(HealthMeasurement.__table__)),
+    Purge("symptoms", Symptom.__table__, _by_user(Symptom.__table__)),
+    Purge("notifications", Notification.__table__, _by_user(Notification.__table__)),
+    Purge("appointments", Appointment.__table__, _by_user(Appointment.__table__)),
+    Purge("consent_records", ConsentRecord.__table__, _by_user(ConsentRecord.__table__)),
+    Purge("devices", Device.__table__, _by_user(Device.__table__)),
+    Purge("sessions", sessions_table, _by_user(sessions_table)),
+    Purge("clinic_sync_cursors", ClinicSyncCursor.__table__, _by_user(ClinicSyncCursor.__table__)),
+    Purge(
+        "data_requests", requests_table,
+        lambda user_id: and_(requests_table.c.user_id == user_id, requests_table.c.request_type != REQUEST_TYPE)
+    ),
+    Purge("audit_logs", AuditLog.__table__, _by_user(AuditLog.__table__), detach=("ip_address", "user_agent")),
+)
+
+
+async def request_erasure(db: AsyncSession, user_id: UUID, reason: Optional[str] = None) -> Row:
+    """Cut the account off and queue its erasure. Does not commit.
+
+    Returns the erasure request (id, status, requested_at). Asking again
+    while one is queued returns that one.
+    """
+    result = await db.execute(
+        select(requests_table.c.id, requests_table.c.status, requests_table.c.requested_at)
+        .where(
+            requests_table.c.user_id == user_id,
+            requests_table.c.request_type == REQUEST_TYPE,
+            requests_table.c.status.in_(("pending", "processing"))
+        )
+        .limit(1)
+    )
+    existing = result.first()
+    if existing is not None:
+        return existing
+
+    now = utcnow()
+    await shred_owner_key(db, user_id)
+    await db.execute(
+        update(users_table)
+        .where(users_table.c.id == user_id)
+        .values(
+            status="deleted",
+            deleted_at=now,
+            email=f"deleted-{user_id}@invalid",
+            email_verified=False,
+            phone=None,
+            phone_verified=False,
+            password_hash="!",  # matches no password
+            nhs_number=None,
+            clinic_patient_id=None,
+            first_name_encrypted=field_encryption.encrypt(""),
+            last_name_encrypted=field_encryption.encrypt(""),
+            date_of_birth_encrypted=None,
+            mfa_enabled=False,
+            mfa_secret_encrypted=None,
+            data_processing_consent=False,
+            marketing_consent=False,
+            consent_bits=0,
+            updated_at=now
+        )
+    )
+    await db.execute(
+        update(sessions_table)
+        .where(sessions_table.c.user_id == user_id, sessions_table.c.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )
+    await db.execute(
+        update(requests_table)
+        .where(
+            requests_table.c.user_id == user_id,
+            requests_table.c.request_type == EXPORT_REQUEST_TYPE,
+            requests_table.c.status.in_(("pending", "processing"))
+        )
+        .values(status="rejected", notes="Account erased", locked_until=None)
+    )
+    result = await db.execute(
+        requests_table.insert()
+        .values(
+            user_id=user_id,
+            request_type=REQUEST_TYPE,
+            status="pending",
+            requested_at=now,
+            notes=reason
+        )
+        .returning(requests_table.c.id, requests_table.c.status, requests_table.c.requested_at)
+    )
+    return result.one()
+
+
+class ErasureJob(RequestJob):
+    """Claims erasure requests and deletes everything the user owns."""
+
+    request_type = REQUEST_TYPE
+    claim_columns = ("progress",)
+
+    def __init__(
+        self,
+        storage: Optional[ObjectStorage] = None,
+        session_maker: async_sessionmaker = async_session_maker,
+        batch_size: Optional[int] = None,
+        pause_seconds: Optional[float] = None,
+        lease_seconds: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        concurrency: Optional[int] = None
+    ):
+        super().__init__(
+            session_maker,
+            lease=timedelta(seconds=lease_seconds or settings.erasure_lease_seconds),
+            max_attempts=max_attempts or settings.erasure_max_attempts,
+            concurrency=concurrency,
+            poll_seconds=settings.erasure_poll_seconds
+        )
+        self._storage = storage
+        self.batch_size = batch_size or settings.erasure_batch_size
+        self.pause_seconds = settings.erasure_pause_seconds if pause_seconds is None else pause_seconds
+
+    @property
+    def storage(self) -> ObjectStorage:
+        if self._storage is None:
+            self._storage = ObjectStorage()
+        return self._storage
+
+    async def _purge_batch(self, request_id: UUID, user_id: UUID, step: Purge, progress: dict[str, Any]) -> int:
+        """Remove one batch of ``step`` and record progress. Returns the rows affected."""
+        batch = step.batch(user_id, self.batch_size)
+        if step.files:
+            table = step.table
+            async with self.session_maker() as session:
+                result = await session.execute(batch.add_columns(table.c.s3_key_encrypted, table.c.blob_id))
+                rows = result.all()
+            if not rows:
+                return 0
+            # Objects first: a crash in between leaves rows whose object is already gone
+            storage_keys = [field_encryption.decrypt(row.s3_key_encrypted) for row in rows if row.blob_id is None]
+            await asyncio.gather(*(self.storage.delete(key) for key in storage_keys))
+            progress["objects"] += len(storage_keys)
+            batch = [row.id for row in rows]
+
+        async with self.session_maker() as session:
+            result = await session.execute(step.statement(batch))
+            progress["rows"] += result.rowcount
+            touched = await session.execute(touch_statement(request_id, self.lease, progress=progress))
+            if touched.rowcount == 0:
+                await session.rollback()
+                raise LeaseLost(str(request_id))
+            await session.commit()
+        return result.rowcount
+
+    async def _sweep(self, user_id: UUID) -> int:
+        deleted = 0
+        for prefix in OBJECT_PREFIXES:
+            deleted += await self.storage.delete_prefix(f"{prefix}/{user_id}/")
+        return deleted
+
+    async def erase(self, request: Row) -> dict[str, Any]:
+        """Delete (or finish deleting) the user's data. Returns the final progress."""
+        progress: dict[str, Any] = {"step": None, "steps_done": 0, "steps_total": len(STEPS), "rows": 0, "objects": 0}
+        progress.update(request.progress or {})
+        user_id = request.user_id
+
+        sweep = asyncio.create_task(self._sweep(user_id))
+        try:
+            for index in range(progress["steps_done"], len(STEPS)):
+                step = STEPS[index]
+                progress["step"] = step.name
+                while await self._purge_batch(request.id, user_id, step, progress) >= self.batch_size:
+                    await asyncio.sleep(self.pause_seconds)
+                progress["steps_done"] = index + 1
+                await touch_request(self.session_maker, request.id, self.lease, progress=progress)
+            progress["objects"] += await sweep
+        finally:
+            sweep.cancel()
+
+        progress["step"] = None
+        async with self.session_maker() as session:
+            # The user row goes last: anything a step missed cascades with it
+            result = await session.execute(touch_statement(
+                request.id,
+                self.lease,
+                user_id=None,
+                status="completed",
+                completed_at=utcnow(),
+                locked_until=None,
+                last_error=None,
+                progress=progress
+            ))
+            if result.rowcount == 0:
+                await session.rollback()
+                raise LeaseLost(str(request.id))
+            await session.execute(delete(users_table).where(users_table.c.id == user_id))
+            await session.commit()
+        # A still-unexpired access token must not revalidate the deleted data
+        for resource in RESOURCES:
+            await bump_version(user_id, resource)
+        return progress
+
+    async def process(self, request: Row) -> None:
+        progress = await self.erase(request)
+        logger.info("erasure %s completed rows=%d objects=%d", request.id, progress["rows"], progress["objects"])
+
+
+async def _main() -> None:
+    await ErasureJob().run_forever()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["run"]:
+        sys.exit("usage: python -m app.services.erasure run")
+    asyncio.run(_main())
@@ -0,0 +1,138 @@
+"""Inbox thread listing.
+
+A thread is every message sharing a ``thread_id``. A message stored
+without one is the root of the thread named by its own id. One query
+aggregates a user's messages per ``thread_id``, reading
+``ix_messages_user_thread_created`` in order, into one head per thread: the
+latest activity and the number of unread clinic replies. The keyset
+cursor filters those heads, which are ordered by
+``(last_message_at, thread_id)`` descending, so messages are never ranked
+one by one. Only the heads on the returned page look up their root
+subject, and only those subjects are decrypted.
+"""
+import base64
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import Table, case, func, or_, select, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.encryption import field_encryption
+from app.models.message import Message
+
+messages_table: Table = Message.__table__
+
+# Messages from the clinic that the patient has not opened yet
+_UNREAD = (messages_table.c.direction == "outbound") & messages_table.c.read_at.is_(None)
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+@dataclass
+class ThreadSummary:
+    """One inbox row."""
+    thread_id: UUID
+    subject: str
+    last_message_at: datetime
+    unread_count: int
+
+
+def encode_cursor(last_message_at: datetime, thread_id: UUID) -> str:
+    raw = f"{last_message_at.isoformat()}|{thread_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, thread_id = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), UUID(thread_id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise InvalidCursor("Invalid cursor") from exc
+
+
+async def list_threads(
+    db: AsyncSession,
+    user_id: UUID,
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> tuple[list[ThreadSummary], Optional[str]]:
+    """Return one page of threads and the cursor for the next page."""
+    unread = case((_UNREAD, 1), else_=0)
+    threaded = (
+        select(
+            messages_table.c.thread_id,
+            func.max(messages_table.c.created_at).label("last_message_at"),
+            func.sum(unread).label("unread_count")
+        )
+        .where(messages_table.c.user_id == user_id, messages_table.c.thread_id.is_not(None))
+        .group_by(messages_table.c.thread_id)
+    )
+    unthreaded = select(
+        messages_table.c.id.label("thread_id"),
+        messages_table.c.created_at.label("last_message_at"),
+        unread.label("unread_count")
+    ).where(messages_table.c.user_id == user_id, messages_table.c.thread_id.is_(None))
+    parts = union_all(threaded, unthreaded).subquery()
+
+    # A root without thread_id and its replies meet again here
+    heads = (
+        select(
+            parts.c.thread_id,
+            func.max(parts.c.last_message_at).label("last_message_at"),
+            func.sum(parts.c.unread_count).label("unread_count")
+        )
+        .group_by(parts.c.thread_id)
+        .subquery()
+    )
+
+    root = messages_table.alias("root")
+    subject = (
+        select(root.c.subject_encrypted)
+        .where(
+            root.c.user_id == user_id,
+            or_(root.c.thread_id == heads.c.thread_id, root.c.id == heads.c.thread_id)
+        )
+        .order_by(root.c.created_at, root.c.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+    # Subjects stay encrypted bytes in SQL; only the page below is decrypted
+    query = (
+        select(
+            heads.c.thread_id,
+            subject.label("subject_encrypted"),
+            heads.c.last_message_at,
+            heads.c.unread_count
+        )
+        .order_by(heads.c.last_message_at.desc(), heads.c.thread_id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        after_at, after_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(heads.c.last_message_at, heads.c.thread_id) < tuple_(after_at, after_id)
+        )
+
+    rows = (await db.execute(query)).all()
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = encode_cursor(last.last_message_at, last.thread_id)
+
+    summaries = [
+        ThreadSummary(
+            thread_id=row.thread_id,
+            subject=field_encryption.decrypt(row.subject_encrypted),
+            last_message_at=row.last_message_at,
+            unread_count=row.unread_count or 0
+        )
+        for row in page
+    ]
+    return summaries, next_cursor
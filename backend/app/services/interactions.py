@@ -0,0 +1,274 @@
+"""Drug-drug interaction screening over a patient's active medications.
+
+The interaction dataset is a delimited file with ``code_a``, ``code_b``,
+``severity`` and ``description`` columns, keyed by medication dictionary
+code. It is loaded once into a symmetric adjacency map, so screening one
+medication against N others is N dictionary lookups.
+
+Warnings are stored on ``PatientMedication.interaction_warnings``, which
+keeps list and detail reads free of screening work. They are recomputed
+whenever a patient's active medication set changes; an inactive medication
+carries none. Adding a medication only touches the rows it interacts with
+(``screen_added``). ``rescreen_all`` refreshes every patient after the
+dataset is replaced.
+"""
+import asyncio
+import csv
+import hashlib
+import logging
+import sys
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Optional
+from uuid import UUID
+
+from sqlalchemy import Table, bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import get_settings
+from app.database import async_session_maker
+from app.models.medication import PatientMedication
+from app.services.versions import MEDICATIONS, bump_version
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+medications_table: Table = PatientMedication.__table__
+
+SEVERITY_ORDER = {"contraindicated": 0, "major": 1, "moderate": 2, "minor": 3}
+
+
+@dataclass(frozen=True)
+class Interaction:
+    """A known interaction between two dictionary codes."""
+    severity: str
+    description: str
+
+
+class InteractionIndex:
+    """Symmetric adjacency map ``code -> {other_code: Interaction}``."""
+
+    def __init__(self, adjacency: dict[str, dict[str, Interaction]], version: str):
+        self._adjacency = adjacency
+        self.version = version
+
+    @classmethod
+    def from_file(cls, path: str) -> "InteractionIndex":
+        adjacency: dict[str, dict[str, Interaction]] = {}
+        digest = hashlib.sha256()
+        with open(path, newline="", encoding="utf-8") as handle:
+            sample = handle.read(4096)
+            handle.seek(0)
+            dialect = csv.Sniffer().sniff(sample, delimiters=",\t|")
+            for row in csv.DictReader(handle, dialect=dialect):
+                code_a, code_b = row["code_a"].strip(), row["code_b"].strip()
+                if not code_a or not code_b or code_a == code_b:
+                    continue
+                interaction = Interaction(
+                    severity=row.get("severity", "moderate").strip().lower(),
+                    description=row.get("description", "").strip()
+                )
+                adjacency.setdefault(code_a, {})[code_b] = interaction
+                adjacency.setdefault(code_b, {})[code_a] = interaction
+                digest.update(f"{code_a}|{code_b}|{interaction}".encode())
+        return cls(adjacency, digest.hexdigest()[:16])
+
+    def between(self, code_a: str, code_b: str) -> Optional[Interaction]:
+        return self._adjacency.get(code_a, {}).get(code_b)
+
+    def partners(self, code: Optional[str]) -> dict[str, Interaction]:
+        """Codes that interact with ``code``."""
+        return self._adjacency.get(code, {}) if code else {}
+
+    def warnings_for(
+        self,
+        code: Optional[str],
+        others: list[tuple[Optional[str], str]]
+    ) -> list[dict[str, Any]]:
+        """Warnings for ``code`` against ``(code, name)`` pairs, most severe first."""
+        neighbours = self.partners(code)
+        if not neighbours:
+            return []
+
+        warnings = []
+        for other_code, other_name in others:
+            interaction = neighbours.get(other_code) if other_code else None
+            if interaction:
+                warnings.append(_warning(other_code, other_name, interaction))
+        return _by_severity(warnings)
+
+
+def _warning(code: str, name: str, interaction: Interaction) -> dict[str, Any]:
+    return {
+        "medication_code": code,
+        "medication_name": name,
+        "severity": interaction.severity,
+        "description": interaction.description
+    }
+
+
+def _by_severity(warnings: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    return sorted(warnings, key=lambda w: SEVERITY_ORDER.get(w["severity"], len(SEVERITY_ORDER)))
+
+
+@lru_cache
+def get_interaction_index() -> Optional[InteractionIndex]:
+    """Load the configured dataset once per process (restart workers to pick up updates)."""
+    if not settings.drug_interactions_path:
+        return None
+    return InteractionIndex.from_file(settings.drug_interactions_path)
+
+
+async def rescreen_patient(
+    db: AsyncSession,
+    user_id: UUID,
+    index: Optional[InteractionIndex] = None
+) -> dict[UUID, list[dict[str, Any]]]:
+    """Recompute warnings for a patient's medications.
+
+    Active medications are screened against each other, and inactive ones
+    lose any warnings they still carry. Runs one SELECT and, if anything
+    changed, one executemany UPDATE. Does not commit. Returns the current
+    warnings of the active medications by id.
+    """
+    current, _ = await _rescreen(db, user_id, index or get_interaction_index())
+    return current
+
+
+async def _rescreen(
+    db: AsyncSession,
+    user_id: UUID,
+    index: Optional[InteractionIndex]
+) -> tuple[dict[UUID, list[dict[str, Any]]], bool]:
+    """``rescreen_patient``, plus whether any stored warnings changed."""
+    if index is None:
+        return {}, False
+
+    result = await db.execute(
+        select(
+            medications_table.c.id,
+            medications_table.c.medication_code,
+            medications_table.c.medication_name,
+            medications_table.c.interaction_warnings,
+            medications_table.c.is_active
+        ).where(medications_table.c.user_id == user_id)
+    )
+    rows = result.all()
+    active = [row for row in rows if row.is_active]
+
+    current: dict[UUID, list[dict[str, Any]]] = {}
+    changed = []
+    for row in rows:
+        if row.is_active:
+            others = [(o.medication_code, o.medication_name) for o in active if o.id != row.id]
+            warnings = index.warnings_for(row.medication_code, others)
+            current[row.id] = warnings
+        else:
+            warnings = []
+        if warnings != (row.interaction_warnings or []):
+            changed.append({"_id": row.id, "_warnings": warnings})
+
+    await _store_warnings(db, changed)
+    return current, bool(changed)
+
+
+async def _store_warnings(db: AsyncSession, changed: list[dict[str, Any]]) -> None:
+    if changed:
+        await db.execute(
+            update(medications_table)
+            .where(medications_table.c.id == bindparam("_id"))
+            .values(interaction_warnings=bindparam("_warnings")),
+            changed
+        )
+
+
+async def screen_added(
+    db: AsyncSession,
+    user_id: UUID,
+    medication_id: UUID,
+    code: Optional[str],
+    name: str,
+    index: Optional[InteractionIndex] = None
+) -> list[dict[str, Any]]:
+    """Screen a newly added active medication against the patient's others.
+
+    Only the new medication and the ones it interacts with change, so this
+    is a single pass over the patient's list rather than ``rescreen_patient``'s
+    pairwise one. A code with no known interactions costs no query at all;
+    otherwise it is one SELECT and, on a hit, one executemany UPDATE. Does
+    not commit. Returns the new medication's warnings.
+    """
+    index = index or get_interaction_index()
+    neighbours = index.partners(code) if index is not None else {}
+    if not neighbours:
+        return []
+
+    result = await db.execute(
+        select(
+            medications_table.c.id,
+            medications_table.c.medication_code,
+            medications_table.c.medication_name,
+            medications_table.c.interaction_warnings
+        ).where(
+            medications_table.c.user_id == user_id,
+            medications_table.c.is_active == True,
+            medications_table.c.medication_code.is_not(None),
+            medications_table.c.id != medication_id
+        )
+    )
+
+    warnings = []
+    changed = []
+    for row in result:
+        interaction = neighbours.get(row.medication_code)
+        if interaction is None:
+            continue
+        warnings.append(_warning(row.medication_code, row.medication_name, interaction))
+        others = _by_severity([*(row.interaction_warnings or []), _warning(code, name, interaction)])
+        changed.append({"_id": row.id, "_warnings": others})
+    if changed:
+        warnings = _by_severity(warnings)
+        changed.append({"_id": medication_id, "_warnings": warnings})
+    await _store_warnings(db, changed)
+    return warnings
+
+
+async def rescreen_all(
+    session_maker: async_sessionmaker = async_session_maker,
+    concurrency: int = 8
+) -> int:
+    """Re-screen every patient with coded active medications. Returns patients screened."""
+    index = get_interaction_index()
+    if index is None:
+        return 0
+
+    async with session_maker() as session:
+        result = await session.execute(
+            select(medications_table.c.user_id).where(
+                medications_table.c.is_active == True,
+                medications_table.c.medication_code.is_not(None)
+            ).distinct()
+        )
+        user_ids = result.scalars().all()
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(user_id: UUID) -> None:
+        async with semaphore:
+            async with session_maker() as session:
+                _, changed = await _rescreen(session, user_id, index)
+                await session.commit()
+            if changed:
+                # Clients must not keep revalidating the old warnings
+                await bump_version(user_id, MEDICATIONS)
+
+    await asyncio.gather(*(run(user_id) for user_id in user_ids))
+    logger.info("interaction rescreen version=%s patients=%d", index.version, len(user_ids))
+    return len(user_ids)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rescreen"]:
+        sys.exit("usage: python -m app.services.interactions rescreen")
+    print(f"rescreened {asyncio.run(rescreen_all())} patients")
@@ -0,0 +1,92 @@
+"""Run the ``DataRequest`` jobs (exports, erasures) on Celery or in one process.
+
+Celery (``job_runner = "celery"``), one worker per request type::
+
+    celery -A app.services.jobs beat
+    celery -A app.services.jobs worker -Q jobs.export --pool=solo
+    celery -A app.services.jobs worker -Q jobs.delete --pool=solo
+
+Beat sends ``drain_requests`` to each type's queue every poll interval. A
+task runs the type's housekeeping, then runs due requests, up to the type's
+concurrency at once, until none is left. The message is only a nudge:
+request state lives in ``data_requests``. A lost or repeated message costs
+nothing, a worker killed mid-task leaves a lease that runs out, and nudges
+that wait longer than one interval expire unseen. Each worker process keeps
+one event loop across tasks, so pooled database and Redis connections stay
+usable. Use the solo pool: exports start their own process pool, which
+prefork's daemonic children cannot.
+
+In-process (``job_runner = "inprocess"``) is for single-node deployments
+and tests. The API runs every job's loop on startup, or ``python -m
+app.services.jobs run`` runs them on their own.
+"""
+import asyncio
+import sys
+from functools import lru_cache
+from typing import Any, Coroutine, Iterable, Optional
+
+from celery import Celery
+
+from app.config import get_settings
+from app.services.data_export import REQUEST_TYPE as EXPORT_REQUEST_TYPE, DataExportJob
+from app.services.data_requests import RequestJob
+from app.services.erasure import REQUEST_TYPE as ERASURE_REQUEST_TYPE, ErasureJob
+
+settings = get_settings()
+
+POLL_SECONDS = {
+    EXPORT_REQUEST_TYPE: settings.export_poll_seconds,
+    ERASURE_REQUEST_TYPE: settings.erasure_poll_seconds,
+}
+
+celery_app = Celery("stratosphere", broker=settings.redis_url)
+celery_app.conf.update(
+    task_ignore_result=True,
+    worker_prefetch_multiplier=1,
+    beat_schedule={
+        f"drain-{request_type}": {
+            "task": "app.services.jobs.drain_requests",
+            "schedule": poll_seconds,
+            "args": (request_type,),
+            "options": {"queue": f"jobs.{request_type}", "expires": poll_seconds},
+        }
+        for request_type, poll_seconds in POLL_SECONDS.items()
+    },
+)
+
+
+@lru_cache
+def get_jobs() -> dict[str, RequestJob]:
+    return {job.request_type: job for job in (DataExportJob(), ErasureJob())}
+
+
+@lru_cache
+def _event_loop() -> asyncio.AbstractEventLoop:
+    return asyncio.new_event_loop()
+
+
+def _run(coroutine: Coroutine[Any, Any, Any]) -> Any:
+    return _event_loop().run_until_complete(coroutine)
+
+
+async def drain(request_type: str) -> int:
+    job = get_jobs()[request_type]
+    await job.maintain()
+    return await job.drain()
+
+
+@celery_app.task(name="app.services.jobs.drain_requests")
+def drain_requests(request_type: str) -> int:
+    """Run the due requests of ``request_type``. Returns how many ran."""
+    return _run(drain(request_type))
+
+
+async def run_in_process(jobs: Optional[Iterable[RequestJob]] = None) -> None:
+    """Every job's polling loop in the running event loop, until cancelled."""
+    await asyncio.gather(*(job.run_forever() for job in (jobs or get_jobs().values())))
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["run"]:
+        sys.exit("usage: python -m app.services.jobs run")
+    asyncio.run(run_in_process())
@@ -0,0 +1,171 @@
+"""Blind-index search over encrypted message subjects and bodies.
+
+Each distinct normalised word of a message is stored as
+``HMAC-SHA256(user_key, word)[:16]`` in ``message_search_tokens``.
+``user_key`` is derived per user, so the same word yields unrelated tokens
+for different patients and token frequencies cannot be compared across
+users. A query is tokenised the same way and answered from the
+``(user_id, token)`` primary key. Only the matching messages are
+decrypted.
+
+Matching is whole-word and AND across query words. There is no prefix or
+fuzzy matching, because every extra indexed form leaks more about the
+plaintext.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import re
+import sys
+import unicodedata
+from typing import Iterable, Optional
+from uuid import UUID
+
+from sqlalchemy import Row, Table, delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import get_settings
+from app.core.encryption import field_encryption
+from app.database import async_session_maker
+from app.models.message import Message, MessageSearchToken
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+messages_table: Table = Message.__table__
+tokens_table: Table = MessageSearchToken.__table__
+
+TOKEN_SIZE = 16
+MIN_WORD_LENGTH = 2
+MAX_WORD_LENGTH = 64
+MAX_QUERY_WORDS = 8
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_words(text: str) -> set[str]:
+    """Distinct lowercase ASCII words, accents stripped."""
+    folded = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+    return {
+        word for word in _WORD.findall(folded)
+        if MIN_WORD_LENGTH <= len(word) <= MAX_WORD_LENGTH
+    }
+
+
+def _user_key(user_id: UUID) -> bytes:
+    master = (settings.search_index_key or settings.encryption_key).encode()
+    return hmac.new(master, b"message-search:" + user_id.bytes, hashlib.sha256).digest()
+
+
+def blind_tokens(user_id: UUID, words: Iterable[str]) -> set[bytes]:
+    key = _user_key(user_id)
+    return {
+        hmac.new(key, word.encode(), hashlib.sha256).digest()[:TOKEN_SIZE]
+        for word in words
+    }
+
+
+async def index_message(
+    db: AsyncSession,
+    user_id: UUID,
+    message_id: UUID,
+    subject: str,
+    body: str
+) -> int:
+    """Add a new message's tokens in the caller's transaction. Returns the token count."""
+    tokens = blind_tokens(user_id, normalize_words(f"{subject}\n{body}"))
+    if tokens:
+        await db.execute(
+            insert(tokens_table),
+            [{"user_id": user_id, "token": token, "message_id": message_id} for token in tokens]
+        )
+    return len(tokens)
+
+
+async def search_messages(
+    db: AsyncSession,
+    user_id: UUID,
+    query: str,
+    limit: int = 20
+) -> list[Row]:
+    """The user's messages containing every query word, newest first (still encrypted)."""
+    words = sorted(normalize_words(query))[:MAX_QUERY_WORDS]
+    if not words:
+        return []
+    tokens = blind_tokens(user_id, words)
+
+    matches = (
+        select(tokens_table.c.message_id)
+        .where(tokens_table.c.user_id == user_id, tokens_table.c.token.in_(tokens))
+        .group_by(tokens_table.c.message_id)
+        .having(func.count() == len(tokens))
+        .subquery()
+    )
+    result = await db.execute(
+        select(messages_table)
+        .join(matches, matches.c.message_id == messages_table.c.id)
+        .order_by(messages_table.c.created_at.desc(), messages_table.c.id.desc())
+        .limit(limit)
+    )
+    return list(result.all())
+
+
+async def rebuild_user_index(db: AsyncSession, user_id: UUID, batch_size: int = 500) -> int:
+    """Recompute a user's tokens from their messages. Does not commit."""
+    await db.execute(delete(tokens_table).where(tokens_table.c.user_id == user_id))
+
+    indexed = 0
+    stream = await db.stream(
+        select(
+            messages_table.c.id,
+            messages_table.c.subject_encrypted,
+            messages_table.c.body_encrypted
+        ).where(messages_table.c.user_id == user_id)
+        .execution_options(yield_per=batch_size)
+    )
+    async for batch in stream.partitions():
+        rows = []
+        for message in batch:
+            words = normalize_words(
+                field_encryption.decrypt(message.subject_encrypted) + "\n"
+                + field_encryption.decrypt(message.body_encrypted)
+            )
+            rows.extend(
+                {"user_id": user_id, "token": token, "message_id": message.id}
+                for token in blind_tokens(user_id, words)
+            )
+        if rows:
+            await db.execute(insert(tokens_table), rows)
+        indexed += len(batch)
+    return indexed
+
+
+async def rebuild_index(
+    session_maker: async_sessionmaker = async_session_maker,
+    user_id: Optional[UUID] = None
+) -> int:
+    """Rebuild the blind index (after a key rotation or tokenizer change). Returns messages indexed."""
+    async with session_maker() as session:
+        if user_id is not None:
+            user_ids = [user_id]
+        else:
+            result = await session.execute(select(messages_table.c.user_id).distinct())
+            user_ids = list(result.scalars().all())
+
+    total = 0
+    for uid in user_ids:
+        # One short transaction per user keeps lock time bounded
+        async with session_maker() as session:
+            total += await rebuild_user_index(session, uid)
+            await session.commit()
+    logger.info("message search index rebuilt users=%d messages=%d", len(user_ids), total)
+    return total
+
+
+if __name__ == "__main__":
+    if not sys.argv[1:] or sys.argv[1] != "rebuild" or len(sys.argv) > 3:
+        sys.exit("usage: python -m app.services.message_search rebuild [user_id]")
+    target = UUID(sys.argv[2]) if len(sys.argv) == 3 else None
+    print(f"indexed {asyncio.run(rebuild_index(user_id=target))} messages")
@@ -0,0 +1,273 @@
+"""Encrypted object storage on S3 (or any S3-compatible endpoint).
+
+Uploads stream through ``SegmentEncryptor`` into S3 multipart parts, so a
+worker holds about one part of ciphertext per upload no matter how large
+the file is. Set ``s3_endpoint_url`` to point at MinIO or another
+S3-compatible stand-in for local development and tests.
+"""
+import asyncio
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, AsyncIterator, Optional
+
+import boto3
+from botocore.config import Config
+
+from app.config import get_settings
+from app.core.streaming_encryption import (
+    HEADER_SIZE, TAG_SIZE, SegmentDecryptor, SegmentEncryptor
+)
+
+settings = get_settings()
+
+# S3 rejects multipart parts below 5 MiB except for the final part
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised when a stream exceeds the caller's size limit."""
+
+
+@dataclass
+class StoredObject:
+    """Result of a completed upload."""
+    key: str
+    plaintext_size: int
+    stored_size: int
+    parts: int
+
+
+@lru_cache
+def get_s3_client() -> Any:
+    """Shared boto3 client; its connection pool is reused across uploads."""
+    return boto3.client(
+        "s3",
+        region_name=settings.aws_region,
+        endpoint_url=settings.s3_endpoint_url,
+        aws_access_key_id=settings.aws_access_key_id,
+        aws_secret_access_key=settings.aws_secret_access_key,
+        config=Config(max_pool_connections=settings.s3_max_pool_connections)
+    )
+
+
+async def read_chunks(source: Any, chunk_size: int) -> AsyncIterator[bytes]:
+    """Iterate an ``UploadFile``-like object with an async ``read(size)``."""
+    while True:
+        chunk = await source.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+class ObjectStorage:
+    """Streaming encrypted uploads to a single bucket."""
+
+    def __init__(
+        self,
+        client: Any = None,
+        bucket: Optional[str] = None,
+        part_size: Optional[int] = None
+    ):
+        self.client = client or get_s3_client()
+        self.bucket = bucket or settings.s3_bucket
+        if not self.bucket:
+            raise ValueError("s3_bucket is not configured")
+        self.part_size = max(part_size or settings.s3_multipart_part_size, MIN_PART_SIZE)
+
+    async def _call(self, method: str, **kwargs: Any) -> Any:
+        # boto3 is blocking; keep the event loop free while parts are in flight
+        return await asyncio.to_thread(getattr(self.client, method), Bucket=self.bucket, **kwargs)
+
+    def open_upload(
+        self,
+        key: str,
+        content_type: str = "application/octet-stream",
+        owner_key: Optional[bytes] = None
+    ) -> "EncryptedUpload":
+        """Start a push-style encrypted upload; see ``EncryptedUpload``."""
+        return EncryptedUpload(self, key, content_type, owner_key)
+
+    async def upload_encrypted(
+        self,
+        key: str,
+        chunks: AsyncIterator[bytes],
+        max_size: Optional[int] = None,
+        content_type: str = "application/octet-stream",
+        owner_key: Optional[bytes] = None
+    ) -> StoredObject:
+        """Encrypt ``chunks`` on the fly and store them under ``key``.
+
+        Objects smaller than one part go up in a single PUT; anything larger
+        uses multipart upload, which is aborted if the stream fails. Pass the
+        owning user's ``owner_key`` so the object can be crypto-shredded.
+        """
+        upload = self.open_upload(key, content_type, owner_key)
+        try:
+            async for chunk in chunks:
+                if max_size is not None and upload.plaintext_size + len(chunk) > max_size:
+                    raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+                await upload.write(chunk)
+            return await upload.close()
+        except BaseException:
+            await upload.abort()
+            raise
+
+    async def _open_range(self, key: str, first: int, last: int) -> Any:
+        response = await self._call("get_object", Key=key, Range=f"bytes={first}-{last}")
+        return response["Body"]
+
+    async def _read_exact(self, body: Any, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = await asyncio.to_thread(body.read, size - len(data))
+            if not chunk:
+                raise IOError("Stored object is shorter than expected")
+            data += chunk
+        return bytes(data)
+
+    async def read_decrypted(
+        self,
+        key: str,
+        plaintext_size: int,
+        start: int = 0,
+        end: Optional[int] = None,
+        owner_key: Optional[bytes] = None
+    ) -> AsyncIterator[bytes]:
+        """Yield plaintext bytes ``start..end`` (inclusive) of an encrypted object.
+
+        Two small ranged GETs are made: one for the header and one for just
+        the segments covering the range. Segments are decrypted one at a
+        time, so first-byte latency and memory do not depend on object size.
+        """
+        end = plaintext_size - 1 if end is None else end
+        if plaintext_size == 0 or start > end:
+            return
+
+        body = await self._open_range(key, 0, HEADER_SIZE - 1)
+        decryptor = SegmentDecryptor(await self._read_exact(body, HEADER_SIZE), owner_key=owner_key)
+        body.close()
+
+        segment_size = decryptor.segment_size
+        total_segments = max(1, -(-plaintext_size // segment_size))
+        first, last = start // segment_size, end // segment_size
+        stored_last = decryptor.segment_offset(last + 1) - 1
+        if last == total_segments - 1:
+            stored_last = decryptor.segment_offset(last) + (plaintext_size - last * segment_size) + TAG_SIZE - 1
+
+        body = await self._open_range(key, decryptor.segment_offset(first), stored_last)
+        try:
+            for index in range(first, last + 1):
+                is_last = index == total_segments - 1
+                plain_len = plaintext_size - index * segment_size if is_last else segment_size
+                ciphertext = await self._read_exact(body, plain_len + TAG_SIZE)
+                plaintext = decryptor.decrypt_segment(index, ciphertext, is_last)
+
+                lo = start - index * segment_size if index == first else 0
+                hi = end - index * segment_size + 1 if index == last else len(plaintext)
+                yield plaintext[lo:hi]
+        finally:
+            body.close()
+
+    async def delete(self, key: str) -> None:
+        await self._call("delete_object", Key=key)
+
+    async def delete_prefix(self, prefix: str) -> int:
+        """Delete every object under ``prefix``. Returns the number deleted."""
+        deleted = 0
+        token: Optional[str] = None
+        while True:
+            kwargs: dict[str, Any] = {"Prefix": prefix}
+            if token:
+                kwargs["ContinuationToken"] = token
+            listing = await self._call("list_objects_v2", **kwargs)
+            keys = [{"Key": item["Key"]} for item in listing.get("Contents", [])]
+            if keys:
+                # A listing page is at most 1000 keys, the DeleteObjects limit
+                await self._call("delete_objects", Delete={"Objects": keys, "Quiet": True})
+                deleted += len(keys)
+            if not listing.get("IsTruncated"):
+                return deleted
+            token = listing["NextContinuationToken"]
+
+
+class EncryptedUpload:
+    """An upload fed by ``write`` calls instead of an iterator.
+
+    Used where the producer drives the stream, such as a job writing an
+    archive as it goes. Holds at most one segment of plaintext and one part
+    of ciphertext. Call ``close`` to finish or ``abort`` on failure.
+    """
+
+    def __init__(self, storage: ObjectStorage, key: str, content_type: str, owner_key: Optional[bytes] = None):
+        self.storage = storage
+        self.key = key
+        self.content_type = content_type
+        self._encryptor = SegmentEncryptor(owner_key=owner_key)
+        self.plaintext_size = 0
+        self.stored_size = len(self._encryptor.header)
+        self._plaintext = bytearray()
+        self._buffer = bytearray(self._encryptor.header)
+        self._upload_id: Optional[str] = None
+        self._parts: list[dict[str, Any]] = []
+
+    async def _flush(self) -> None:
+        if self._upload_id is None:
+            created = await self.storage._call(
+                "create_multipart_upload", Key=self.key, ContentType=self.content_type
+            )
+            self._upload_id = created["UploadId"]
+        # Hand the buffer over rather than copying it
+        body, self._buffer = self._buffer, bytearray()
+        number = len(self._parts) + 1
+        response = await self.storage._call(
+            "upload_part", Key=self.key, UploadId=self._upload_id, PartNumber=number, Body=body
+        )
+        self._parts.append({"PartNumber": number, "ETag": response["ETag"]})
+
+    def _encrypt(self, segment: bytes, last: bool) -> None:
+        encrypted = self._encryptor.encrypt_segment(segment, last)
+        self._buffer += encrypted
+        self.stored_size += len(encrypted)
+
+    async def write(self, data: bytes) -> None:
+        self._plaintext += data
+        self.plaintext_size += len(data)
+        segment_size = self._encryptor.segment_size
+        # Keep at least one byte back so the final segment is flagged last
+        if len(self._plaintext) > segment_size:
+            view, offset = memoryview(self._plaintext), 0
+            while len(self._plaintext) - offset > segment_size:
+                self._encrypt(bytes(view[offset:offset + segment_size]), last=False)
+                offset += segment_size
+            view.release()
+            del self._plaintext[:offset]
+        if len(self._buffer) >= self.storage.part_size:
+            await self._flush()
+
+    async def close(self) -> StoredObject:
+        self._encrypt(bytes(self._plaintext), last=True)
+        self._plaintext = bytearray()
+        if self._upload_id is None:
+            await self.storage._call(
+                "put_object", Key=self.key, Body=bytes(self._buffer), ContentType=self.content_type
+            )
+        else:
+            if self._buffer:
+                await self._flush()
+            await self.storage._call(
+                "complete_multipart_upload",
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": self._parts}
+            )
+        return StoredObject(
+            key=self.key,
+            plaintext_size=self.plaintext_size,
+            stored_size=self.stored_size,
+            parts=max(len(self._parts), 1)
+        )
+
+    async def abort(self) -> None:
+        if self._upload_id is not None:
+            upload_id, self._upload_id = self._upload_id, None
+            await self.storage._call("abort_multipart_upload", Key=self.key, UploadId=upload_id)
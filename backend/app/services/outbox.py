@@ -0,0 +1,267 @@
+"""Transactional outbox relay for patient messages sent to the clinic EMR.
+
+``enqueue_message`` writes the outbox row in the same transaction as the
+``Message``. A message is therefore either saved and queued, or neither,
+and the request never waits on the EMR.
+
+``OutboxRelay`` drains the table in batches:
+
+1. Claim. One ``UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED)``
+   picks due entries whose thread has no earlier pending entry. It bumps
+   ``attempts`` and pushes ``next_attempt_at`` out by a lease, then
+   commits. A relay that dies mid-batch simply lets the lease expire.
+2. Deliver. Entries are POSTed concurrently over the pooled
+   ``ClinicClient``. The outbox id is the idempotency key, so redelivery
+   after a crash does not create duplicates.
+3. Record. One executemany each for the outbox and ``Message.status``.
+
+At most one entry per thread is in flight at a time, so messages reach the
+EMR in thread order. Failures back off exponentially with jitter. A 4xx
+other than 408/429, an entry that cannot be decrypted or decoded, or
+running out of attempts, marks the entry and its message ``failed`` and
+unblocks the rest of the thread.
+"""
+import asyncio
+import logging
+import random
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+from uuid import UUID
+
+import httpx
+import orjson
+from sqlalchemy import Table, bindparam, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import get_settings
+from app.core.encryption import field_encryption
+from app.database import async_session_maker
+from app.models.message import Message
+from app.models.outbox import ClinicOutbox
+from app.services.clinic_sync import ClinicClient
+from app.services.realtime import publish_event
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+outbox_table: Table = ClinicOutbox.__table__
+messages_table: Table = Message.__table__
+
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 15 * 60
+_RETRYABLE_STATUS = {408, 429}
+
+
+async def enqueue_message(
+    db: AsyncSession,
+    user_id: UUID,
+    message_id: UUID,
+    thread_id: UUID,
+    clinic_patient_id: Optional[UUID],
+    payload: dict[str, Any]
+) -> None:
+    """Queue a message for the EMR in the caller's transaction."""
+    body = {"clinic_patient_id": clinic_patient_id, "message": payload}
+    await db.execute(
+        insert(outbox_table).values(
+            user_id=user_id,
+            message_id=message_id,
+            thread_id=thread_id,
+            payload_encrypted=field_encryption.encrypt(orjson.dumps(body).decode()),
+            status="pending",
+            attempts=0,
+            next_attempt_at=datetime.now(timezone.utc)
+        )
+    )
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff with full jitter after ``attempts`` failures."""
+    ceiling = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+@dataclass
+class DeliveryOutcome:
+    """Result of one delivery attempt."""
+    outbox_id: int
+    user_id: UUID
+    message_id: UUID
+    attempts: int
+    delivered: bool = False
+    permanent: bool = False
+    error: Optional[str] = None
+
+
+class OutboxRelay:
+    """Batch relay from ``clinic_outbox`` to the EMR."""
+
+    def __init__(
+        self,
+        client: ClinicClient,
+        session_maker: async_sessionmaker = async_session_maker,
+        batch_size: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        lease_seconds: Optional[int] = None
+    ):
+        self.client = client
+        self.session_maker = session_maker
+        self.batch_size = batch_size or settings.outbox_batch_size
+        self.max_attempts = max_attempts or settings.outbox_max_attempts
+        self.lease = timedelta(seconds=lease_seconds or settings.outbox_lease_seconds)
+
+    async def _claim(self, session: AsyncSession, now: datetime) -> list[Any]:
+        earlier = outbox_table.alias("earlier")
+        blocked = (
+            select(earlier.c.id)
+            .where(
+                earlier.c.thread_id == outbox_table.c.thread_id,
+                earlier.c.status == "pending",
+                earlier.c.id < outbox_table.c.id
+            )
+            .exists()
+        )
+        due = (
+            select(outbox_table.c.id)
+            .where(
+                outbox_table.c.status == "pending",
+                outbox_table.c.next_attempt_at <= now,
+                ~blocked
+            )
+            .order_by(outbox_table.c.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = await session.execute(
+            update(outbox_table)
+            .where(outbox_table.c.id.in_(due.scalar_subquery()))
+            .values(
+                attempts=outbox_table.c.attempts + 1,
+                next_attempt_at=now + self.lease
+            )
+            .returning(
+                outbox_table.c.id,
+                outbox_table.c.user_id,
+                outbox_table.c.message_id,
+                outbox_table.c.attempts,
+                outbox_table.c.payload_encrypted
+            )
+        )
+        claimed = result.all()
+        await session.commit()
+        return claimed
+
+    async def _deliver(self, entry: Any) -> DeliveryOutcome:
+        outcome = DeliveryOutcome(
+            outbox_id=entry.id,
+            user_id=entry.user_id,
+            message_id=entry.message_id,
+            attempts=entry.attempts
+        )
+        try:
+            body = orjson.loads(field_encryption.decrypt(entry.payload_encrypted))
+            if not body.get("clinic_patient_id"):
+                outcome.permanent, outcome.error = True, "patient is not linked to a clinic record"
+                return outcome
+            await self.client.post_message(
+                UUID(body["clinic_patient_id"]), body["message"], idempotency_key=f"outbox-{entry.id}"
+            )
+            outcome.delivered = True
+        except httpx.HTTPStatusError as exc:
+            code = exc.response.status_code
+            outcome.permanent = 400 <= code < 500 and code not in _RETRYABLE_STATUS
+            outcome.error = f"HTTP {code}"
+        except httpx.HTTPError as exc:
+            outcome.error = f"{type(exc).__name__}: {exc}"
+        except Exception as exc:
+            # An entry that cannot be decrypted or decoded will not improve with
+            # retries, and raising would abort the whole batch every time
+            logger.exception("outbox entry %s is undeliverable", entry.id)
+            outcome.permanent, outcome.error = True, f"{type(exc).__name__}: {exc}"
+        return outcome
+
+    async def _record(self, session: AsyncSession, outcomes: list[DeliveryOutcome], now: datetime) -> None:
+        outbox_rows, message_rows = [], []
+        for outcome in outcomes:
+            if outcome.delivered:
+                status, message_status, next_at = "delivered", "delivered", now
+            elif outcome.permanent or outcome.attempts >= self.max_attempts:
+                status, message_status, next_at = "failed", "failed", now
+            else:
+                status, message_status = "pending", None
+                next_at = now + timedelta(seconds=backoff_seconds(outcome.attempts))
+            outbox_rows.append({
+                "_id": outcome.outbox_id,
+                "_status": status,
+                "_next": next_at,
+                "_error": outcome.error,
+                "_delivered": now if outcome.delivered else None
+            })
+            if message_status:
+                message_rows.append({"_id": outcome.message_id, "_status": message_status})
+
+        await session.execute(
+            update(outbox_table)
+            .where(outbox_table.c.id == bindparam("_id"))
+            .values(
+                status=bindparam("_status"),
+                next_attempt_at=bindparam("_next"),
+                last_error=bindparam("_error"),
+                delivered_at=bindparam("_delivered")
+            ),
+            outbox_rows
+        )
+        if message_rows:
+            await session.execute(
+                update(messages_table)
+                .where(messages_table.c.id == bindparam("_id"))
+                .values(status=bindparam("_status")),
+                message_rows
+            )
+        await session.commit()
+
+    async def run_once(self) -> int:
+        """Claim, deliver and record one batch. Returns the number of entries attempted."""
+        async with self.session_maker() as session:
+            claimed = await self._claim(session, datetime.now(timezone.utc))
+            if not claimed:
+                return 0
+
+            outcomes = await asyncio.gather(*(self._deliver(entry) for entry in claimed))
+            await self._record(session, outcomes, datetime.now(timezone.utc))
+
+        for outcome in outcomes:
+            if outcome.delivered or outcome.permanent or outcome.attempts >= self.max_attempts:
+                await publish_event(outcome.user_id, "message.status", {
+                    "id": outcome.message_id,
+                    "status": "delivered" if outcome.delivered else "failed"
+                })
+        failed = sum(1 for o in outcomes if not o.delivered)
+        logger.info("outbox relay batch=%d delivered=%d failed=%d", len(outcomes), len(outcomes) - failed, failed)
+        return len(outcomes)
+
+    async def run_forever(self, poll_seconds: Optional[float] = None) -> None:
+        """Drain continuously; sleeps only when a batch comes back empty."""
+        poll_seconds = poll_seconds or settings.outbox_poll_seconds
+        while True:
+            try:
+                attempted = await self.run_once()
+            except Exception:
+                logger.exception("outbox relay batch failed")
+                attempted = 0
+            if attempted < self.batch_size:
+                await asyncio.sleep(poll_seconds)
+
+
+async def _main() -> None:
+    async with ClinicClient() as client:
+        await OutboxRelay(client).run_forever()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["relay"]:
+        sys.exit("usage: python -m app.services.outbox relay")
+    asyncio.run(_main())
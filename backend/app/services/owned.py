@@ -0,0 +1,154 @@
+"""Ownership-checked data access for user-owned resources.
+
+Every write is a single statement whose WHERE clause carries the ownership
+check, so routes no longer need a SELECT before writing or a refresh after.
+"""
+from typing import Any, Generic, Optional, Sequence, Type, TypeVar
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+ModelT = TypeVar("ModelT")
+ChildT = TypeVar("ChildT")
+
+# Keep RETURNING rows authoritative over anything already in the identity map
+_RETURNING_OPTIONS = {"populate_existing": True, "synchronize_session": False}
+
+
+class OwnedRepository(Generic[ModelT]):
+    """Single-round-trip reads and writes for a model with a ``user_id`` column."""
+
+    def __init__(self, model: Type[ModelT], not_found_detail: str = "Resource not found"):
+        self.model = model
+        self.not_found_detail = not_found_detail
+
+    def not_found(self) -> HTTPException:
+        """Build the 404 raised when no owned row matches."""
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=self.not_found_detail
+        )
+
+    def _owned(self, user_id: UUID, resource_id: UUID, where: Sequence[Any]) -> list:
+        return [
+            self.model.id == resource_id,
+            self.model.user_id == user_id,
+            *where
+        ]
+
+    async def get(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        resource_id: UUID
+    ) -> ModelT:
+        """Fetch a row owned by the user or raise 404."""
+        result = await db.execute(
+            select(self.model).where(*self._owned(user_id, resource_id, ()))
+        )
+        row = result.scalar_one_or_none()
+        if row is None:
+            raise self.not_found()
+        return row
+
+    async def exists(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        resource_id: UUID
+    ) -> bool:
+        """Check whether the user owns the row, without loading it."""
+        result = await db.execute(
+            select(self.model.id).where(*self._owned(user_id, resource_id, ()))
+        )
+        return result.scalar_one_or_none() is not None
+
+    async def create(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        values: dict[str, Any]
+    ) -> ModelT:
+        """INSERT ... RETURNING a new row owned by the user."""
+        result = await db.execute(
+            insert(self.model)
+            .values(user_id=user_id, **values)
+            .returning(self.model)
+        )
+        return result.scalar_one()
+
+    async def create_child(
+        self,
+        db: AsyncSession,
+        child_model: Type[ChildT],
+        parent_key: str,
+        user_id: UUID,
+        parent_id: UUID,
+        values: dict[str, Any]
+    ) -> ChildT:
+        """INSERT ... SELECT a child row only if the user owns its parent.
+
+        ``parent_key`` names the child's foreign-key column pointing at this
+        repository's model. Raises 404 when the parent is missing or foreign.
+        """
+        columns = list(values)
+        source = select(
+            *[literal(values[name]).label(name) for name in columns],
+            self.model.id.label(parent_key)
+        ).where(*self._owned(user_id, parent_id, ()))
+
+        result = await db.execute(
+            insert(child_model)
+            .from_select([*columns, parent_key], source)
+            .returning(child_model)
+        )
+        row = result.scalar_one_or_none()
+        if row is None:
+            raise self.not_found()
+        return row
+
+    async def update(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        resource_id: UUID,
+        values: dict[str, Any],
+        where: Sequence[Any] = ()
+    ) -> ModelT:
+        """UPDATE ... RETURNING an owned row; extra ``where`` clauses narrow the match."""
+        if not values:
+            return await self.get(db, user_id, resource_id)
+
+        result = await db.execute(
+            update(self.model)
+            .where(*self._owned(user_id, resource_id, where))
+            .values(**values)
+            .returning(self.model)
+            .execution_options(**_RETURNING_OPTIONS)
+        )
+        row = result.scalar_one_or_none()
+        if row is None:
+            raise self.not_found()
+        return row
+
+    async def delete(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        resource_id: UUID,
+        where: Sequence[Any] = ()
+    ) -> Optional[UUID]:
+        """DELETE ... RETURNING the id of an owned row, or None if nothing matched.
+
+        Returning None rather than raising lets callers with extra ``where``
+        guards tell a missing row apart from a protected one.
+        """
+        result = await db.execute(
+            delete(self.model)
+            .where(*self._owned(user_id, resource_id, where))
+            .returning(self.model.id)
+            .execution_options(synchronize_session=False)
+        )
+        return result.scalar_one_or_none()
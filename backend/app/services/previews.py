@@ -0,0 +1,308 @@
+"""First-page preview images for documents.
+
+A preview worker (``python -m app.services.previews run``) looks for
+documents whose ``(user_id, content_key)`` has no ``DocumentPreview`` yet.
+Freshly synced documents are picked up on its next poll. For each one it
+downloads and decrypts the source and renders the first page on a process
+pool. PDF rasterising is CPU-bound and runs native code, so it never
+executes on the event loop and a crash cannot take the worker down. The
+resulting small WEBP is stored encrypted like any other blob.
+
+Previews are keyed by content hash, so the same file synced or uploaded
+twice renders once. Sources that cannot be read (missing object, failed
+authentication, wrong key) or rendered get a ``failed`` row, which stops
+them from being retried on every poll. Only storage outages and render
+pool crashes leave a source pending for the next poll. At most
+``preview_workers`` sources are held in memory at once.
+"""
+import asyncio
+import io
+import logging
+import multiprocessing
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Optional
+from uuid import UUID, uuid4
+
+from botocore.exceptions import BotoCoreError, ClientError
+from sqlalchemy import Table, and_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import get_settings
+from app.core.encryption import field_encryption
+from app.database import async_session_maker, upsert_insert
+from app.models.document import Document, DocumentPreview
+from app.services.object_storage import ObjectStorage
+from app.services.user_keys import OwnerKeyShredded, ensure_owner_key
+from app.services.versions import DOCUMENTS, bump_version
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+documents_table: Table = Document.__table__
+previews_table: Table = DocumentPreview.__table__
+
+PREVIEW_MEDIA_TYPE = "image/webp"
+
+
+class UnsupportedPreview(Exception):
+    """Raised for file types that have no preview."""
+
+
+def render_first_page(data: bytes, media_type: str, max_px: int) -> tuple[bytes, int, int]:
+    """Render page one of a PDF or image to a WEBP thumbnail. Runs in a pool process."""
+    from PIL import Image, ImageOps
+
+    if media_type == "application/pdf":
+        import pypdfium2 as pdfium
+
+        pdf = pdfium.PdfDocument(data)
+        try:
+            page = pdf[0]
+            width, height = page.get_size()
+            image = page.render(scale=max_px / max(width, height)).to_pil()
+            page.close()
+        finally:
+            pdf.close()
+    elif media_type.startswith("image/"):
+        image = Image.open(io.BytesIO(data))
+        # Let JPEG decode at reduced size instead of full resolution
+        image.draft("RGB", (max_px, max_px))
+        image = ImageOps.exif_transpose(image)
+    else:
+        raise UnsupportedPreview(media_type)
+
+    image.thumbnail((max_px, max_px))
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    out = io.BytesIO()
+    image.save(out, format="WEBP", quality=70, method=4)
+    return out.getvalue(), image.width, image.height
+
+
+def _transient(exc: BaseException) -> bool:
+    """Whether a failure to read or render a source may succeed on a later poll."""
+    if isinstance(exc, ClientError):
+        error = exc.response.get("Error", {})
+        status = exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return status >= 500 or error.get("Code") in ("SlowDown", "Throttling", "RequestTimeout")
+    # Connection errors and timeouts; everything else (bad key, failed tag, truncated object) is permanent
+    return isinstance(exc, (BotoCoreError, BrokenProcessPool))
+
+
+async def _single_chunk(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+def create_render_pool(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    # forkserver: never fork a process that already has event-loop and boto3 threads
+    return ProcessPoolExecutor(
+        max_workers=workers or settings.preview_workers,
+        mp_context=multiprocessing.get_context("forkserver")
+    )
+
+
+class PreviewPipeline:
+    """Finds documents without previews and renders them."""
+
+    def __init__(
+        self,
+        executor: Optional[Executor] = None,
+        storage: Optional[ObjectStorage] = None,
+        session_maker: async_sessionmaker = async_session_maker,
+        max_px: Optional[int] = None,
+        concurrency: Optional[int] = None
+    ):
+        self.executor = executor or create_render_pool()
+        self._storage = storage
+        self.session_maker = session_maker
+        self.max_px = max_px or settings.preview_max_px
+        # Each source is held whole until rendered; no more than the pool can render at once
+        self._slots = asyncio.Semaphore(concurrency or settings.preview_workers)
+
+    @property
+    def storage(self) -> ObjectStorage:
+        if self._storage is None:
+            self._storage = ObjectStorage()
+        return self._storage
+
+    async def _pending(self, session: AsyncSession, limit: int) -> list[Any]:
+        has_preview = (
+            select(previews_table.c.id)
+            .where(
+                previews_table.c.user_id == documents_table.c.user_id,
+                previews_table.c.content_key == documents_table.c.content_key
+            )
+            .exists()
+        )
+        result = await session.execute(
+            select(
+                documents_table.c.user_id,
+                documents_table.c.content_key,
+                documents_table.c.s3_key_encrypted,
+                documents_table.c.file_type,
+                documents_table.c.file_size
+            )
+            .where(documents_table.c.content_key.is_not(None), ~has_preview)
+            .order_by(documents_table.c.created_at.desc())
+            .limit(limit)
+        )
+        # Several documents can share one content key; render it once
+        unique: dict[tuple[UUID, str], Any] = {}
+        for row in result.all():
+            unique.setdefault((row.user_id, row.content_key), row)
+        return list(unique.values())
+
+    @staticmethod
+    def _failed(source: Any) -> dict[str, Any]:
+        return {
+            "id": uuid4(),
+            "user_id": source.user_id,
+            "content_key": source.content_key,
+            "status": "failed",
+            "storage_key_encrypted": None,
+            "media_type": None,
+            "size": None,
+            "width": None,
+            "height": None
+        }
+
+    async def _first_page(self, source: Any, owner_key: bytes) -> Optional[tuple[bytes, int, int]]:
+        """Read the whole source and render it; None if it has no preview. Read errors propagate."""
+        source_key = field_encryption.decrypt(source.s3_key_encrypted)
+        data = b"".join([
+            chunk async for chunk in self.storage.read_decrypted(source_key, source.file_size, owner_key=owner_key)
+        ])
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self.executor, render_first_page, data, source.file_type, self.max_px
+            )
+        except UnsupportedPreview:
+            return None
+        except BrokenProcessPool:
+            raise
+        except Exception as exc:
+            logger.warning("preview render failed content=%s: %s", source.content_key[:12], exc)
+            return None
+
+    async def _render(self, source: Any, owner_key: bytes) -> dict[str, Any]:
+        values = self._failed(source)
+        if source.file_size > settings.preview_max_source_bytes:
+            return values
+
+        async with self._slots:
+            page = await self._first_page(source, owner_key)
+        if page is None:
+            return values
+        image, width, height = page
+
+        key = f"previews/{source.user_id}/{uuid4()}"
+        stored = await self.storage.upload_encrypted(
+            key, _single_chunk(image), content_type=PREVIEW_MEDIA_TYPE, owner_key=owner_key
+        )
+        values.update(
+            status="ready",
+            storage_key_encrypted=field_encryption.encrypt(key),
+            media_type=PREVIEW_MEDIA_TYPE,
+            size=stored.plaintext_size,
+            width=width,
+            height=height
+        )
+        return values
+
+    async def render_pending(self, limit: Optional[int] = None) -> int:
+        """Render up to ``limit`` missing previews. Returns the number recorded."""
+        limit = limit or settings.preview_batch_size
+        async with self.session_maker() as session:
+            pending = await self._pending(session, limit)
+            owner_keys = {}
+            for user_id in {source.user_id for source in pending}:
+                try:
+                    owner_keys[user_id] = await ensure_owner_key(session, user_id)
+                except OwnerKeyShredded:
+                    pass  # being erased
+            await session.commit()
+            pending = [source for source in pending if source.user_id in owner_keys]
+            if not pending:
+                return 0
+
+            rendered = await asyncio.gather(
+                *(self._render(source, owner_keys[source.user_id]) for source in pending),
+                return_exceptions=True
+            )
+            rows = []
+            if any(isinstance(outcome, BrokenProcessPool) for outcome in rendered):
+                # A render process died (native crash); start a fresh pool
+                logger.warning("preview render pool broke; restarting it")
+                self.executor.shutdown(wait=False)
+                self.executor = create_render_pool()
+            for source, outcome in zip(pending, rendered):
+                if isinstance(outcome, BaseException) and _transient(outcome):
+                    # Storage outages and pool crashes: leave it pending for the next poll
+                    logger.warning("preview source unavailable content=%s: %s", source.content_key[:12], outcome)
+                elif isinstance(outcome, BaseException):
+                    # Retrying cannot fix a missing object or a source that fails to decrypt,
+                    # and left pending it would hold a place in every batch
+                    logger.warning("preview source unreadable content=%s: %r", source.content_key[:12], outcome)
+                    rows.append(self._failed(source))
+                else:
+                    rows.append(outcome)
+
+            if rows:
+                await session.execute(
+                    upsert_insert(session, previews_table)
+                    .values(rows)
+                    .on_conflict_do_nothing(index_elements=["user_id", "content_key"])
+                )
+                await session.commit()
+                # Document listings show whether a preview is ready
+                for user_id in {row["user_id"] for row in rows}:
+                    await bump_version(user_id, DOCUMENTS)
+
+        ready = sum(1 for row in rows if row["status"] == "ready")
+        logger.info("previews batch=%d ready=%d failed=%d", len(pending), ready, len(rows) - ready)
+        return len(rows)
+
+    async def run_forever(self, poll_seconds: Optional[float] = None) -> None:
+        poll_seconds = poll_seconds or settings.preview_poll_seconds
+        while True:
+            try:
+                recorded = await self.render_pending()
+            except Exception:
+                logger.exception("preview batch failed")
+                recorded = 0
+            if not recorded:
+                await asyncio.sleep(poll_seconds)
+
+
+async def preview_for_document(db: AsyncSession, user_id: UUID, document_id: UUID) -> Optional[Any]:
+    """The ready preview row for an owned document, if any."""
+    result = await db.execute(
+        select(previews_table)
+        .join(
+            documents_table,
+            and_(
+                documents_table.c.user_id == previews_table.c.user_id,
+                documents_table.c.content_key == previews_table.c.content_key
+            )
+        )
+        .where(
+            documents_table.c.id == document_id,
+            documents_table.c.user_id == user_id,
+            previews_table.c.status == "ready"
+        )
+    )
+    return result.first()
+
+
+async def _main() -> None:
+    await PreviewPipeline().run_forever()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["run"]:
+        sys.exit("usage: python -m app.services.previews run")
+    asyncio.run(_main())
@@ -0,0 +1,282 @@
+"""Real-time event delivery over Server-Sent Events with Redis fan-out.
+
+Publishing appends the event to the user's capped Redis stream
+``events:{user_id}`` and announces it on the pub/sub channel with the same
+name. A Lua script does both in one round trip. The stream id doubles as
+the SSE event id, so a reconnecting client sends ``Last-Event-ID`` and gets
+whatever it missed from the stream before live delivery resumes.
+
+Each worker holds one ``EventHub``, which owns a single pub/sub connection.
+It subscribes to a user's channel while that user has at least one open
+connection on this worker, and fans incoming events out to per-connection
+queues. An idle connection costs one queue and one suspended generator,
+not a Redis connection.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, AsyncIterator, Optional
+from uuid import UUID
+
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.config import get_settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# Client reconnect delay advertised in the stream (milliseconds)
+RETRY_MS = 3000
+
+_PUBLISH_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*', 'type', ARGV[2], 'data', ARGV[3])
+redis.call('PUBLISH', KEYS[1], id .. '\\n' .. ARGV[2] .. '\\n' .. ARGV[3])
+return id
+"""
+
+
+@dataclass
+class Event:
+    """A delivered event; ``data`` is already-encoded JSON."""
+    id: str
+    type: str
+    data: bytes
+
+    def encode(self) -> bytes:
+        return b"id: %s\nevent: %s\ndata: %s\n\n" % (self.id.encode(), self.type.encode(), self.data)
+
+
+def _channel(user_id: UUID) -> str:
+    return f"events:{user_id}"
+
+
+def _text(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _stream_position(event_id: str) -> tuple[int, int]:
+    """Order stream ids (``<ms>-<seq>``); raises ValueError for malformed ids."""
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class Subscription:
+    """One open client connection's view of a user's channel."""
+
+    def __init__(self, channel: str, queue_size: int):
+        self.channel = channel
+        self.queue: asyncio.Queue[Optional[Event]] = asyncio.Queue(queue_size)
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+        try:
+            # Wake the consumer; if the queue is full it will see ``closed`` anyway
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+
+class EventHub:
+    """Per-worker fan-out from one Redis pub/sub connection to local connections."""
+
+    def __init__(self, redis: Optional[Redis] = None, queue_size: Optional[int] = None):
+        self._redis = redis
+        self.queue_size = queue_size or settings.realtime_queue_size
+        self._pubsub: Any = None
+        self._reader: Optional[asyncio.Task] = None
+        self._subscriptions: dict[str, set[Subscription]] = {}
+        self._lock = asyncio.Lock()
+        self._publish: Any = None
+        self._releases: set[asyncio.Task] = set()
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    @property
+    def connections(self) -> int:
+        return sum(len(subs) for subs in self._subscriptions.values())
+
+    async def publish(self, user_id: UUID, event_type: str, data: Any) -> str:
+        """Store and broadcast an event for every connection of ``user_id``."""
+        if self._publish is None:
+            self._publish = self.redis.register_script(_PUBLISH_SCRIPT)
+        event_id = await self._publish(
+            keys=[_channel(user_id)],
+            args=[settings.realtime_replay_maxlen, event_type, orjson.dumps(data)]
+        )
+        return _text(event_id)
+
+    async def subscribe(self, user_id: UUID) -> Subscription:
+        subscription = Subscription(_channel(user_id), self.queue_size)
+        async with self._lock:
+            if self._pubsub is None:
+                self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            local = self._subscriptions.setdefault(subscription.channel, set())
+            if not local:
+                await self._pubsub.subscribe(subscription.channel)
+            local.add(subscription)
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+        return subscription
+
+    async def unsubscribe(self, subscription: Subscription) -> None:
+        async with self._lock:
+            local = self._subscriptions.get(subscription.channel)
+            if local is None:
+                return
+            # Already gone if dispatch dropped it; the channel may still need releasing
+            local.discard(subscription)
+            await self._release_locked(subscription.channel)
+
+    async def _release(self, channel: str) -> None:
+        async with self._lock:
+            await self._release_locked(channel)
+
+    async def _release_locked(self, channel: str) -> None:
+        """Unsubscribe from ``channel`` if no local connection is left on it."""
+        local = self._subscriptions.get(channel)
+        if local is None or local:
+            return
+        del self._subscriptions[channel]
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.unsubscribe(channel)
+            except RedisError as exc:
+                logger.warning("realtime unsubscribe failed: %s", exc)
+
+    def dispatch(self, channel: str, event: Event) -> None:
+        """Deliver to local connections; a connection that falls behind is closed.
+
+        The client reconnects with ``Last-Event-ID`` and catches up from the
+        stream, so a slow consumer never holds memory on the worker.
+        """
+        local = self._subscriptions.get(channel)
+        if not local:
+            return
+        for subscription in list(local):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                local.discard(subscription)
+                subscription.close()
+        if not local:
+            # Dispatch runs inside the reader, so the Redis unsubscribe is done by a task
+            task = asyncio.create_task(self._release(channel))
+            self._releases.add(task)
+            task.add_done_callback(self._releases.discard)
+
+    async def _read(self) -> None:
+        try:
+            async for message in self._pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                event_id, event_type, data = message["data"].split(b"\n", 2)
+                self.dispatch(
+                    _text(message["channel"]),
+                    Event(id=event_id.decode(), type=event_type.decode(), data=data)
+                )
+        except (RedisError, OSError) as exc:
+            logger.warning("realtime pub/sub connection lost: %s", exc)
+            async with self._lock:
+                # Drop everything; clients reconnect and resume from the stream
+                for local in self._subscriptions.values():
+                    for subscription in local:
+                        subscription.close()
+                self._subscriptions.clear()
+                pubsub, self._pubsub = self._pubsub, None
+            await pubsub.aclose()
+
+    async def replay(self, user_id: UUID, last_event_id: str) -> tuple[list[Event], bool]:
+        """Events after ``last_event_id``, and whether some may have been trimmed."""
+        try:
+            after = _stream_position(last_event_id)
+        except ValueError:
+            return [], True
+
+        key = _channel(user_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xrange(key, min="-", max="+", count=1)
+            pipe.xrange(key, min=f"({last_event_id}", max="+")
+            oldest, entries = await pipe.execute()
+
+        gap = bool(oldest) and _stream_position(_text(oldest[0][0])) > after
+        events = [
+            Event(id=_text(entry_id), type=_text(fields[b"type"]), data=fields[b"data"])
+            for entry_id, fields in entries
+        ]
+        return events, gap
+
+
+@lru_cache
+def get_event_hub() -> EventHub:
+    return EventHub()
+
+
+async def publish_event(user_id: UUID, event_type: str, data: Any) -> Optional[str]:
+    """Best-effort push to the user's open connections.
+
+    Push is an optimisation over polling, so a Redis outage is logged rather
+    than failing the write that triggered the event.
+    """
+    try:
+        return await get_event_hub().publish(user_id, event_type, data)
+    except RedisError as exc:
+        logger.warning("realtime publish failed user=%s type=%s: %s", user_id, event_type, exc)
+        return None
+
+
+async def event_stream(
+    user_id: UUID,
+    last_event_id: Optional[str] = None,
+    expires_at: Optional[float] = None,
+    hub: Optional[EventHub] = None
+) -> AsyncIterator[bytes]:
+    """SSE byte stream for one connection: replay, then live events and heartbeats.
+
+    Ends when the access token expires so the client reconnects with a fresh one.
+    """
+    hub = hub or get_event_hub()
+    subscription = await hub.subscribe(user_id)
+    try:
+        yield f"retry: {RETRY_MS}\n\n".encode()
+
+        last_sent: Optional[tuple[int, int]] = None
+        if last_event_id:
+            missed, gap = await hub.replay(user_id, last_event_id)
+            if gap:
+                # Too old to resume from; the client should refetch its state
+                yield b"event: reset\ndata: {}\n\n"
+            for event in missed:
+                yield event.encode()
+            last_sent = _stream_position(missed[-1].id) if missed else None
+
+        while not subscription.closed:
+            timeout = settings.realtime_heartbeat_seconds
+            if expires_at is not None:
+                remaining = expires_at - time.time()
+                if remaining <= 0:
+                    break
+                timeout = min(timeout, remaining)
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            if event is None:
+                break
+            # Events published during replay arrive on both paths
+            if last_sent is not None and _stream_position(event.id) <= last_sent:
+                continue
+            yield event.encode()
+    finally:
+        await hub.unsubscribe(subscription)
@@ -0,0 +1,221 @@
+"""Appointment reminders for each window in ``settings.reminder_windows``.
+
+Every poll scans each window's whole range of live appointments, from the
+next shorter window's edge to ``now + window``, in ``(scheduled_at, id)``
+order over ``ix_appointments_status_scheduled``. An appointment booked or
+rescheduled into a window that the job has already passed through is
+therefore still found on the next poll. Each batch:
+
+1. selects up to ``reminder_batch_size`` appointments after the previous batch,
+2. drops those already reminded, by looking up their ``dedupe_key``,
+3. inserts the rest as ``Notification`` rows in one multi-row INSERT,
+4. commits, then hands the newly created notifications to delivery in
+   chunks of ``reminder_delivery_chunk``.
+
+An appointment that is already inside a shorter window only gets that
+window's reminder. This covers late bookings and catching up after
+downtime, and it means nobody gets a "24h" and a "2h" reminder at once.
+
+The ``dedupe_key`` (appointment, window and start time) is unique, and
+rows are inserted with ON CONFLICT DO NOTHING. Rescanning, a second job
+instance or a restart mid-batch therefore cannot notify twice. A
+rescheduled appointment gets a new key and is reminded again for its new
+time.
+"""
+import asyncio
+import logging
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+from uuid import UUID, uuid4
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import Row, Table, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import get_settings
+from app.database import async_session_maker, upsert_insert
+from app.models.appointment import BLOCKING_STATUSES, Appointment
+from app.models.notification import Notification
+from app.services.realtime import publish_event
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+appointments_table: Table = Appointment.__table__
+notifications_table: Table = Notification.__table__
+
+NOTIFICATION_TYPE = "appointment_reminder"
+
+_MIN_UUID = UUID(int=0)
+
+Deliver = Callable[[list[Row]], Awaitable[None]]
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def reminder_text(appointment_type: str, scheduled_at: datetime) -> tuple[str, str]:
+    """Title and body; the time is shown in clinic local time."""
+    local = scheduled_at.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(settings.clinic_timezone))
+    kind = appointment_type.replace("_", " ")
+    return (
+        "Appointment reminder",
+        f"Your {kind} appointment is on {local:%a %d %b} at {local:%H:%M}."
+    )
+
+
+async def publish_notifications(notifications: list[Row]) -> None:
+    """Default delivery: push each notification to the user's open connections."""
+    await asyncio.gather(*(
+        publish_event(row.user_id, "notification.created", {
+            "id": row.id,
+            "notification_type": row.notification_type,
+            "title": row.title,
+            "body": row.body,
+            "data": row.data
+        })
+        for row in notifications
+    ))
+
+
+class ReminderJob:
+    """Creates and delivers appointment reminders window by window."""
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker = async_session_maker,
+        deliver: Deliver = publish_notifications,
+        windows: Optional[dict[str, int]] = None,
+        batch_size: Optional[int] = None,
+        delivery_chunk: Optional[int] = None
+    ):
+        self.session_maker = session_maker
+        self.deliver = deliver
+        self.windows = windows or settings.reminder_windows
+        self.batch_size = batch_size or settings.reminder_batch_size
+        self.delivery_chunk = delivery_chunk or settings.reminder_delivery_chunk
+
+    def _floor_minutes(self, minutes: int) -> int:
+        """The next shorter window: appointments already inside it skip this reminder."""
+        return max((other for other in self.windows.values() if other < minutes), default=0)
+
+    def _dedupe_key(self, appointment: Row, window: str) -> str:
+        return f"reminder:{appointment.id}:{window}:{appointment.scheduled_at:%Y%m%d%H%M}"
+
+    async def _batch(
+        self,
+        session: AsyncSession,
+        window: str,
+        minutes: int,
+        now: datetime,
+        after: tuple[datetime, UUID]
+    ) -> tuple[list[Row], list[Row]]:
+        """Process one batch after ``after``. Returns (appointments scanned, notifications created)."""
+        result = await session.execute(
+            select(
+                appointments_table.c.id,
+                appointments_table.c.user_id,
+                appointments_table.c.appointment_type,
+                appointments_table.c.scheduled_at
+            )
+            .where(
+                appointments_table.c.status.in_(BLOCKING_STATUSES),
+                appointments_table.c.scheduled_at <= now + timedelta(minutes=minutes),
+                tuple_(appointments_table.c.scheduled_at, appointments_table.c.id) > tuple_(*after)
+            )
+            .order_by(appointments_table.c.scheduled_at, appointments_table.c.id)
+            .limit(self.batch_size)
+        )
+        appointments = result.all()
+        if not appointments:
+            return [], []
+
+        # Most of a window was reminded on earlier polls; skip those before building rows
+        keys = {appointment.id: self._dedupe_key(appointment, window) for appointment in appointments}
+        reminded = set((await session.execute(
+            select(notifications_table.c.dedupe_key).where(notifications_table.c.dedupe_key.in_(keys.values()))
+        )).scalars())
+        due = [appointment for appointment in appointments if keys[appointment.id] not in reminded]
+        if not due:
+            return appointments, []
+
+        rows = []
+        for appointment in due:
+            title, body = reminder_text(appointment.appointment_type, appointment.scheduled_at)
+            rows.append({
+                "id": uuid4(),
+                "user_id": appointment.user_id,
+                "notification_type": NOTIFICATION_TYPE,
+                "title": title,
+                "body": body,
+                "data": {
+                    "appointment_id": str(appointment.id),
+                    "scheduled_at": appointment.scheduled_at.isoformat(),
+                    "window": window
+                },
+                "dedupe_key": keys[appointment.id],
+                "read": False,
+                "created_at": datetime.now(timezone.utc)
+            })
+        created = await session.execute(
+            upsert_insert(session, notifications_table)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=["dedupe_key"])
+            .returning(
+                notifications_table.c.id,
+                notifications_table.c.user_id,
+                notifications_table.c.notification_type,
+                notifications_table.c.title,
+                notifications_table.c.body,
+                notifications_table.c.data
+            )
+        )
+        notifications = created.all()
+        await session.commit()
+        return appointments, notifications
+
+    async def _deliver(self, notifications: list[Row]) -> None:
+        for start in range(0, len(notifications), self.delivery_chunk):
+            chunk = notifications[start:start + self.delivery_chunk]
+            try:
+                await self.deliver(chunk)
+            except Exception:
+                # The notifications are stored; the app shows them on next load
+                logger.exception("reminder delivery failed for %d notifications", len(chunk))
+
+    async def run_once(self) -> int:
+        """Bring every window up to date. Returns the number of reminders created."""
+        total = 0
+        for window, minutes in self.windows.items():
+            now = _utcnow()
+            after = (now + timedelta(minutes=self._floor_minutes(minutes)), _MIN_UUID)
+            while True:
+                async with self.session_maker() as session:
+                    scanned, notifications = await self._batch(session, window, minutes, now, after)
+                if notifications:
+                    await self._deliver(notifications)
+                total += len(notifications)
+                if len(scanned) < self.batch_size:
+                    break
+                after = (scanned[-1].scheduled_at, scanned[-1].id)
+        if total:
+            logger.info("appointment reminders created=%d", total)
+        return total
+
+    async def run_forever(self, poll_seconds: Optional[float] = None) -> None:
+        poll_seconds = poll_seconds or settings.reminder_poll_seconds
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("reminder run failed")
+            await asyncio.sleep(poll_seconds)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["run"]:
+        sys.exit("usage: python -m app.services.reminders run")
+    asyncio.run(ReminderJob().run_forever())
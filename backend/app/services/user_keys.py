@@ -0,0 +1,73 @@
+"""Per-user owner keys for crypto-shredding stored blobs.
+
+Every blob a user owns (documents, attachments, previews, export
+archives) is encrypted under a key derived from that user's random owner
+key. The owner key is stored wrapped with the master key in ``user_keys``.
+Erasure deletes that one row. From then on every copy of the user's
+objects is unreadable: live ones, old versions and replicas alike. This
+holds while the objects themselves are still being deleted.
+
+Blobs written before owner keys existed stay under the master key. They
+are still removed by the erasure worker, just not shredded.
+"""
+import base64
+import os
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import Table, delete, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.encryption import field_encryption
+from app.database import upsert_insert
+from app.models.user import User, UserKey
+
+keys_table: Table = UserKey.__table__
+users_table: Table = User.__table__
+
+
+class OwnerKeyShredded(Exception):
+    """The user's owner key has been destroyed; nothing new may be stored for them."""
+
+
+def _unwrap(key_encrypted: bytes) -> bytes:
+    return base64.b64decode(field_encryption.decrypt(key_encrypted))
+
+
+async def get_owner_key(db: AsyncSession, user_id: UUID) -> Optional[bytes]:
+    """The user's owner key, or None if they never had one or it was shredded."""
+    result = await db.execute(
+        select(keys_table.c.key_encrypted).where(keys_table.c.user_id == user_id)
+    )
+    key_encrypted = result.scalar_one_or_none()
+    return _unwrap(key_encrypted) if key_encrypted is not None else None
+
+
+async def ensure_owner_key(db: AsyncSession, user_id: UUID) -> bytes:
+    """The user's owner key, created on first use. Runs in the caller's transaction.
+
+    Raises ``OwnerKeyShredded`` for an erased account, so a job that races
+    the erasure can never mint a fresh key for it.
+    """
+    wrapped = field_encryption.encrypt(base64.b64encode(os.urandom(32)).decode())
+    # Concurrent first uploads agree on one key: the loser's insert is a no-op
+    await db.execute(
+        upsert_insert(db, keys_table)
+        .from_select(
+            ["user_id", "key_encrypted"],
+            select(users_table.c.id, literal(wrapped)).where(
+                users_table.c.id == user_id, users_table.c.status != "deleted"
+            )
+        )
+        .on_conflict_do_nothing(index_elements=["user_id"])
+    )
+    key = await get_owner_key(db, user_id)
+    if key is None:
+        raise OwnerKeyShredded(str(user_id))
+    return key
+
+
+async def shred_owner_key(db: AsyncSession, user_id: UUID) -> bool:
+    """Destroy the user's owner key. Does not commit. True if there was one."""
+    result = await db.execute(delete(keys_table).where(keys_table.c.user_id == user_id))
+    return result.rowcount > 0
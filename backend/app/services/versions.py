@@ -0,0 +1,98 @@
+"""Per-user resource version counters in Redis.
+
+Writers call ``bump_version`` after committing a change to one of a
+user's resources. Readers turn the current version into an ETag, so an
+unchanged resource is recognised from one Redis lookup without querying
+PostgreSQL.
+
+A key that is missing (never written, evicted or expired) is seeded from
+the clock in microseconds rather than starting again at 1. A bump moves
+the version to the current time in microseconds, or one past the old
+version if that is larger. Versions therefore only move forward, and an
+ETag issued before the key was lost can never match again. A version also
+says roughly when the resource last changed, which ``settled`` uses to
+decide whether a read replica can be trusted with it yet.
+
+Read the version *before* loading the data it labels. A write that
+commits in between then costs the client one extra full response. The
+other order could pin stale content under the new version.
+"""
+import logging
+import time
+from typing import Optional, Sequence
+from uuid import UUID
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.config import get_settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+APPOINTMENTS = "appointments"
+DOCUMENTS = "documents"
+MEDICATIONS = "medications"
+RESOURCES = (APPOINTMENTS, DOCUMENTS, MEDICATIONS)
+
+# Keys expire after a quiet period; a reseed is always safe
+_TTL_SECONDS = 30 * 24 * 3600
+
+_BUMP_SCRIPT = """
+local v = math.max((tonumber(redis.call('GET', KEYS[1])) or 0) + 1, tonumber(ARGV[1]))
+redis.call('SET', KEYS[1], string.format('%.0f', v), 'EX', ARGV[2])
+return v
+"""
+
+_READ_SCRIPT = """
+local out = {}
+for i, key in ipairs(KEYS) do
+  local v = redis.call('GET', key)
+  if not v then
+    v = ARGV[1]
+    redis.call('SET', key, v, 'EX', ARGV[2])
+  end
+  out[i] = v
+end
+return out
+"""
+
+
+def _key(user_id: UUID, resource: str) -> str:
+    return f"versions:{user_id}:{resource}"
+
+
+def _seed() -> int:
+    return time.time_ns() // 1000
+
+
+def settled(version: int, seconds: float) -> bool:
+    """Whether the change behind ``version`` was made at least ``seconds`` ago."""
+    return _seed() - version >= seconds * 1_000_000
+
+
+async def bump_version(user_id: UUID, resource: str, redis: Optional[Redis] = None) -> Optional[int]:
+    """Advance a user's resource version after a committed write.
+
+    Best-effort like event publishing: a Redis outage is logged rather than
+    failing the write. Stale validators last until the next bump or key expiry.
+    """
+    redis = redis or get_redis()
+    try:
+        bump = redis.register_script(_BUMP_SCRIPT)
+        return int(await bump(keys=[_key(user_id, resource)], args=[_seed(), _TTL_SECONDS]))
+    except RedisError as exc:
+        logger.warning("version bump failed user=%s resource=%s: %s", user_id, resource, exc)
+        return None
+
+
+async def get_versions(user_id: UUID, resources: Sequence[str], redis: Optional[Redis] = None) -> list[int]:
+    """Current versions for ``resources``, seeding any that are missing. Raises RedisError."""
+    redis = redis or get_redis()
+    read = redis.register_script(_READ_SCRIPT)
+    values = await read(
+        keys=[_key(user_id, resource) for resource in resources], args=[_seed(), _TTL_SECONDS]
+    )
+    return [int(value) for value in values]
@@ -0,0 +1,84 @@
+"""Benchmark streaming encrypted attachment uploads: throughput and peak RSS.
+
+Runs N concurrent uploads of SIZE bytes through ObjectStorage. By default
+parts go to an in-process sink that discards them; pass an endpoint URL to
+upload to an S3-compatible stand-in such as MinIO instead:
+
+    python -m benchmarks.attachment_upload [--uploads 10] [--size-mb 20]
+        [--endpoint-url http://localhost:9000 --bucket bench]
+"""
+import argparse
+import asyncio
+import os
+import resource
+import time
+from typing import AsyncIterator
+
+from app.services.object_storage import ObjectStorage
+
+
+class NullS3:
+    """Minimal S3 client stand-in that accepts and discards parts."""
+
+    def create_multipart_upload(self, **kwargs):
+        return {"UploadId": "bench"}
+
+    def upload_part(self, Body: bytes, PartNumber: int, **kwargs):
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, **kwargs):
+        return {}
+
+    def abort_multipart_upload(self, **kwargs):
+        return {}
+
+    def put_object(self, **kwargs):
+        return {}
+
+
+async def _source(size: int, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    chunk = os.urandom(chunk_size)
+    sent = 0
+    while sent < size:
+        piece = chunk[:min(chunk_size, size - sent)]
+        sent += len(piece)
+        yield piece
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=10)
+    parser.add_argument("--size-mb", type=int, default=20)
+    parser.add_argument("--endpoint-url")
+    parser.add_argument("--bucket", default="bench")
+    args = parser.parse_args()
+
+    if args.endpoint_url:
+        import boto3
+        client = boto3.client("s3", endpoint_url=args.endpoint_url)
+    else:
+        client = NullS3()
+    storage = ObjectStorage(client=client, bucket=args.bucket)
+    size = args.size_mb * 1024 * 1024
+
+    baseline = _max_rss_mb()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        storage.upload_encrypted(f"bench/{i}", _source(size)) for i in range(args.uploads)
+    ))
+    elapsed = time.perf_counter() - started
+
+    total_mb = sum(r.plaintext_size for r in results) / (1024 * 1024)
+    print(f"{args.uploads} x {args.size_mb} MB uploads in {elapsed:.2f}s "
+          f"({total_mb / elapsed:.1f} MB/s)")
+    print(f"peak RSS {_max_rss_mb():.1f} MB (baseline {baseline:.1f} MB, "
+          f"part size {storage.part_size // (1024 * 1024)} MB)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
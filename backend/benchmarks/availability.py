@@ -0,0 +1,112 @@
+"""Benchmark the slot availability index: 50 clinicians over a 90-day window.
+
+Builds an ``AvailabilityIndex`` from synthetic rotas (two weekday sessions
+and a Saturday morning), a few days of leave per clinician, and bookings
+that fill about FILL of the session time. It then times the queries the
+API serves. No database is needed:
+
+    python -m benchmarks.availability [--clinicians 50] [--days 90] [--fill 0.6]
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, time as clock, timedelta
+from types import SimpleNamespace
+
+from app.services.availability import AvailabilityIndex, duration_for
+
+
+def _sessions(clinician_id):
+    rows = []
+    for weekday in range(5):
+        rows.append(SimpleNamespace(
+            clinician_id=clinician_id, weekday=weekday, start_time=clock(9), end_time=clock(12, 30),
+            appointment_types=None, valid_from=None, valid_until=None
+        ))
+        rows.append(SimpleNamespace(
+            clinician_id=clinician_id, weekday=weekday, start_time=clock(13, 30), end_time=clock(17),
+            appointment_types=["routine", "follow_up", "phone", "video"], valid_from=None, valid_until=None
+        ))
+    rows.append(SimpleNamespace(
+        clinician_id=clinician_id, weekday=5, start_time=clock(9), end_time=clock(12),
+        appointment_types=["urgent", "phone"], valid_from=None, valid_until=None
+    ))
+    return rows
+
+
+def _timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(samples), max(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clinicians", type=int, default=50)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--fill", type=float, default=0.6)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    clinicians = [uuid.uuid4() for _ in range(args.clinicians)]
+    start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    end = start + timedelta(days=args.days)
+
+    sessions, exceptions, bookings = [], [], []
+    for clinician_id in clinicians:
+        sessions.extend(_sessions(clinician_id))
+        leave = start + timedelta(days=rng.randrange(args.days))
+        exceptions.append(SimpleNamespace(
+            clinician_id=clinician_id, starts_at=leave, ends_at=leave + timedelta(days=rng.randint(1, 3))
+        ))
+
+    # Book grid slots from a throwaway index until FILL of the open time is taken
+    probe = AvailabilityIndex.build(clinicians, sessions, [], [])
+    for slot in probe.slots(start, end, "routine"):
+        if rng.random() < args.fill:
+            bookings.append(SimpleNamespace(
+                id=uuid.uuid4(), clinician_id=slot.clinician_id, status="confirmed",
+                scheduled_at=slot.starts_at, duration_minutes=slot.duration_minutes
+            ))
+
+    index, build_ms, _ = _timed(
+        lambda: AvailabilityIndex.build(clinicians, sessions, exceptions, bookings), 3
+    )
+    print(f"{args.clinicians} clinicians x {args.days} days, {len(bookings)} bookings, "
+          f"{len(exceptions)} exceptions: build {build_ms:.0f} ms")
+
+    for appointment_type in ("routine", "urgent", "video"):
+        slots, median_ms, worst_ms = _timed(
+            lambda: index.slots(start, end, appointment_type), args.repeat
+        )
+        print(f"  {appointment_type:<8} ({duration_for(appointment_type)} min) full window: "
+              f"{len(slots)} slots in {median_ms:.1f} ms (max {worst_ms:.1f})")
+
+    _, median_ms, worst_ms = _timed(lambda: index.slots(start, start + timedelta(days=7), "routine", limit=200), args.repeat)
+    print(f"  routine first week, limit 200: {median_ms:.2f} ms (max {worst_ms:.2f})")
+
+    one = clinicians[:1]
+    _, median_ms, worst_ms = _timed(lambda: index.slots(start, end, "routine", clinician_ids=one), args.repeat)
+    print(f"  one clinician full window: {median_ms:.2f} ms (max {worst_ms:.2f})")
+
+    # Incremental refresh: move bookings one at a time
+    moves = rng.sample(bookings, min(1000, len(bookings)))
+    started = time.perf_counter()
+    for booking in moves:
+        index.apply_booking(SimpleNamespace(
+            id=booking.id, clinician_id=booking.clinician_id, status="cancelled",
+            scheduled_at=booking.scheduled_at, duration_minutes=booking.duration_minutes
+        ))
+        index.apply_booking(booking)
+    per_change_us = (time.perf_counter() - started) / (2 * len(moves)) * 1e6
+    print(f"  incremental update: {per_change_us:.1f} us per booking change")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Benchmark booking under contention: thousands of patients racing for one slot.
+
+Fires REQUESTS simultaneous ``book_slot`` calls at the same start, with
+at most CONCURRENCY database connections. Each call runs on its own
+session, as separate API requests would. Two rounds are run:
+
+* ``warm``: callers share one AvailabilityService, as on a single API
+  worker. Once the winner commits, the rest are turned away by the index.
+* ``stale``: every caller's index still shows the slot free, as on many
+  workers that have not yet refreshed. All of them reach PostgreSQL and
+  are settled by the advisory try-lock and the exclusion constraint.
+
+Each round must end with exactly one booking. Needs a PostgreSQL database
+it may create tables in; the rows it adds are removed afterwards:
+
+    python -m benchmarks.booking_contention [--requests 5000] [--concurrency 50]
+        [--database-url postgresql+asyncpg://...]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from collections import Counter
+from datetime import date, datetime, time as clock, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.config import get_settings
+from app.database import Base
+from app.models.appointment import Appointment
+from app.models.clinician import Clinician, ClinicianException, ClinicianSession
+from app.models.user import User
+from app.services.availability import AvailabilityService
+from app.services.booking import SlotUnavailable, book_slot
+
+settings = get_settings()
+
+
+class StaleAvailability(AvailabilityService):
+    """An index that never learns about bookings, like a worker between refreshes."""
+
+    def booking_changed(self, row) -> None:
+        pass
+
+
+async def _round(name, session_maker, service, user_id, clinician_id, when, requests):
+    outcomes: Counter = Counter()
+    latencies: list[float] = []
+
+    async def attempt() -> None:
+        started = time.perf_counter()
+        async with session_maker() as session:
+            try:
+                await book_slot(session, user_id, "routine", when, clinician_id=clinician_id, service=service)
+                outcomes["booked"] += 1
+            except SlotUnavailable as exc:
+                outcomes[exc.reason] += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(attempt() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    async with session_maker() as session:
+        booked = (await session.execute(
+            select(func.count()).select_from(Appointment.__table__).where(
+                Appointment.clinician_id == clinician_id, Appointment.scheduled_at == when
+            )
+        )).scalar()
+    latencies.sort()
+    print(f"{name:<6} {requests} requests in {elapsed:.2f}s ({requests / elapsed:,.0f} req/s), "
+          f"p50 {statistics.median(latencies):.1f} ms, p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f} ms")
+    print(f"       outcomes {dict(outcomes)}; rows in slot: {booked}")
+    assert booked == 1, "double booking"
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--database-url", default=settings.database_url)
+    args = parser.parse_args()
+
+    engine = create_async_engine(args.database_url, pool_size=args.concurrency, max_overflow=0)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda sync: Base.metadata.create_all(sync, tables=[
+            User.__table__, Clinician.__table__, ClinicianSession.__table__,
+            ClinicianException.__table__, Appointment.__table__,
+        ]))
+
+    user_id, clinicians = uuid.uuid4(), [uuid.uuid4(), uuid.uuid4()]
+    async with session_maker() as session:
+        await session.execute(insert(User.__table__).values(
+            id=user_id, email=f"bench-{user_id}@example.invalid", password_hash="x",
+            first_name_encrypted=b"x", last_name_encrypted=b"x",
+        ))
+        await session.execute(insert(Clinician.__table__), [
+            {"id": clinician_id, "display_name": "Benchmark", "is_active": True} for clinician_id in clinicians
+        ])
+        await session.execute(insert(ClinicianSession.__table__), [
+            {"id": uuid.uuid4(), "clinician_id": clinician_id, "weekday": weekday,
+             "start_time": clock(9), "end_time": clock(17)}
+            for clinician_id in clinicians for weekday in range(7)
+        ])
+        await session.commit()
+
+    tz = ZoneInfo(settings.clinic_timezone)
+    day = date.today() + timedelta(days=3)
+    when = datetime.combine(day, clock(10), tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)
+    try:
+        warm = AvailabilityService(session_maker)
+        await _round("warm", session_maker, warm, user_id, clinicians[0], when, args.requests)
+
+        stale = StaleAvailability(session_maker, refresh_seconds=3600)
+        await stale.ensure_current(when - timedelta(days=1), when + timedelta(days=1))
+        await _round("stale", session_maker, stale, user_id, clinicians[1], when, args.requests)
+    finally:
+        async with session_maker() as session:
+            await session.execute(delete(Appointment.__table__).where(Appointment.user_id == user_id))
+            await session.execute(delete(Clinician.__table__).where(Clinician.id.in_(clinicians)))
+            await session.execute(delete(User.__table__).where(User.id == user_id))
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""Benchmark request throughput and latency across connection pool sizes.
+
+CLIENTS concurrent callers each run requests shaped like a typical API read:
+check out a session, run QUERIES short indexed queries, and hold the
+connection for THINK ms of application work in between. The same load is
+run once per pool size (``max_overflow=0``, so the size is the cap). The
+curve shows where adding connections stops buying throughput and starts
+costing server memory and lock contention. Run it with ``--pgbouncer`` to
+see what turning off server-side prepared statements costs.
+
+Needs a PostgreSQL database (or a PgBouncer in front of one); only reads
+are run:
+
+    python -m benchmarks.db_pool [--sizes 2,5,10,20,40,80] [--clients 200]
+        [--requests 5000] [--queries 3] [--think 2] [--pgbouncer]
+        [--database-url postgresql+asyncpg://...]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config import get_settings
+from app.database import make_engine, pool_stats
+
+settings = get_settings()
+
+
+async def _round(database_url: str, pool_size: int, args: argparse.Namespace) -> None:
+    engine = make_engine(database_url, pool_size=pool_size, max_overflow=0, pool_timeout=60)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    # Open the pool's connections up front so connecting is not counted as waiting
+    async with asyncio.TaskGroup() as group:
+        for _ in range(pool_size):
+            group.create_task(_warm(session_maker))
+    warm_stats = pool_stats(engine)
+
+    statement = select(text("relname")).select_from(text("pg_class")).where(text("oid = :oid")).limit(1)
+    latencies: list[float] = []
+    remaining = args.requests
+
+    async def client() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            async with session_maker() as session:
+                for index in range(args.queries):
+                    await session.execute(statement, {"oid": 1259 + index})
+                    await asyncio.sleep(args.think / 1000)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.clients)))
+    elapsed = time.perf_counter() - started
+
+    stats = pool_stats(engine)
+    checkouts = stats["checkouts"] - warm_stats["checkouts"]
+    wait_total = stats["wait_seconds_mean"] * stats["checkouts"] - warm_stats["wait_seconds_mean"] * warm_stats["checkouts"]
+    latencies.sort()
+    print(f"{pool_size:>5} {len(latencies) / elapsed:>9,.0f} {statistics.median(latencies):>8.1f} "
+          f"{latencies[int(len(latencies) * 0.99) - 1]:>8.1f} {wait_total / checkouts * 1000:>10.1f} "
+          f"{stats['wait_seconds_max'] * 1000:>9.1f}")
+    await engine.dispose()
+
+
+async def _warm(session_maker: async_sessionmaker) -> None:
+    async with session_maker() as session:
+        await session.execute(text("SELECT 1"))
+        await asyncio.sleep(0.05)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="2,5,10,20,40,80")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=3, help="queries per request")
+    parser.add_argument("--think", type=float, default=2.0, help="ms of work between queries")
+    parser.add_argument("--pgbouncer", action="store_true", help="no server-side prepared statement reuse")
+    parser.add_argument("--database-url", default=settings.database_url)
+    args = parser.parse_args()
+    settings.db_pgbouncer = args.pgbouncer
+
+    print(f"{args.clients} clients, {args.requests} requests of {args.queries} queries, "
+          f"{args.think} ms between queries, pgbouncer mode {'on' if args.pgbouncer else 'off'}")
+    print(f"{'pool':>5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'wait ms':>10} {'max wait':>9}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        await _round(args.database_url, size, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
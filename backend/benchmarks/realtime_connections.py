@@ -0,0 +1,76 @@
+"""Benchmark SSE connections held by one worker: memory per connection and fan-out latency.
+
+Opens CONNECTIONS event streams spread over USERS users against a single
+EventHub, as one API worker would hold them. It then publishes one event
+per user and measures how long until every connection has received it.
+Requires a reachable Redis:
+
+    python -m benchmarks.realtime_connections [--connections 10000] [--users 5000]
+        [--redis-url redis://localhost:6379/15]
+
+The streams are consumed in-process, so socket buffers and TLS state on
+the real server come on top of the per-connection figure reported here.
+"""
+import argparse
+import asyncio
+import resource
+import statistics
+import time
+import uuid
+
+from app.core.redis import create_redis
+from app.services.realtime import EventHub, event_stream
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    args = parser.parse_args()
+
+    redis = create_redis(args.redis_url, max_connections=64)
+    hub = EventHub(redis)
+    users = [uuid.uuid4() for _ in range(args.users)]
+    received: dict[int, float] = {}
+
+    async def connection(index: int) -> None:
+        stream = event_stream(users[index % len(users)], hub=hub)
+        async for chunk in stream:
+            if chunk.startswith(b"id:"):
+                received[index] = time.perf_counter()
+                break
+        await stream.aclose()
+
+    baseline = _max_rss_mb()
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(connection(i)) for i in range(args.connections)]
+    while hub.connections < args.connections:
+        await asyncio.sleep(0.05)
+    connect_s = time.perf_counter() - started
+    held_rss = _max_rss_mb()
+
+    published = time.perf_counter()
+    await asyncio.gather(*(hub.publish(user, "bench", {"n": 1}) for user in users))
+    await asyncio.gather(*tasks)
+    delivered = time.perf_counter()
+
+    latencies = sorted((at - published) * 1000 for at in received.values())
+    per_connection_kb = (held_rss - baseline) * 1024 / args.connections
+    print(f"{args.connections} connections over {args.users} users opened in {connect_s:.2f}s")
+    print(f"RSS {held_rss:.1f} MB (baseline {baseline:.1f} MB, ~{per_connection_kb:.1f} KB/connection)")
+    print(f"fan-out to all connections in {(delivered - published) * 1000:.0f} ms "
+          f"(p50 {statistics.median(latencies):.0f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.0f} ms)")
+
+    await redis.delete(*(f"events:{user}" for user in users))
+    await redis.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""Benchmark medication list serialization: legacy path vs compiled encoders.
+
+Run from the backend directory:
+
+    python -m benchmarks.serialization
+"""
+import json
+import timeit
+import uuid
+from datetime import date, datetime
+from types import SimpleNamespace
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+
+from app.core.serialization import from_rows, render
+from app.schemas.medication import MedicationResponse
+
+
+def _rows(count: int) -> list:
+    now = datetime.utcnow()
+    return [
+        SimpleNamespace(
+            id=uuid.uuid4(),
+            medication_name=f"Medication {i}",
+            dosage="10mg",
+            frequency="twice daily",
+            instructions="Take with food",
+            started_at=date(2024, 1, 1),
+            ended_at=None,
+            is_active=True,
+            reminder_enabled=True,
+            reminder_times=["08:00", "20:00"],
+            synced_from_clinic=False,
+            created_at=now,
+            updated_at=now
+        )
+        for i in range(count)
+    ]
+
+
+def legacy(rows: list) -> bytes:
+    """Field-by-field construction, response_model re-validation and jsonable_encoder."""
+    built = [
+        MedicationResponse(
+            id=m.id,
+            medication_name=m.medication_name,
+            dosage=m.dosage,
+            frequency=m.frequency,
+            instructions=m.instructions,
+            started_at=m.started_at,
+            ended_at=m.ended_at,
+            is_active=m.is_active,
+            reminder_enabled=m.reminder_enabled,
+            reminder_times=m.reminder_times,
+            synced_from_clinic=m.synced_from_clinic,
+            created_at=m.created_at,
+            updated_at=m.updated_at
+        )
+        for m in rows
+    ]
+    revalidated = [MedicationResponse.model_validate(m.model_dump()) for m in built]
+    return json.dumps(jsonable_encoder(revalidated)).encode()
+
+
+def compiled(rows: list) -> bytes:
+    """Single from_attributes validation rendered by pydantic-core."""
+    return render(from_rows(MedicationResponse, rows), List[MedicationResponse]).body
+
+
+def main() -> None:
+    for count in (100, 1000):
+        rows = _rows(count)
+        number = 20 if count == 1000 else 200
+        for name, fn in (("legacy", legacy), ("compiled", compiled)):
+            seconds = min(timeit.repeat(lambda: fn(rows), number=number, repeat=3)) / number
+            print(f"{name:>9} {count:>5} items: {seconds * 1000:8.3f} ms/response")
+
+
+if __name__ == "__main__":
+    main()
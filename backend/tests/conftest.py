@@ -0,0 +1,170 @@
+"""Shared fixtures.
+
+Tests run against an in-memory SQLite database by default. Set
+``TEST_DATABASE_URL`` to a disposable PostgreSQL database
+(``postgresql+asyncpg://...``; every table is dropped afterwards) to run
+them against PostgreSQL as well, including the ``postgresql``-marked tests
+that need its constraints and locking.
+"""
+import os
+import uuid
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator
+
+import boto3
+import httpx
+import pytest
+from moto import mock_aws
+from sqlalchemy import event, insert
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.exc import CompileError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import CreateTable
+
+from app.api.deps import get_current_active_user
+from app.core.encryption import field_encryption
+from app.database import Base, get_db, get_read_db, make_engine
+from app.models.user import User
+from app.services.object_storage import MIN_PART_SIZE, ObjectStorage
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+TEST_BUCKET = "patient-files-test"
+
+
+def pytest_collection_modifyitems(config, items):
+    if TEST_DATABASE_URL:
+        return
+    skip = pytest.mark.skip(reason="needs PostgreSQL: set TEST_DATABASE_URL")
+    for item in items:
+        if "postgresql" in item.keywords:
+            item.add_marker(skip)
+
+
+def _sqlite_tables() -> list:
+    """Tables SQLite can create; the rest use PostgreSQL-only types (INET, TSVECTOR, ...)."""
+    dialect = sqlite.dialect()
+    tables = []
+    for table in Base.metadata.sorted_tables:
+        try:
+            CreateTable(table).compile(dialect=dialect)
+        except CompileError:
+            continue
+        tables.append(table)
+    return tables
+
+
+@pytest.fixture
+async def engine() -> AsyncIterator[AsyncEngine]:
+    if TEST_DATABASE_URL:
+        engine = make_engine(TEST_DATABASE_URL)
+        tables = None
+    else:
+        engine = create_async_engine(
+            "sqlite+aiosqlite://",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool
+        )
+        tables = _sqlite_tables()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all, tables=tables)
+        await conn.run_sync(Base.metadata.create_all, tables=tables)
+    try:
+        yield engine
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all, tables=tables)
+        await engine.dispose()
+
+
+@pytest.fixture
+def session_maker(engine: AsyncEngine) -> async_sessionmaker:
+    return async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+@pytest.fixture
+async def user(session_maker: async_sessionmaker) -> User:
+    user_id = uuid.uuid4()
+    async with session_maker() as session:
+        await session.execute(insert(User).values(
+            id=user_id,
+            email=f"{user_id.hex}@example.com",
+            password_hash="x",
+            first_name_encrypted=field_encryption.encrypt("Test"),
+            last_name_encrypted=field_encryption.encrypt("Patient"),
+            status="active"
+        ))
+        await session.commit()
+        return await session.get(User, user_id)
+
+
+@pytest.fixture
+async def client(session_maker: async_sessionmaker, user: User) -> AsyncIterator[httpx.AsyncClient]:
+    """API client signed in as ``user``, with every session on the test database."""
+    from app.main import app
+
+    async def test_db() -> AsyncIterator[AsyncSession]:
+        async with session_maker() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = test_db
+    app.dependency_overrides[get_read_db] = test_db
+    app.dependency_overrides[get_current_active_user] = lambda: user
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            yield client
+    finally:
+        app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def s3() -> Iterator[object]:
+    """An in-process S3 stand-in (moto) with the test bucket created."""
+    with mock_aws():
+        client = boto3.client(
+            "s3",
+            region_name="eu-west-2",
+            aws_access_key_id="test",
+            aws_secret_access_key="test"
+        )
+        client.create_bucket(Bucket=TEST_BUCKET, CreateBucketConfiguration={"LocationConstraint": "eu-west-2"})
+        yield client
+
+
+@pytest.fixture
+def storage(s3) -> ObjectStorage:
+    return ObjectStorage(client=s3, bucket=TEST_BUCKET, part_size=MIN_PART_SIZE)
+
+
+class QueryCounter:
+    """SQL statements sent to the database, as executed by the driver."""
+
+    def __init__(self):
+        self.statements: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+    def __repr__(self) -> str:
+        return "\n".join(self.statements)
+
+
+@pytest.fixture
+def count_queries(engine: AsyncEngine):
+    """``with count_queries() as queries:`` records every statement run inside the block."""
+
+    @contextmanager
+    def counting() -> Iterator[QueryCounter]:
+        counter = QueryCounter()
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            counter.statements.append(statement)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", record)
+        try:
+            yield counter
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+    return counting
@@ -0,0 +1,25 @@
+"""Audit search planning: which filters can be served by a btree."""
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app.services.audit_search import AuditQuery, _slices, parse_ip_filter
+
+RANGE = {"starts_at": datetime(2020, 1, 1), "ends_before": datetime(2026, 1, 1)}
+
+
+@pytest.mark.parametrize("filters, indexed", [
+    ({"user_id": uuid.uuid4()}, True),
+    ({"ip_address": parse_ip_filter("203.0.113.7")}, True),
+    ({"ip_address": parse_ip_filter("2001:db8::1")}, True),
+    ({"ip_address": parse_ip_filter("203.0.113.0/24")}, False),
+    ({"user_id": uuid.uuid4(), "ip_address": parse_ip_filter("10.0.0.0/8")}, True),
+    ({"action": "login"}, False),
+])
+def test_only_equality_filters_count_as_indexed(filters, indexed):
+    query = AuditQuery(**RANGE, **filters)
+
+    assert query.indexed is indexed
+    # Unindexed searches are split into time slices instead of one range
+    assert (len(list(_slices(query, query.starts_at))) == 1) is indexed
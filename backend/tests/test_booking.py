@@ -0,0 +1,211 @@
+"""Booking under contention: many simultaneous requests for one slot."""
+import asyncio
+import uuid
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app.config import get_settings
+from app.core.encryption import field_encryption
+from app.models.appointment import Appointment
+from app.models.clinician import Clinician, ClinicianSession
+from app.models.user import User
+from app.services.availability import AvailabilityService
+from app.services.booking import EXCLUSION_VIOLATION, SlotUnavailable, book_slot, reschedule
+
+settings = get_settings()
+
+REQUESTS = 300
+
+
+class StaleAvailability(AvailabilityService):
+    """An index that never learns about bookings, like a worker between refreshes."""
+
+    def booking_changed(self, row) -> None:
+        pass
+
+
+def _at(hour: int, minute: int = 0) -> datetime:
+    """Naive UTC for a clinic-local time three days out."""
+    local = datetime.combine(date.today() + timedelta(days=3), time(hour, minute), tzinfo=ZoneInfo(settings.clinic_timezone))
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@pytest.fixture
+async def clinicians(session_maker) -> list[uuid.UUID]:
+    clinician_ids = [uuid.uuid4(), uuid.uuid4()]
+    async with session_maker() as session:
+        await session.execute(insert(Clinician), [
+            {"id": clinician_id, "display_name": f"Clinician {n}", "is_active": True}
+            for n, clinician_id in enumerate(clinician_ids)
+        ])
+        await session.execute(insert(ClinicianSession), [
+            {"id": uuid.uuid4(), "clinician_id": clinician_id, "weekday": weekday,
+             "start_time": time(9), "end_time": time(17)}
+            for clinician_id in clinician_ids for weekday in range(7)
+        ])
+        await session.commit()
+    return clinician_ids
+
+
+@pytest.fixture
+async def patients(session_maker) -> list[uuid.UUID]:
+    user_ids = [uuid.uuid4() for _ in range(20)]
+    async with session_maker() as session:
+        await session.execute(insert(User), [
+            {
+                "id": user_id,
+                "email": f"{user_id.hex}@example.com",
+                "password_hash": "x",
+                "first_name_encrypted": field_encryption.encrypt("Test"),
+                "last_name_encrypted": field_encryption.encrypt("Patient"),
+                "status": "active"
+            }
+            for user_id in user_ids
+        ])
+        await session.commit()
+    return user_ids
+
+
+async def _race(session_maker, service, patients, attempts) -> Counter:
+    """Run ``(appointment_type, scheduled_at, clinician_id)`` attempts at once, each on its own session."""
+    outcomes: Counter = Counter()
+
+    async def attempt(n: int, appointment_type: str, scheduled_at: datetime, clinician_id: uuid.UUID) -> None:
+        async with session_maker() as session:
+            try:
+                await book_slot(
+                    session, patients[n % len(patients)], appointment_type, scheduled_at,
+                    clinician_id=clinician_id, service=service
+                )
+                outcomes["booked"] += 1
+            except SlotUnavailable as exc:
+                outcomes[exc.reason] += 1
+                assert exc.alternatives
+                assert all(
+                    (slot.clinician_id, slot.starts_at) != (clinician_id, scheduled_at) for slot in exc.alternatives
+                )
+
+    await asyncio.gather(*(attempt(n, *args) for n, args in enumerate(attempts)))
+    return outcomes
+
+
+async def _live_bookings(session_maker, clinician_id: uuid.UUID) -> list:
+    async with session_maker() as session:
+        result = await session.execute(
+            select(Appointment.scheduled_at, Appointment.duration_minutes).where(
+                Appointment.clinician_id == clinician_id, Appointment.status == "confirmed"
+            )
+        )
+        return result.all()
+
+
+async def test_racing_for_one_slot_books_it_once(session_maker, clinicians, patients):
+    when = _at(10)
+    service = AvailabilityService(session_maker)
+
+    outcomes = await _race(session_maker, service, patients, [("routine", when, clinicians[0])] * REQUESTS)
+
+    assert outcomes["booked"] == 1
+    assert sum(outcomes.values()) == REQUESTS
+    assert set(outcomes) <= {"booked", "taken", "contended", "overlap"}
+    assert await _live_bookings(session_maker, clinicians[0]) == [(when, 15)]
+
+
+@pytest.mark.postgresql
+async def test_racing_on_stale_workers_books_the_slot_once(session_maker, clinicians, patients):
+    when = _at(10)
+    service = StaleAvailability(session_maker, refresh_seconds=3600)
+
+    outcomes = await _race(session_maker, service, patients, [("routine", when, clinicians[0])] * REQUESTS)
+
+    # Every request reached the database; the lock and the constraint settled them
+    assert outcomes["booked"] == 1
+    assert outcomes["taken"] == 0
+    assert await _live_bookings(session_maker, clinicians[0]) == [(when, 15)]
+
+
+@pytest.mark.postgresql
+async def test_racing_for_overlapping_starts_books_one(session_maker, clinicians, patients):
+    service = StaleAvailability(session_maker, refresh_seconds=3600)
+    # Different starts take different advisory locks; only the constraint sees the overlap
+    attempts = [("routine", _at(10), clinicians[0]), ("urgent", _at(10, 10), clinicians[0])] * (REQUESTS // 2)
+
+    outcomes = await _race(session_maker, service, patients, attempts)
+
+    assert outcomes["booked"] == 1
+    assert len(await _live_bookings(session_maker, clinicians[0])) == 1
+
+
+@pytest.mark.postgresql
+async def test_exclusion_constraint_only_counts_live_bookings(session_maker, clinicians, patients):
+    def booking(status: str, scheduled_at: datetime, clinician_id: uuid.UUID = clinicians[0]) -> dict:
+        return {
+            "id": uuid.uuid4(), "user_id": patients[0], "clinician_id": clinician_id, "appointment_type": "routine",
+            "status": status, "scheduled_at": scheduled_at, "duration_minutes": 15
+        }
+
+    async with session_maker() as session:
+        await session.execute(insert(Appointment).values(booking("confirmed", _at(10))))
+        await session.execute(insert(Appointment).values(booking("cancelled", _at(10, 5))))
+        await session.execute(insert(Appointment).values(booking("confirmed", _at(10, 5), clinicians[1])))
+        await session.execute(insert(Appointment).values(booking("requested", _at(10, 15))))
+        await session.commit()
+
+        with pytest.raises(IntegrityError) as raised:
+            await session.execute(insert(Appointment).values(booking("requested", _at(10, 14))))
+        assert raised.value.orig.sqlstate == EXCLUSION_VIOLATION
+
+
+async def test_racing_reschedules_move_one_appointment(session_maker, clinicians, patients):
+    service = AvailabilityService(session_maker)
+    appointments = []
+    for n, hour in enumerate((11, 12, 13, 14)):
+        async with session_maker() as session:
+            appointments.append(await book_slot(
+                session, patients[n], "routine", _at(hour), clinician_id=clinicians[0], service=service
+            ))
+    when = _at(10)
+
+    async def move(appointment) -> bool:
+        async with session_maker() as session:
+            try:
+                await reschedule(session, appointment.user_id, appointment, when, service=service)
+                return True
+            except SlotUnavailable:
+                return False
+
+    moved = await asyncio.gather(*(move(appointment) for appointment in appointments))
+
+    assert sum(moved) == 1
+    async with session_maker() as session:
+        starts = (await session.execute(
+            select(Appointment.scheduled_at, func.count()).group_by(Appointment.scheduled_at)
+        )).all()
+    # The losers keep their original time
+    assert sorted(starts) == sorted(
+        [(when, 1)] + [(a.scheduled_at, 1) for a, won in zip(appointments, moved) if not won]
+    )
+
+
+async def test_lost_race_is_a_409_with_alternatives(client, session_maker, clinicians, user, monkeypatch):
+    service = AvailabilityService(session_maker)
+    monkeypatch.setattr("app.services.booking.get_availability", lambda: service)
+    request = {
+        "appointment_type": "routine",
+        "scheduled_at": _at(10).replace(tzinfo=timezone.utc).isoformat(),
+        "clinician_id": str(clinicians[0]),
+        "reason": "Blood pressure review"
+    }
+
+    first = await client.post("/api/v1/appointments/", json=request)
+    second = await client.post("/api/v1/appointments/", json=request)
+
+    assert first.status_code == 201
+    assert second.status_code == 409
+    alternatives = second.json()["alternatives"]
+    assert alternatives and alternatives[0]["clinician_id"] == str(clinicians[0])
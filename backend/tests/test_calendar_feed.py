@@ -0,0 +1,36 @@
+"""Calendar feed URLs: conditional polls and revocation."""
+from urllib.parse import urlsplit
+
+import pytest
+
+from app.api.v1 import appointments
+
+API = "/api/v1/appointments"
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    async def get_versions(user_id, resources):
+        return [7 for _ in resources]
+
+    monkeypatch.setattr(appointments, "get_versions", get_versions)
+
+
+def _feed_path(response) -> str:
+    assert response.status_code == 200
+    return urlsplit(response.json()["url"]).path
+
+
+async def test_a_rotated_url_is_not_revalidated(client, versions):
+    old = _feed_path(await client.get(f"{API}/calendar-feed"))
+    feed = await client.get(old)
+    assert feed.status_code == 200
+    assert feed.content.startswith(b"BEGIN:VCALENDAR")
+    etag = feed.headers["ETag"]
+    assert (await client.get(old, headers={"If-None-Match": etag})).status_code == 304
+
+    new = _feed_path(await client.post(f"{API}/calendar-feed"))
+
+    assert (await client.get(old, headers={"If-None-Match": etag})).status_code == 404
+    assert (await client.get(old)).status_code == 404
+    assert (await client.get(new)).status_code == 200
@@ -0,0 +1,269 @@
+"""Clinic EMR sync against a stub change feed served through httpx.MockTransport."""
+import asyncio
+import uuid
+from typing import Any
+
+import httpx
+import pytest
+from sqlalchemy import insert, select
+
+from app.core.encryption import field_encryption
+from app.models.blob import StoredBlob
+from app.models.clinic_sync import ClinicSyncCursor
+from app.models.document import Document
+from app.models.medication import PatientMedication
+from app.models.user import User
+from app.services.blob_store import BlobStore
+from app.services.clinic_sync import ClinicClient, ClinicSyncEngine, sync_linked_patients
+from app.services.user_keys import get_owner_key
+from app.services.versions import DOCUMENTS, MEDICATIONS
+
+
+class StubEMR:
+    """Change feed per ``(clinic_patient_id, resource)``.
+
+    Every change appends to the feed; the cursor is the feed position, and
+    the ETag names the position a first page would end at.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.feeds: dict[tuple[str, str], list[dict[str, Any]]] = {}
+        self.files: dict[str, bytes] = {}
+        self.failing: set[str] = set()
+        self.requests: list[httpx.Request] = []
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def change(self, clinic_patient_id: uuid.UUID, resource: str, item: dict[str, Any]) -> None:
+        self.feeds.setdefault((str(clinic_patient_id), resource), []).append(item)
+
+    def client(self) -> ClinicClient:
+        return ClinicClient(base_url="http://emr.test", api_key="test", transport=httpx.MockTransport(self.handle))
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            return self._respond(request)
+        finally:
+            self.in_flight -= 1
+
+    def downloads(self) -> list[httpx.Request]:
+        return [r for r in self.requests if r.url.path.endswith("/file")]
+
+    def _respond(self, request: httpx.Request) -> httpx.Response:
+        _, patient, resource, *document = request.url.path.strip("/").split("/")
+        if patient in self.failing:
+            return httpx.Response(503)
+        if document:
+            return httpx.Response(200, content=self.files[document[0]])
+        feed = self.feeds.get((patient, resource), [])
+        since = int(request.url.params.get("since", 0))
+        limit = int(request.url.params["limit"])
+        etag = f'"{resource}-{len(feed)}"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304, headers={"ETag": etag})
+        end = min(since + limit, len(feed))
+        return httpx.Response(
+            200,
+            json={"items": feed[since:end], "next_cursor": str(end), "has_more": end < len(feed)},
+            headers={"ETag": etag}
+        )
+
+
+def _medication(clinic_id: uuid.UUID, name: str, **fields: Any) -> dict[str, Any]:
+    return {"id": str(clinic_id), "name": name, "dosage": "10mg", "instructions": "Once daily", **fields}
+
+
+def _document(clinic_id: uuid.UUID, title: str, **fields: Any) -> dict[str, Any]:
+    return {
+        "id": str(clinic_id),
+        "document_type": "lab_result",
+        "title": title,
+        "file_key": f"emr/{clinic_id}.pdf",
+        "file_type": "application/pdf",
+        "file_size": 1024,
+        "issued_at": "2026-01-15",
+        **fields
+    }
+
+
+async def _linked_user(session_maker, status: str = "active") -> tuple[uuid.UUID, uuid.UUID]:
+    user_id, clinic_patient_id = uuid.uuid4(), uuid.uuid4()
+    async with session_maker() as session:
+        await session.execute(insert(User).values(
+            id=user_id,
+            email=f"{user_id.hex}@example.com",
+            password_hash="x",
+            first_name_encrypted=field_encryption.encrypt("Test"),
+            last_name_encrypted=field_encryption.encrypt("Patient"),
+            clinic_patient_id=clinic_patient_id,
+            status=status
+        ))
+        await session.commit()
+    return user_id, clinic_patient_id
+
+
+async def _medications(session_maker, user_id: uuid.UUID) -> dict[str, PatientMedication]:
+    async with session_maker() as session:
+        result = await session.execute(select(PatientMedication).where(PatientMedication.user_id == user_id))
+        return {m.medication_name: m for m in result.scalars()}
+
+
+async def _documents(session_maker, user_id: uuid.UUID) -> list[Document]:
+    async with session_maker() as session:
+        result = await session.execute(select(Document).where(Document.user_id == user_id))
+        return list(result.scalars())
+
+
+async def _read_document(session_maker, storage, document: Document) -> bytes:
+    async with session_maker() as session:
+        owner_key = await get_owner_key(session, document.user_id)
+    key = field_encryption.decrypt(document.s3_key_encrypted)
+    return b"".join([chunk async for chunk in storage.read_decrypted(key, document.file_size, owner_key=owner_key)])
+
+
+@pytest.fixture
+def emr() -> StubEMR:
+    return StubEMR()
+
+
+async def test_sync_pages_through_the_feed(session_maker, storage, emr):
+    user_id, clinic_patient_id = await _linked_user(session_maker)
+    for n in range(5):
+        emr.change(clinic_patient_id, MEDICATIONS, _medication(uuid.uuid4(), f"Medication {n}"))
+    document_id = uuid.uuid4()
+    emr.change(clinic_patient_id, DOCUMENTS, _document(document_id, "Blood panel"))
+    emr.files[str(document_id)] = b"%PDF-1.7 blood panel"
+
+    async with emr.client() as client:
+        engine = ClinicSyncEngine(client, session_maker, batch_size=2, blob_store=BlobStore(storage))
+        results = await engine.sync_patient(user_id, clinic_patient_id)
+
+    by_resource = {r.resource: r for r in results}
+    assert (by_resource[MEDICATIONS].pages, by_resource[MEDICATIONS].upserted) == (3, 5)
+    assert (by_resource[DOCUMENTS].pages, by_resource[DOCUMENTS].upserted) == (1, 1)
+    assert all(r.error is None and r.elapsed_ms > 0 for r in results)
+
+    medications = await _medications(session_maker, user_id)
+    assert len(medications) == 5
+    assert all(m.synced_from_clinic for m in medications.values())
+    assert field_encryption.decrypt(medications["Medication 0"].instructions_encrypted) == "Once daily"
+    async with session_maker() as session:
+        document = (await session.execute(select(Document).where(Document.user_id == user_id))).scalar_one()
+        cursor = (await session.execute(select(ClinicSyncCursor).where(
+            ClinicSyncCursor.user_id == user_id, ClinicSyncCursor.resource == MEDICATIONS
+        ))).scalar_one()
+    assert document.title == "Blood panel"
+    assert (cursor.cursor, cursor.etag) == ("5", f'"{MEDICATIONS}-5"')
+
+    # The file is our own encrypted copy, not the EMR's key
+    assert document.blob_id is not None
+    assert field_encryption.decrypt(document.s3_key_encrypted).startswith(f"blobs/{user_id}/")
+    assert await _read_document(session_maker, storage, document) == b"%PDF-1.7 blood panel"
+
+
+async def test_document_changes_replace_and_release_the_copy(session_maker, storage, s3, emr):
+    user_id, clinic_patient_id = await _linked_user(session_maker)
+    document_id = uuid.uuid4()
+    emr.files[str(document_id)] = b"first version"
+    emr.change(clinic_patient_id, DOCUMENTS, _document(document_id, "Letter"))
+
+    async with emr.client() as client:
+        engine = ClinicSyncEngine(client, session_maker, blob_store=BlobStore(storage))
+        await engine.sync_resource(user_id, clinic_patient_id, DOCUMENTS)
+        [first] = await _documents(session_maker, user_id)
+
+        # A metadata-only change keeps the copy without fetching the file again
+        emr.change(clinic_patient_id, DOCUMENTS, _document(document_id, "Referral letter"))
+        await engine.sync_resource(user_id, clinic_patient_id, DOCUMENTS)
+        [renamed] = await _documents(session_maker, user_id)
+        assert (renamed.title, renamed.blob_id) == ("Referral letter", first.blob_id)
+        assert len(emr.downloads()) == 1
+
+        # New content is copied and the old blob is collected
+        emr.files[str(document_id)] = b"second version"
+        emr.change(clinic_patient_id, DOCUMENTS, _document(document_id, "Letter", content_sha256="b" * 64))
+        await engine.sync_resource(user_id, clinic_patient_id, DOCUMENTS)
+        [replaced] = await _documents(session_maker, user_id)
+        assert replaced.blob_id != first.blob_id
+        assert await _read_document(session_maker, storage, replaced) == b"second version"
+
+        emr.change(clinic_patient_id, DOCUMENTS, {"id": str(document_id), "deleted": True})
+        result = await engine.sync_resource(user_id, clinic_patient_id, DOCUMENTS)
+
+    assert (result.upserted, result.removed) == (0, 1)
+    assert await _documents(session_maker, user_id) == []
+    async with session_maker() as session:
+        assert (await session.execute(select(StoredBlob))).first() is None
+    assert s3.list_objects_v2(Bucket=storage.bucket).get("KeyCount") == 0
+
+
+async def test_unchanged_feed_is_not_refetched(session_maker, emr):
+    user_id, clinic_patient_id = await _linked_user(session_maker)
+    emr.change(clinic_patient_id, MEDICATIONS, _medication(uuid.uuid4(), "Metformin"))
+
+    async with emr.client() as client:
+        engine = ClinicSyncEngine(client, session_maker)
+        await engine.sync_resource(user_id, clinic_patient_id, MEDICATIONS)
+        again = await engine.sync_resource(user_id, clinic_patient_id, MEDICATIONS)
+
+    assert again.not_modified
+    assert (again.pages, again.upserted) == (0, 0)
+    assert emr.requests[-1].headers["If-None-Match"] == f'"{MEDICATIONS}-1"'
+
+
+async def test_changes_since_the_cursor_are_upserted_in_place(session_maker, emr):
+    user_id, clinic_patient_id = await _linked_user(session_maker)
+    metformin, lisinopril = uuid.uuid4(), uuid.uuid4()
+    emr.change(clinic_patient_id, MEDICATIONS, _medication(metformin, "Metformin"))
+    emr.change(clinic_patient_id, MEDICATIONS, _medication(lisinopril, "Lisinopril"))
+
+    async with emr.client() as client:
+        engine = ClinicSyncEngine(client, session_maker)
+        await engine.sync_resource(user_id, clinic_patient_id, MEDICATIONS)
+        before = await _medications(session_maker, user_id)
+
+        emr.change(clinic_patient_id, MEDICATIONS, _medication(metformin, "Metformin", dosage="20mg"))
+        emr.change(clinic_patient_id, MEDICATIONS, {"id": str(lisinopril), "deleted": True})
+        result = await engine.sync_resource(user_id, clinic_patient_id, MEDICATIONS)
+
+    assert emr.requests[-1].url.params["since"] == "2"
+    assert (result.fetched, result.upserted, result.removed) == (2, 1, 1)
+    after = await _medications(session_maker, user_id)
+    assert {name: m.id for name, m in after.items()} == {name: m.id for name, m in before.items()}
+    assert after["Metformin"].dosage == "20mg"
+    assert not after["Lisinopril"].is_active
+
+
+async def test_sync_many_bounds_concurrency_and_isolates_failures(session_maker):
+    emr = StubEMR(delay=0.01)
+    patients = [await _linked_user(session_maker) for _ in range(6)]
+    for _, clinic_patient_id in patients:
+        emr.change(clinic_patient_id, MEDICATIONS, _medication(uuid.uuid4(), "Metformin"))
+    emr.failing.add(str(patients[0][1]))
+
+    async with emr.client() as client:
+        report = await ClinicSyncEngine(client, session_maker, concurrency=2).sync_many(patients)
+
+    assert emr.max_in_flight == 2
+    assert len(report.results) == 12
+    assert report.failed == 2
+    assert report.upserted == 5
+    assert {r.user_id for r in report.results if r.error} == {patients[0][0]}
+
+
+async def test_sync_linked_patients_skips_inactive_accounts(session_maker, emr):
+    active = await _linked_user(session_maker)
+    closed = await _linked_user(session_maker, status="deleted")
+    for _, clinic_patient_id in (active, closed):
+        emr.change(clinic_patient_id, MEDICATIONS, _medication(uuid.uuid4(), "Metformin"))
+
+    async with emr.client() as client:
+        report = await sync_linked_patients(client, session_maker)
+
+    assert {r.user_id for r in report.results} == {active[0]}
+    assert len(await _medications(session_maker, closed[0])) == 0
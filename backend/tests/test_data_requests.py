@@ -0,0 +1,46 @@
+"""DataRequest claims: leases and the per-type concurrency cap."""
+import asyncio
+from datetime import timedelta
+
+from sqlalchemy import insert
+
+from app.models.consent import DataRequest
+from app.services.data_requests import claim_request, utcnow
+
+LEASE = timedelta(minutes=2)
+
+
+async def _pending(session_maker, user_id, count, request_type="export"):
+    async with session_maker() as session:
+        await session.execute(insert(DataRequest), [
+            {"user_id": user_id, "request_type": request_type, "status": "pending",
+             "requested_at": utcnow() - timedelta(minutes=count - n)}
+            for n in range(count)
+        ])
+        await session.commit()
+
+
+async def _claim(session_maker, limit=None, request_type="export"):
+    async with session_maker() as session:
+        return await claim_request(session, request_type, LEASE, limit=limit)
+
+
+async def test_claims_take_the_oldest_due_request_once(session_maker, user):
+    await _pending(session_maker, user.id, 3)
+
+    claimed = [await _claim(session_maker) for _ in range(4)]
+
+    assert claimed[3] is None
+    assert [c.requested_at for c in claimed[:3]] == sorted(c.requested_at for c in claimed[:3])
+    assert {c.attempts for c in claimed[:3]} == {1}
+
+
+async def test_concurrent_capped_claims_stay_within_the_limit(session_maker, user):
+    await _pending(session_maker, user.id, 10)
+    await _pending(session_maker, user.id, 1, request_type="delete")
+
+    claimed = await asyncio.gather(*(_claim(session_maker, limit=3) for _ in range(8)))
+
+    assert len([c for c in claimed if c is not None]) == 3
+    # The cap is per type
+    assert await _claim(session_maker, limit=3, request_type="delete") is not None
@@ -0,0 +1,40 @@
+"""Medication dictionary: index lookups and loading it on demand."""
+import pytest
+
+from app.services import drug_dictionary
+from app.services.drug_dictionary import load_drug_dictionary, match_medication
+
+EXTRACT = """code,name
+MET500,Metformin 500mg tablets
+MET850,Metformin 850mg tablets
+LIS10,Lisinopril 10mg tablets
+"""
+
+
+@pytest.fixture
+def configured(tmp_path, monkeypatch):
+    """Point the settings at an extract in ``tmp_path``; returns its path, not yet written."""
+    source = tmp_path / "dictionary.csv"
+    monkeypatch.setattr(drug_dictionary.settings, "drug_dictionary_path", str(source))
+    monkeypatch.setattr(drug_dictionary.settings, "drug_index_path", str(tmp_path / "dictionary.idx"))
+    monkeypatch.setattr(drug_dictionary, "_dictionary", None)
+    return source
+
+
+async def test_search_and_match(configured):
+    configured.write_text(EXTRACT)
+    dictionary = await load_drug_dictionary()
+
+    assert [e.code for e in dictionary.search("metf")] == ["MET500", "MET850"]
+    assert [e.code for e in dictionary.search("lisnopril")] == ["LIS10"]
+    assert (await match_medication("anything", "LIS10")).name == "Lisinopril 10mg tablets"
+    assert (await match_medication("metformin 850MG tablets")).code == "MET850"
+
+
+async def test_a_missing_dictionary_is_not_cached(configured):
+    assert await load_drug_dictionary() is None
+    assert await match_medication("Metformin 500mg tablets") is None
+
+    configured.write_text(EXTRACT)
+    assert (await match_medication("Metformin 500mg tablets")).code == "MET500"
+    assert await load_drug_dictionary() is drug_dictionary.get_drug_dictionary()
@@ -0,0 +1,75 @@
+"""Inbox thread listing: one head per thread, keyset pages, unread counts."""
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app.core.encryption import field_encryption
+from app.models.message import Message
+from app.services.inbox import list_threads
+
+START = datetime(2026, 3, 1, 9, 0)
+
+
+async def _message(
+    session, user_id, minutes, subject, thread_id=None, direction="inbound", read=False, message_id=None
+) -> uuid.UUID:
+    message_id = message_id or uuid.uuid4()
+    created_at = START + timedelta(minutes=minutes)
+    await session.execute(insert(Message).values(
+        id=message_id,
+        user_id=user_id,
+        direction=direction,
+        subject_encrypted=field_encryption.encrypt(subject),
+        body_encrypted=field_encryption.encrypt("body"),
+        thread_id=thread_id,
+        read_at=created_at if read else None,
+        created_at=created_at
+    ))
+    return message_id
+
+
+async def test_threads_page_by_latest_activity(session_maker, user, count_queries):
+    async with session_maker() as session:
+        expected = []
+        for n in range(5):
+            root = uuid.uuid4()
+            await _message(session, user.id, n, f"Thread {n}", thread_id=root, message_id=root)
+            # Clinic replies: the first is read, the rest are not
+            for reply in range(n):
+                await _message(
+                    session, user.id, 10 * n + reply + 10, f"Re: Thread {n}", thread_id=root,
+                    direction="outbound", read=reply == 0
+                )
+            expected.append((f"Thread {n}", max(n - 1, 0)))
+
+        # Stored before threads were recorded: the root has no thread_id, its reply does
+        legacy = await _message(session, user.id, -60, "Legacy")
+        await _message(session, user.id, 200, "Re: Legacy", thread_id=legacy, direction="outbound")
+        await session.commit()
+
+    # Latest activity first: the legacy thread's reply is the newest message
+    expected = [("Legacy", 1)] + expected[4:0:-1] + [expected[0]]
+
+    seen = []
+    cursor = None
+    async with session_maker() as session:
+        while True:
+            with count_queries() as queries:
+                threads, cursor = await list_threads(session, user.id, limit=2, cursor=cursor)
+            assert len(queries) == 1, queries
+            seen += [(t.subject, t.unread_count) for t in threads]
+            if cursor is None:
+                break
+
+    assert seen == expected
+
+
+async def test_other_users_threads_are_not_listed(session_maker, user):
+    other = uuid.uuid4()
+    async with session_maker() as session:
+        await _message(session, user.id, 0, "Mine")
+        await session.commit()
+        threads, cursor = await list_threads(session, other)
+
+    assert (threads, cursor) == ([], None)
@@ -0,0 +1,95 @@
+"""Interaction screening: stored warnings after adds and rescreens."""
+import uuid
+
+import pytest
+from sqlalchemy import insert, select
+
+from app.models.medication import PatientMedication
+from app.services.interactions import InteractionIndex, rescreen_patient, screen_added
+
+DATASET = """code_a,code_b,severity,description
+WARF,ASPI,major,Bleeding risk
+WARF,SIMV,moderate,Raised INR
+ASPI,IBUP,minor,Reduced antiplatelet effect
+"""
+
+
+@pytest.fixture
+def index(tmp_path) -> InteractionIndex:
+    path = tmp_path / "interactions.csv"
+    path.write_text(DATASET)
+    return InteractionIndex.from_file(str(path))
+
+
+async def _add(session_maker, user_id, code, name, is_active=True, warnings=None) -> uuid.UUID:
+    medication_id = uuid.uuid4()
+    async with session_maker() as session:
+        await session.execute(insert(PatientMedication).values(
+            id=medication_id,
+            user_id=user_id,
+            medication_name=name,
+            medication_code=code,
+            is_active=is_active,
+            interaction_warnings=warnings,
+            synced_from_clinic=False
+        ))
+        await session.commit()
+    return medication_id
+
+
+async def _stored(session_maker, user_id) -> dict[str, list]:
+    async with session_maker() as session:
+        result = await session.execute(select(PatientMedication).where(PatientMedication.user_id == user_id))
+        return {m.medication_name: m.interaction_warnings or [] for m in result.scalars()}
+
+
+async def test_rescreen_clears_warnings_of_inactive_medications(session_maker, user, index):
+    await _add(session_maker, user.id, "WARF", "Warfarin")
+    stale = [{"medication_code": "WARF", "medication_name": "Warfarin", "severity": "major", "description": ""}]
+    await _add(session_maker, user.id, "ASPI", "Aspirin", is_active=False, warnings=stale)
+
+    async with session_maker() as session:
+        current = await rescreen_patient(session, user.id, index)
+        await session.commit()
+
+    assert list(current.values()) == [[]]
+    assert await _stored(session_maker, user.id) == {"Warfarin": [], "Aspirin": []}
+
+
+async def test_screen_added_matches_a_full_rescreen(session_maker, user, index, count_queries):
+    await _add(session_maker, user.id, "ASPI", "Aspirin")
+    await _add(session_maker, user.id, "SIMV", "Simvastatin")
+    await _add(session_maker, user.id, "IBUP", "Ibuprofen")
+    await _add(session_maker, user.id, "PARA", "Paracetamol")
+    await _add(session_maker, user.id, "SIMV", "Old simvastatin", is_active=False)
+    async with session_maker() as session:
+        await rescreen_patient(session, user.id, index)
+        await session.commit()
+    warfarin_id = await _add(session_maker, user.id, "WARF", "Warfarin")
+
+    with count_queries() as queries:
+        async with session_maker() as session:
+            warnings = await screen_added(session, user.id, warfarin_id, "WARF", "Warfarin", index)
+            await session.commit()
+
+    # One SELECT and one executemany UPDATE, whatever the number of medications
+    assert len(queries) == 2, queries
+    assert [w["medication_name"] for w in warnings] == ["Aspirin", "Simvastatin"]
+    incremental = await _stored(session_maker, user.id)
+
+    async with session_maker() as session:
+        await rescreen_patient(session, user.id, index)
+        await session.commit()
+    assert incremental == await _stored(session_maker, user.id)
+    assert [w["medication_name"] for w in incremental["Aspirin"]] == ["Warfarin", "Ibuprofen"]
+
+
+async def test_screen_added_without_known_interactions_runs_no_query(session_maker, user, index, count_queries):
+    await _add(session_maker, user.id, "WARF", "Warfarin")
+    paracetamol_id = await _add(session_maker, user.id, "PARA", "Paracetamol")
+
+    with count_queries() as queries:
+        async with session_maker() as session:
+            assert await screen_added(session, user.id, paracetamol_id, "PARA", "Paracetamol", index) == []
+
+    assert len(queries) == 0, queries
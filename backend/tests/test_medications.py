@@ -0,0 +1,199 @@
+"""Medication routes: ownership checks and the statements each write costs."""
+import uuid
+
+import pytest
+from sqlalchemy import insert
+
+from app.core.encryption import field_encryption
+from app.models.medication import PatientMedication
+from app.models.user import User
+from app.services import drug_dictionary, interactions
+from app.services.interactions import InteractionIndex
+
+API = "/api/v1/medications"
+
+DICTIONARY = """code,name
+WARF,Warfarin
+ASPI,Aspirin
+PARA,Paracetamol
+"""
+
+INTERACTIONS = """code_a,code_b,severity,description
+WARF,ASPI,major,Bleeding risk
+"""
+
+
+async def _add(session_maker, user_id, **values) -> uuid.UUID:
+    medication_id = uuid.uuid4()
+    async with session_maker() as session:
+        await session.execute(insert(PatientMedication).values(
+            id=medication_id,
+            user_id=user_id,
+            medication_name=values.pop("medication_name", "Metformin"),
+            synced_from_clinic=values.pop("synced_from_clinic", False),
+            **values
+        ))
+        await session.commit()
+    return medication_id
+
+
+@pytest.fixture
+async def other_user(session_maker) -> User:
+    user_id = uuid.uuid4()
+    async with session_maker() as session:
+        await session.execute(insert(User).values(
+            id=user_id,
+            email=f"{user_id.hex}@example.com",
+            password_hash="x",
+            first_name_encrypted=field_encryption.encrypt("Other"),
+            last_name_encrypted=field_encryption.encrypt("Patient"),
+            status="active"
+        ))
+        await session.commit()
+        return await session.get(User, user_id)
+
+
+@pytest.fixture
+def screening(tmp_path, monkeypatch):
+    """Configure a medication dictionary and an interaction dataset."""
+    (tmp_path / "dictionary.csv").write_text(DICTIONARY)
+    (tmp_path / "interactions.csv").write_text(INTERACTIONS)
+    monkeypatch.setattr(drug_dictionary.settings, "drug_dictionary_path", str(tmp_path / "dictionary.csv"))
+    monkeypatch.setattr(drug_dictionary.settings, "drug_index_path", str(tmp_path / "dictionary.idx"))
+    monkeypatch.setattr(drug_dictionary, "_dictionary", None)
+    index = InteractionIndex.from_file(str(tmp_path / "interactions.csv"))
+    monkeypatch.setattr(interactions, "get_interaction_index", lambda: index)
+
+
+async def test_add_is_one_insert(client, count_queries):
+    with count_queries() as queries:
+        response = await client.post(API, json={"medication_name": "Metformin", "instructions": "With food"})
+
+    assert response.status_code == 201
+    assert response.json()["instructions"] == "With food"
+    assert len(queries) == 1, queries
+
+
+async def test_add_without_interactions_is_one_insert(client, screening, count_queries):
+    await client.post(API, json={"medication_name": "Warfarin"})
+
+    with count_queries() as queries:
+        response = await client.post(API, json={"medication_name": "Paracetamol"})
+
+    assert response.status_code == 201
+    assert response.json()["interaction_warnings"] == []
+    assert len(queries) == 1, queries
+
+
+async def test_add_with_interactions_is_three_statements(client, session_maker, user, screening, count_queries):
+    for n in range(20):
+        await _add(session_maker, user.id, medication_name=f"Other {n}", medication_code=f"OTHER{n}")
+    await client.post(API, json={"medication_name": "Warfarin"})
+
+    with count_queries() as queries:
+        response = await client.post(API, json={"medication_name": "Aspirin"})
+
+    # INSERT, one SELECT of the patient's coded medications, one UPDATE for both sides
+    assert response.status_code == 201
+    assert [w["medication_code"] for w in response.json()["interaction_warnings"]] == ["WARF"]
+    assert len(queries) == 3, queries
+
+
+async def test_stopping_a_medication_rescreens_in_three_statements(client, screening, count_queries):
+    await client.post(API, json={"medication_name": "Warfarin"})
+    aspirin = (await client.post(API, json={"medication_name": "Aspirin"})).json()
+
+    with count_queries() as queries:
+        response = await client.put(f"{API}/{aspirin['id']}", json={"is_active": False})
+
+    assert response.status_code == 200
+    assert response.json()["interaction_warnings"] == []
+    assert len(queries) == 3, queries
+
+
+async def test_delete_with_interactions_is_three_statements(client, screening, count_queries):
+    await client.post(API, json={"medication_name": "Warfarin"})
+    aspirin = (await client.post(API, json={"medication_name": "Aspirin"})).json()
+
+    with count_queries() as queries:
+        response = await client.delete(f"{API}/{aspirin['id']}")
+
+    assert response.status_code == 204
+    assert len(queries) == 3, queries
+
+
+async def test_update_is_one_update(client, session_maker, user, count_queries):
+    medication_id = await _add(session_maker, user.id)
+
+    with count_queries() as queries:
+        response = await client.put(f"{API}/{medication_id}", json={"dosage": "500mg"})
+
+    assert response.status_code == 200
+    assert response.json()["dosage"] == "500mg"
+    assert len(queries) == 1, queries
+
+
+async def test_update_of_another_users_medication_is_not_found(client, session_maker, other_user, count_queries):
+    medication_id = await _add(session_maker, other_user.id)
+
+    with count_queries() as queries:
+        response = await client.put(f"{API}/{medication_id}", json={"dosage": "500mg"})
+
+    assert response.status_code == 404
+    assert len(queries) == 1, queries
+
+
+async def test_delete_is_one_delete(client, session_maker, user, count_queries):
+    medication_id = await _add(session_maker, user.id)
+
+    with count_queries() as queries:
+        response = await client.delete(f"{API}/{medication_id}")
+
+    assert response.status_code == 204
+    assert len(queries) == 1, queries
+    assert (await client.get(f"{API}/{medication_id}")).status_code == 404
+
+
+async def test_delete_of_clinic_medication_is_refused(client, session_maker, user, count_queries):
+    medication_id = await _add(session_maker, user.id, synced_from_clinic=True)
+
+    with count_queries() as queries:
+        response = await client.delete(f"{API}/{medication_id}")
+
+    # The follow-up lookup only runs on the failure path
+    assert response.status_code == 400
+    assert len(queries) == 2, queries
+
+
+async def test_delete_of_another_users_medication_is_not_found(client, session_maker, other_user):
+    medication_id = await _add(session_maker, other_user.id)
+
+    response = await client.delete(f"{API}/{medication_id}")
+
+    assert response.status_code == 404
+    async with session_maker() as session:
+        assert await session.get(PatientMedication, medication_id) is not None
+
+
+@pytest.mark.parametrize("outcome", ["taken", "skipped"])
+async def test_adherence_log_is_one_insert(client, session_maker, user, count_queries, outcome):
+    medication_id = await _add(session_maker, user.id)
+
+    with count_queries() as queries:
+        response = await client.post(f"{API}/{medication_id}/{outcome}", json={})
+
+    assert response.status_code == 200
+    assert response.json()["skipped"] is (outcome == "skipped")
+    assert len(queries) == 1, queries
+
+
+async def test_adherence_log_for_another_users_medication_is_not_found(
+    client, session_maker, other_user, count_queries
+):
+    medication_id = await _add(session_maker, other_user.id)
+
+    with count_queries() as queries:
+        response = await client.post(f"{API}/{medication_id}/taken", json={})
+
+    assert response.status_code == 404
+    assert len(queries) == 1, queries
@@ -0,0 +1,40 @@
+"""Message attachments through the API, stored in an in-process S3 stand-in."""
+import pytest
+
+from app.api.v1 import messages
+from app.services.blob_store import BlobStore
+
+API = "/api/v1/messages"
+
+
+@pytest.fixture
+def blob_storage(storage, monkeypatch):
+    monkeypatch.setattr(messages, "blob_store", BlobStore(storage))
+    monkeypatch.setattr(messages, "ObjectStorage", lambda: storage)
+    return storage
+
+
+async def test_upload_renders_the_attachment_and_dedupes(client, blob_storage, s3):
+    message = (await client.post(f"{API}/", json={"subject": "Results", "body": "See attached"})).json()
+    content = b"%PDF-1.7 " + b"x" * 5000
+
+    uploaded = []
+    for name in ("scan.pdf", "scan-again.pdf"):
+        response = await client.post(
+            f"{API}/{message['id']}/attachments",
+            files={"file": (name, content, "application/pdf")},
+        )
+        assert response.status_code == 201
+        uploaded.append(response.json())
+
+    assert [(a["file_name"], a["file_type"], a["file_size"]) for a in uploaded] == [
+        ("scan.pdf", "application/pdf", len(content)),
+        ("scan-again.pdf", "application/pdf", len(content)),
+    ]
+    assert set(uploaded[0]) == {"id", "file_name", "file_type", "file_size", "created_at"}
+    # Identical content is stored once
+    assert s3.list_objects_v2(Bucket=blob_storage.bucket)["KeyCount"] == 1
+
+    download = await client.get(f"{API}/{message['id']}/attachments/{uploaded[1]['id']}")
+    assert download.status_code == 200
+    assert download.content == content
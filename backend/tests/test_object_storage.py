@@ -0,0 +1,79 @@
+"""Encrypted object storage round trips against an in-process S3 stand-in (moto)."""
+import os
+from typing import AsyncIterator
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from app.core.streaming_encryption import DEFAULT_SEGMENT_SIZE
+from app.services.object_storage import MIN_PART_SIZE, ObjectStorage, UploadTooLarge
+
+
+async def _chunks(data: bytes, size: int = 100_000) -> AsyncIterator[bytes]:
+    # Chunk size deliberately unrelated to the segment and part sizes
+    for offset in range(0, len(data), size):
+        yield data[offset:offset + size]
+
+
+async def _read(storage: ObjectStorage, key: str, size: int, start: int = 0, end=None, owner_key=None) -> bytes:
+    return b"".join([
+        chunk async for chunk in storage.read_decrypted(key, size, start, end, owner_key=owner_key)
+    ])
+
+
+async def test_small_upload_is_a_single_put(storage, s3):
+    data = os.urandom(3 * DEFAULT_SEGMENT_SIZE + 17)
+
+    stored = await storage.upload_encrypted("small", _chunks(data))
+
+    assert (stored.plaintext_size, stored.parts) == (len(data), 1)
+    assert s3.head_object(Bucket=storage.bucket, Key="small")["ContentLength"] == stored.stored_size
+    assert await _read(storage, "small", len(data)) == data
+
+
+async def test_multipart_upload_round_trips(storage, s3):
+    data = os.urandom(2 * MIN_PART_SIZE + 123_457)
+    owner_key = os.urandom(32)
+
+    stored = await storage.upload_encrypted("large", _chunks(data), owner_key=owner_key)
+
+    assert stored.parts == 3
+    head = s3.head_object(Bucket=storage.bucket, Key="large")
+    assert head["ContentLength"] == stored.stored_size
+    assert head["ETag"].strip('"').endswith("-3")
+    assert data[:4096] not in s3.get_object(Bucket=storage.bucket, Key="large")["Body"].read()
+    assert await _read(storage, "large", len(data), owner_key=owner_key) == data
+
+
+@pytest.mark.parametrize("start, end", [
+    (0, 0),
+    (DEFAULT_SEGMENT_SIZE - 1, DEFAULT_SEGMENT_SIZE),  # straddles a segment boundary
+    (MIN_PART_SIZE - 10, MIN_PART_SIZE + 10),  # straddles a part boundary
+    (12_345, 3 * DEFAULT_SEGMENT_SIZE + 99),
+    (-1, None),  # last byte, in the short final segment
+])
+async def test_ranged_reads_decrypt_only_the_range(storage, start, end):
+    data = os.urandom(MIN_PART_SIZE + 70_001)
+    await storage.upload_encrypted("ranged", _chunks(data))
+    start = start % len(data)
+    end = len(data) - 1 if end is None else end
+
+    assert await _read(storage, "ranged", len(data), start, end) == data[start:end + 1]
+
+
+async def test_reading_with_another_owner_key_fails(storage):
+    data = os.urandom(DEFAULT_SEGMENT_SIZE + 1)
+    await storage.upload_encrypted("owned", _chunks(data), owner_key=os.urandom(32))
+
+    with pytest.raises(InvalidTag):
+        await _read(storage, "owned", len(data), owner_key=os.urandom(32))
+
+
+async def test_oversized_upload_is_aborted(storage, s3):
+    data = os.urandom(MIN_PART_SIZE + 500_000)
+
+    with pytest.raises(UploadTooLarge):
+        await storage.upload_encrypted("too-large", _chunks(data), max_size=MIN_PART_SIZE + 100_000)
+
+    assert "Uploads" not in s3.list_multipart_uploads(Bucket=storage.bucket)
+    assert "Contents" not in s3.list_objects_v2(Bucket=storage.bucket, Prefix="too-large")